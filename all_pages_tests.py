@@ -0,0 +1,54 @@
+import unittest
+from offline import OfflineTestCase
+
+
+class AllPagesTestCase(OfflineTestCase):
+    """
+    page=all: the pages of a set merged into a single one
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/users/" + self.test_username + "/inventory"
+
+    def test_merged_pages(self):
+        pages = [self.getJson(self.url + "?page={}".format(page))[1] for page in (1, 2, 3)]
+        status, merged = self.getJson(self.url + "?page=all")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(pages[0]["total_pages"], 3)
+        self.assertEqual(merged["items"], [card for page in pages for card in page["items"]])
+
+    def test_pagination_output(self):
+        status, merged = self.getJson(self.url + "?page=all")
+
+        self.assertEqual({k: v for k, v in merged.items() if k != "items"},
+                         {"count": 250, "page": 1, "items_per_page": 300, "total_pages": 1})
+
+    def test_cards_are_extended(self):
+        status, merged = self.getJson(self.url + "?page=all&order=desc")
+
+        self.assertEqual(status, 200)
+        self.assertTrue(all("cmc" in card for card in merged["items"]))
+        # Each page was crawled once with the requested order
+        set_urls = [url for url in self.getUpstreamUrls() if "/sets/" in url]
+        self.assertEqual(sorted(set_urls), ["https://deckbox.org/sets/590740?p={}&s=n&o=d".format(page)
+                                            for page in (1, 2, 3)])
+
+    def test_deck(self):
+        url = "/api/users/" + self.test_username + "/sets/608751"
+
+        self.assertEqual(self.getJson(url + "?page=all"), self.getJson(url))
+
+    def test_unknown_set(self):
+        status, error = self.getJson("/api/users/" + self.test_username + "/sets/unknown?page=all")
+
+        self.assertEqual(status, 404)
+        self.assertEqual(error, {"status": "error", "description": "The user doesn't have the specified set."})
+
+    def test_invalid_page(self):
+        self.assertEqual(self.get(self.url + "?page=last").status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,98 @@
-import os, time, urllib, functools
-from flask import Flask, render_template, jsonify, redirect, url_for, request, json
+import os, time, urllib, functools, hashlib, collections.abc
+from flask import Flask, Response, render_template, jsonify, redirect, url_for, request, json, g
 from flask_restful.reqparse import Argument
+from flask_restful import inputs
 from flask_restful import Resource, Api
 from flask_sslify import SSLify
 from deckbox_crawler import DeckboxCrawler
-from decorators import marshal_with, parse_request, paginate_deckbox_results
-from schemas import CardSchema, UserSchema, SetSchema, DeckboxCardSchema
+from async_crawler import AsyncDeckboxCrawler
+from page_cache import PageCache
+from set_list_cache import SetListCache
+from singleflight import SingleFlight
+from card_cache import CardMetaCache
+from card_record import extend_card
+from card_index import CardIndex
+from name_index import NameIndexLoader
+from decorators import marshal_with, parse_request, paginate_deckbox_results, stream_deckbox_results, \
+    is_stream_request, is_error, page_number
+from schemas import CardSchema, UserSchema, SetSchema, DeckboxCardSchema, SetChangesSchema, TradeMatchSchema, \
+    CollectionStatsSchema
+from serializers import compile_schema
+from compression import ResponseCompressor
+from json_encoder import json_response
+from conditional import ValidatorCache, get_etag, is_not_modified
+from collection_sync import CollectionSnapshots
+from refresh_queue import DemandTracker
+from trade_index import TradeIndex, TRADE_LISTS, TRADE_INDEX_MAX_AGE
+from collection_stats import CollectionStatsCache, get_collection_stats
+from metrics import metrics
 import redis
 import dpath.util
-import scrython
+import scryfall
+import async_crawler
+import batch
+import card_cache
 
 app = Flask(__name__)
 sslify = SSLify(app, permanent=True)
 restapi = Api(app, '/api', catch_all_404s=True)
 
 r = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+DeckboxCrawler.page_cache = PageCache(r)
+DeckboxCrawler.set_list_cache = SetListCache(r)
+metrics.redis_client = r
+single_flight = SingleFlight(r)
+card_meta_cache = CardMetaCache(r)
+card_index = CardIndex.open()
+compressor = ResponseCompressor(r)
+validator_cache = ValidatorCache(r)
+collection_snapshots = CollectionSnapshots(r)
+demand_tracker = DemandTracker(r)
+trade_index = TradeIndex(r)
+collection_stats_cache = CollectionStatsCache(r)
+
+
+# Only built from the bulk data: an index of the card cache misses the cards nobody
+# looked up yet, so it could not answer a search alone
+name_index = NameIndexLoader(card_index.iter_all, int(os.environ.get("NAME_INDEX_MAX_AGE", 3600))) \
+    if card_index else None
+
+
+def get_cards_meta(names):
+    """
+    Get card metadata from the local bulk data index first, then from the Redis
+    cache and finally from Scryfall
+    :return: dict of name to card metadata, None for cards Scryfall doesn't know
+    """
+    names = set(names)
+    with metrics.timer("card_index"):
+        cards_meta = card_index.get_many(names) if card_index else {}
+    metrics.inc("card_meta_requests_total", len(cards_meta), source="index")
+
+    cards_not_indexed = [c for c in names if c not in cards_meta]
+    if cards_not_indexed:
+        with metrics.timer("card_cache"):
+            cards_meta.update(card_meta_cache.get_many(cards_not_indexed))
+
+    cards_not_cached = [c for c in names if c not in cards_meta]
+    metrics.inc("card_meta_requests_total", len(cards_not_indexed) - len(cards_not_cached), source="cache")
+    if cards_not_cached:
+        batch_key = "\n".join(sorted(cards_not_cached)).encode("utf-8")
+        with metrics.timer("scryfall"):
+            response = single_flight.do(
+                "scryfall:" + hashlib.sha1(batch_key).hexdigest(),
+                lambda: [card_cache.compact(x) for x in scryfall.resolve_names(cards_not_cached)]
+            )
+        resolved = card_meta_cache.set_many(response)
+        cards_meta.update({
+            c: resolved.get(card_cache.normalize_name(c)) for c in cards_not_cached
+        })
+        missing = [c for c in cards_not_cached if cards_meta[c] is None]
+        card_meta_cache.set_missing(missing)
+        metrics.inc("card_meta_requests_total", len(cards_not_cached) - len(missing), source="scryfall")
+        metrics.inc("card_meta_requests_total", len(missing), source="missing")
+
+    return cards_meta
 
 
 def extend_cards(*args, **kwargs):
@@ -26,42 +104,160 @@ def extend_cards(*args, **kwargs):
         @functools.wraps(f)
         def inner(*fargs, **fkwargs):
             rv = f(*fargs, **fkwargs)
-            for path in args:
-                cards_list = dpath.util.get(rv, path, separator='.')
-                cards = {x['name']: x for x in cards_list}
+            if isinstance(rv, Response):
+                return rv
 
-                if not cards:
-                    continue
+            # Streamed results are an iterator of pages, each page is extended when it is consumed
+            if isinstance(rv, collections.abc.Iterator):
+                return (extend_cards_paths(page, args) for page in rv)
 
-                cards_meta = {x['name']: x for x in [json.loads(x) for x in r.mget(cards) if x]}
-                cards_not_cached = set(list(cards.keys())) - set(list(cards_meta.keys()))
+            return extend_cards_paths(rv, args)
 
-                if cards_not_cached:
-                    query = "name:/{}/".format("/ or name:/".join([c for c in cards if c in cards_not_cached]))
-                    time.sleep(0.1)  # required by scryfall policies
-                    response = scrython.cards.Search(q=query).data()
-                    print('LOG - get card meta q=' + query)
-                    cards_meta.update({x['name'].split(" //")[0]: x for x in response})
+        return inner
 
-                    r.mset({
-                        x['name']: json.dumps(x) for x in cards_meta.values()
-                    })
+    return decorator
 
-                cards_inflated = []
-                for c in cards_list:
-                    name = c['name']
-                    cards_inflated.append(
-                        {**cards[name], **cards_meta[name]}
-                    )
-                cards = cards_inflated
 
-                dpath.util.set(rv, path, cards, separator='.')
+def check_not_modified(f):
+    """
+    Decorator answering 304 Not Modified when the data didn't change, before serializing it.
+    Put it outside extend_cards: the ETag then hashes the card metadata of the response too.
+    """
 
+    @functools.wraps(f)
+    def inner(*fargs, **fkwargs):
+        rv = f(*fargs, **fkwargs)
+        if isinstance(rv, collections.abc.Iterator) or is_error(rv):
             return rv
 
-        return inner
+        etag = get_etag(rv, request.full_path)
+        last_modified = validator_cache.get_last_modified(request.full_path, etag)
+        g.validators = (etag, last_modified)
 
-    return decorator
+        if is_not_modified(request, etag, last_modified):
+            return Response(status=304)
+
+        return rv
+
+    return inner
+
+
+def extend_cards_paths(rv, paths):
+    if is_error(rv):
+        return rv
+
+    cards_lists = [dpath.util.get(rv, path, separator='.') for path in paths]
+
+    for path, cards_inflated in zip(paths, extend_cards_lists(cards_lists)):
+        dpath.util.set(rv, path, cards_inflated, separator='.')
+
+    return rv
+
+
+def extend_cards_lists(cards_lists):
+    """
+    Add card metadata to several lists of cards, with a single lookup for all of their names
+    :return: the extended lists, in the same order
+    """
+    names = {x['name'] for cards_list in cards_lists for x in cards_list}
+    cards_meta = get_cards_meta(names) if names else {}
+
+    # Cards Scryfall does not know only keep their Deckbox data
+    return [[extend_card(c, cards_meta[c['name']]) for c in cards_list] for cards_list in cards_lists]
+
+
+def get_user_set_cards(username, set_id, page=1, sort_by='name', order='asc', stream=False):
+    """
+    Cards of a page of a user set, page "all" merges all of its pages
+    :param stream: return an iterator of cards pages instead
+    """
+    if page == "all":
+        deckbox_crawler = AsyncDeckboxCrawler(username)
+        if stream:
+            return async_crawler.iterate(deckbox_crawler.iterUserSetAllPages(set_id, sort_by, order))
+
+        user_set = async_crawler.run(deckbox_crawler.getUserSetAllPages(set_id, sort_by, order))
+        index_trade_list(username, set_id, user_set)
+
+        return user_set
+
+    deckbox_crawler = DeckboxCrawler(username)
+    user_set = deckbox_crawler.getUserSetCards(set_id, page, sort_by, order)
+    index_trade_list(username, set_id, user_set)
+
+    return iter([user_set]) if stream else user_set
+
+
+def index_trade_list(username, set_id, user_set):
+    """
+    Update the trade matching index with a crawled tradelist or wishlist, when it has all of its cards
+    """
+    if set_id in TRADE_LISTS and "cards" in user_set and user_set.get("total_pages") == 1:
+        trade_index.update(username, set_id, user_set["cards"])
+
+
+def get_user_set_stats(username, set_id):
+    """
+    Statistics of all the cards of a user set, the mainboard and sideboard of a deck
+    """
+    # The first page is crawled once, then the other ones if there are more
+    user_set = get_user_set_cards(username, set_id, "all")
+    if is_error(user_set):
+        return user_set
+
+    rows = user_set.get("cards", []) + [card for board in ("mainboard", "sideboard")
+                                        for card in user_set.get(board, {}).get("cards", [])]
+    cards_meta = get_cards_meta({row["name"] for row in rows}) if rows else {}
+    stats = collection_stats_cache.get(rows, cards_meta, lambda: get_collection_stats(rows, cards_meta))
+
+    return {"id": set_id, "name": user_set.get("name", set_id), **stats}
+
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+
+# Registered first so that it runs after the other after_request functions
+@app.after_request
+def end_request_metrics(response):
+    metrics.end_request(request.endpoint, response.status_code)
+
+    return response
+
+
+@app.after_request
+def add_validators(response):
+    validators = g.get("validators")
+    if validators and response.status_code in (200, 304):
+        etag, last_modified = validators
+        # Weak, the same tag is sent for the compressed and uncompressed bodies
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+    return response
+
+
+@app.after_request
+def track_demand(response):
+    """
+    Count the requests of each user and set, the refresh worker keeps the most requested ones warm
+    """
+    view_args = request.view_args or {}
+    if "username" in view_args and response.status_code in (200, 304):
+        set_id = view_args.get("set_id") or view_args.get("set_name")
+        if set_id is None and request.path.endswith(("/inventory", "/wishlist", "/tradelist")):
+            set_id = request.path.rsplit("/", 1)[1]
+        demand_tracker.hit(view_args["username"], set_id)
+
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    with metrics.timer("compress"):
+        return compressor.compress_response(response, request.accept_encodings)
 
 
 @app.route('/')
@@ -92,7 +288,15 @@ def status():
     except redis.ConnectionError as e:
         status['redis']['connection'] = repr(e)
 
-    return jsonify(status)
+    return json_response(status)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.enabled:
+        return Response("Metrics are disabled (METRICS_ENABLED=0).\n", status=404, mimetype="text/plain")
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 class ApiDoc(Resource):
@@ -101,7 +305,8 @@ class ApiDoc(Resource):
 
 
 class User(Resource):
-    @marshal_with(UserSchema())
+    @marshal_with(compile_schema(UserSchema()))
+    @check_not_modified
     def get(self, username):
         deckbox_crawler = DeckboxCrawler(username)
         user_profile = deckbox_crawler.getUserProfile()
@@ -114,7 +319,8 @@ class User(Resource):
 
 
 class UserFriend(Resource):
-    @marshal_with(UserSchema(many=True), pagination=True)
+    @marshal_with(compile_schema(UserSchema(many=True)), pagination=True)
+    @check_not_modified
     def get(self, username):
         deckbox_crawler = DeckboxCrawler(username)
         user_friends = deckbox_crawler.getUserFriends()
@@ -123,7 +329,8 @@ class UserFriend(Resource):
 
 
 class UserSetList(Resource):
-    @marshal_with(SetSchema(many=True), pagination=True)
+    @marshal_with(compile_schema(SetSchema(many=True)), pagination=True)
+    @check_not_modified
     def get(self, username):
         deckbox_crawler = DeckboxCrawler(username)
         user_sets = deckbox_crawler.getUserSets()
@@ -132,70 +339,193 @@ class UserSetList(Resource):
 
 
 class UserSet(Resource):
-    @marshal_with(SetSchema())
+    @marshal_with(compile_schema(SetSchema()))
+    @check_not_modified
     @extend_cards(
         'mainboard.cards',
         'sideboard.cards',
     )
     def get(self, username, set_id, page=1, sort_by='name', order='asc'):
-        deckbox_crawler = DeckboxCrawler(username)
-        user_set = deckbox_crawler.getUserSetCards(set_id, page, sort_by, order)
+        # The user page and the set page are crawled concurrently
+        deckbox_crawler = AsyncDeckboxCrawler(username)
+        user_set = async_crawler.run(deckbox_crawler.getUserSetCards(set_id, page, sort_by, order))
 
         return user_set
 
 
+class UserSetChanges(Resource):
+    @parse_request(
+        Argument('since', type=str, required=False, store_missing=False),
+    )
+    @marshal_with(compile_schema(SetChangesSchema()))
+    @extend_cards(
+        'added',
+        'changed',
+    )
+    def get(self, username, set_name, since=None):
+        def update_snapshot():
+            deckbox_crawler = AsyncDeckboxCrawler(username)
+            user_set = async_crawler.run(deckbox_crawler.getUserSetAllPages(set_name))
+            if "cards" not in user_set:
+                return user_set
+
+            index_trade_list(username, set_name, user_set)
+
+            return {"token": collection_snapshots.update(username, set_name, user_set["cards"])}
+
+        # Concurrent polls of the same collection crawl and diff it once
+        snapshot = single_flight.do("sync:" + username.lower() + ":" + set_name, update_snapshot)
+        if "token" not in snapshot:
+            return snapshot
+
+        return collection_snapshots.get_changes(username, set_name, since)
+
+
+class UserSetStats(Resource):
+    @marshal_with(compile_schema(CollectionStatsSchema()))
+    @check_not_modified
+    def get(self, username, set_id):
+        return get_user_set_stats(username, set_id)
+
+
 class UserInventory(Resource):
     @parse_request(
-        Argument('page', type=int, default=1, required=False, store_missing=False),
+        Argument('page', type=page_number, default=1, required=False, store_missing=False),
         allow_ordering=True
     )
-    @marshal_with(DeckboxCardSchema(many=True), pagination=True, paginator=paginate_deckbox_results)
+    @marshal_with(compile_schema(DeckboxCardSchema(many=True)), pagination=True, paginator=paginate_deckbox_results,
+                  streamer=stream_deckbox_results)
+    @check_not_modified
     @extend_cards(
         'cards',
     )
     def get(self, username, page=1, sort_by='name', order='asc'):
-        deckbox_crawler = DeckboxCrawler(username)
-        user_inventory = deckbox_crawler.getUserSetCards("inventory", page, sort_by, order)
-
-        return user_inventory
+        return get_user_set_cards(username, "inventory", page, sort_by, order, stream=is_stream_request())
 
 
 class UserWishlist(Resource):
     @parse_request(
-        Argument('page', type=int, default=1, required=False, store_missing=False),
+        Argument('page', type=page_number, default=1, required=False, store_missing=False),
         allow_ordering=True
     )
-    @marshal_with(DeckboxCardSchema(many=True), pagination=True, paginator=paginate_deckbox_results)
+    @marshal_with(compile_schema(DeckboxCardSchema(many=True)), pagination=True, paginator=paginate_deckbox_results,
+                  streamer=stream_deckbox_results)
+    @check_not_modified
     @extend_cards(
         'cards',
     )
     def get(self, username, page=1, sort_by='name', order='asc'):
-        deckbox_crawler = DeckboxCrawler(username)
-        user_wishlist = deckbox_crawler.getUserSetCards("wishlist", page, sort_by, order)
-
-        return user_wishlist
+        return get_user_set_cards(username, "wishlist", page, sort_by, order, stream=is_stream_request())
 
 
 class UserTradelist(Resource):
     @parse_request(
-        Argument('page', type=int, default=1, required=False, store_missing=False),
+        Argument('page', type=page_number, default=1, required=False, store_missing=False),
         allow_ordering=True
     )
-    @marshal_with(DeckboxCardSchema(many=True), pagination=True, paginator=paginate_deckbox_results)
+    @marshal_with(compile_schema(DeckboxCardSchema(many=True)), pagination=True, paginator=paginate_deckbox_results,
+                  streamer=stream_deckbox_results)
+    @check_not_modified
     @extend_cards(
         'cards',
     )
     def get(self, username, page=1, sort_by='name', order='asc'):
-        deckbox_crawler = DeckboxCrawler(username)
-        user_tradelist = deckbox_crawler.getUserSetCards("tradelist", page, sort_by, order)
+        return get_user_set_cards(username, "tradelist", page, sort_by, order, stream=is_stream_request())
+
 
-        return user_tradelist
+class UserMatches(Resource):
+    @parse_request(
+        Argument('scope', type=str, choices=('all', 'friends'), default='all', required=False),
+        Argument('strict', type=inputs.boolean, default=False, required=False),
+    )
+    @marshal_with(compile_schema(TradeMatchSchema(many=True)), pagination=True)
+    def get(self, username, scope='all', strict=False):
+        # The lists of the user are crawled again if needed, the other users are matched as indexed
+        indexed_at = trade_index.get_indexed_at(username)
+        outdated = [set_name for set_name in TRADE_LISTS
+                    if time.time() - indexed_at.get(set_name, 0) > TRADE_INDEX_MAX_AGE]
+        if outdated:
+            items = [{"username": username, "set_id": set_name, "page": "all"} for set_name in outdated]
+            for set_name, result in zip(outdated, batch.crawl(items)):
+                index_trade_list(username, set_name, result)
+
+        users = None
+        if scope == 'friends':
+            users = {friend["username"].lower() for friend in DeckboxCrawler(username).getUserFriends()}
+
+        return trade_index.get_matches(username, users, strict)
+
+
+class Batch(Resource):
+    user_schema = compile_schema(UserSchema())
+    set_schema = compile_schema(SetSchema())
+    cards_schema = compile_schema(DeckboxCardSchema(many=True))
+
+    @parse_request(
+        Argument('users', type=batch.username, action='append', location='json', required=False, default=[]),
+        Argument('sets', type=batch.set_item, action='append', location='json', required=False, default=[]),
+    )
+    def post(self, users=(), sets=()):
+        # Items asked several times are crawled once
+        items = [{"username": username} for username in users] + sets
+        items = list(collections.OrderedDict((batch.get_item_key(item), item) for item in items).values())
+        if not items or len(items) > batch.BATCH_MAX_ITEMS:
+            return json_response({
+                "status": "error",
+                "description": "A batch must have between 1 and {} users and sets.".format(batch.BATCH_MAX_ITEMS)
+            }, 400)
+
+        results = batch.crawl(items)
+        for item, result in zip(items, results):
+            demand_tracker.hit(item["username"], item.get("set_id"))
+            if "set_id" in item:
+                index_trade_list(item["username"], item["set_id"], result)
+
+        # Cards of the whole batch are extended with a single card metadata lookup
+        containers = [container for result in results for container in self.get_cards_containers(result)]
+        for container, cards in zip(containers, extend_cards_lists([c["cards"] for c in containers])):
+            container["cards"] = cards
+
+        with metrics.timer("serialize"):
+            items = [self.serialize(item, result) for item, result in zip(items, results)]
+
+        return json_response({"items": items})
+
+    @staticmethod
+    def get_cards_containers(result):
+        if "cards" in result:
+            return [result]
+        elif "mainboard" in result:
+            return [result["mainboard"], result["sideboard"]]
+
+        return []
+
+    def serialize(self, item, result):
+        if is_error(result):
+            return {"request": item, "status": "error", "description": result["description"]}
+
+        if "set_id" not in item:
+            data = self.user_schema.dump(result)
+        elif "cards" in result:
+            data = paginate_deckbox_results(result, self.cards_schema.dump)
+        else:
+            data = self.set_schema.dump(result)
+
+        return {"request": item, "status": "ok", "result": data}
 
 
 class Card(Resource):
-    @marshal_with(CardSchema(many=True), pagination=True)
+    @marshal_with(compile_schema(CardSchema(many=True)), pagination=True)
     def get(self, cardname):
-        return scrython.cards.Search(q="name:/{}/".format(cardname)).data()
+        # Searched on Scryfall until the bulk data index is built
+        index = name_index.get() if name_index else None
+        if index is not None:
+            return index.search(cardname)
+
+        cards = scryfall.search("name:/{}/".format(cardname))
+        card_meta_cache.set_many(cards)
+
+        return cards
 
 
 restapi.add_resource(ApiDoc, '/')
@@ -206,7 +536,12 @@ restapi.add_resource(UserInventory, '/users/<string:username>/inventory')
 restapi.add_resource(UserWishlist, '/users/<string:username>/wishlist')
 restapi.add_resource(UserTradelist, '/users/<string:username>/tradelist')
 restapi.add_resource(UserSet, '/users/<string:username>/sets/<set_id>')
+restapi.add_resource(UserSetChanges, '/users/<string:username>/<any(inventory, wishlist, tradelist):set_name>/changes')
+restapi.add_resource(UserMatches, '/users/<string:username>/matches')
+restapi.add_resource(UserSetStats, '/users/<string:username>/sets/<set_id>/stats',
+                      '/users/<string:username>/<any(inventory, wishlist, tradelist):set_id>/stats')
 restapi.add_resource(Card, '/cards/<path:cardname>')
+restapi.add_resource(Batch, '/batch')
 
 
 def getApiDocList():
@@ -0,0 +1,293 @@
+"""
+Asyncio variant of the Deckbox crawler: pages are downloaded concurrently with
+aiohttp, with a bounded number of requests in flight, and parsed by the same
+DeckboxCrawler code as the synchronous path.
+
+Flask views stay synchronous: coroutines run on an event loop owned by a
+background thread of the worker process, see run().
+"""
+import os, asyncio, threading, collections
+import aiohttp
+import http_client
+from deckbox_crawler import DeckboxCrawler
+from metrics import metrics
+from page_cache import PageDownloadError, get_body
+from set_list_cache import find_set
+
+ASYNC_CRAWLER_CONCURRENCY = int(os.environ.get("ASYNC_CRAWLER_CONCURRENCY", 8))
+ASYNC_CRAWLER_CONNECTIONS = int(os.environ.get("ASYNC_CRAWLER_CONNECTIONS", 20))
+
+SET_NOT_FOUND = {"status": "error", "description": "The user doesn't have the specified set."}
+
+# Download result with the attributes of a requests.Response the page cache reads
+DownloadedPage = collections.namedtuple("DownloadedPage", ("status_code", "headers", "text"))
+
+
+class AsyncRunner:
+    """
+    Event loop running forever in a daemon thread, with a persistent aiohttp session.
+    The loop is started lazily, so that each forked gunicorn worker gets its own.
+    """
+
+    def __init__(self, connections=ASYNC_CRAWLER_CONNECTIONS):
+        self._connections = connections
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._session = None
+
+    def get_loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._session = None
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+        return self._loop
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the background loop and wait for its result
+        """
+        # Stages running on the loop are not timed, the whole crawl is
+        with metrics.timer("crawl"):
+            return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result(timeout)
+
+    def get_session(self):
+        """
+        Must be called from the loop thread
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._connections, limit_per_host=self._connections)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers={"User-Agent": http_client.HTTP_USER_AGENT})
+
+        return self._session
+
+
+runner = AsyncRunner()
+
+
+def run(coro, timeout=None):
+    return runner.run(coro, timeout)
+
+
+def iterate(async_iterator, timeout=None):
+    """
+    Iterate over an async generator from synchronous code, items are produced on the background loop
+    """
+    async def next_item():
+        return await async_iterator.__anext__()
+
+    try:
+        while True:
+            try:
+                yield run(next_item(), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        run(async_iterator.aclose(), timeout)
+
+
+def run_blocking(fn, *args):
+    """
+    Run a blocking call (Redis...) in the default executor instead of the running loop
+    :return: future of its result
+    """
+    return asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+
+def get_timeout():
+    # aiohttp >= 3.3 takes a ClientTimeout, older versions a number of seconds
+    if hasattr(aiohttp, "ClientTimeout"):
+        return aiohttp.ClientTimeout(total=http_client.HTTP_TIMEOUT, connect=http_client.HTTP_CONNECT_TIMEOUT)
+
+    return http_client.HTTP_TIMEOUT
+
+
+class AsyncDeckboxCrawler:
+    """
+    :param username: Deckbox user whose pages are crawled
+    :param concurrency: maximum number of pages downloaded at the same time
+    """
+
+    def __init__(self, username, concurrency=ASYNC_CRAWLER_CONCURRENCY):
+        self._username = username
+        self._concurrency = concurrency
+        self._semaphore = None
+
+    async def getUserPage(self):
+        return await self.getPage(DeckboxCrawler.getUserUrl(self._username))
+
+    async def getUserSetCards(self, set_id, page=1, order_by='name', order='asc'):
+        """
+        Same result as DeckboxCrawler.getUserSetCards
+        """
+        pages = await self.getUserSetPages(set_id, [page], order_by, order)
+        if isinstance(pages, dict):
+            return pages
+
+        return pages[0]
+
+    async def getUserSetPages(self, set_id, pages, order_by='name', order='asc'):
+        """
+        Crawl several pages of a set concurrently
+        :return: list of cards pages in the order of pages, an error dict if the user doesn't have the set
+        """
+        set_object, set_pages = await self.getUserSet(set_id, pages, order_by, order)
+        if set_object == None:
+            return dict(SET_NOT_FOUND)
+
+        return set_pages
+
+    async def getUserSetAllPages(self, set_id, order_by='name', order='asc'):
+        """
+        Crawl the first page of a set, then all the other ones concurrently
+        :return: a single cards page with the cards of every page, decks are returned as is
+        """
+        set_object, set_pages = await self.getUserSet(set_id, [1], order_by, order)
+        if set_object == None:
+            return dict(SET_NOT_FOUND)
+
+        first_page = set_pages[0]
+        if "total_pages" not in first_page:
+            return first_page
+
+        set_pages += await self.getSetPages(set_id, set_object["id"], range(2, first_page["total_pages"] + 1),
+                                            order_by, order)
+        cards = [card for set_page in set_pages for card in set_page["cards"]]
+
+        return {
+            **first_page,
+            "cards": cards,
+            "count": len(cards),
+            "page": 1,
+            "total_pages": 1,
+        }
+
+    async def iterUserSetAllPages(self, set_id, order_by='name', order='asc'):
+        """
+        Crawl all the pages of a set like getUserSetAllPages,
+        yields them in order as soon as they are downloaded and parsed
+        """
+        set_object, set_pages = await self.getUserSet(set_id, [1], order_by, order)
+        if set_object == None:
+            yield dict(SET_NOT_FOUND)
+            return
+
+        tasks = [
+            asyncio.ensure_future(self.getSetPages(set_id, set_object["id"], [page], order_by, order))
+            for page in range(2, set_pages[0]["total_pages"] + 1)
+        ]
+        try:
+            yield set_pages[0]
+            for task in tasks:
+                set_page, = await task
+                yield set_page
+        finally:
+            # The client went away, stop crawling
+            for task in tasks:
+                task.cancel()
+
+    async def getUserSet(self, set_id, pages, order_by='name', order='asc'):
+        """
+        :return: (set, cards pages) tuple, set is None if the user doesn't have it
+        """
+        # Set found in the cached set list, the user page isn't needed
+        set_list_cache = DeckboxCrawler.set_list_cache
+        cached_sets = await run_blocking(set_list_cache.get, self._username) if set_list_cache else None
+        set_object = find_set(cached_sets, set_id) if cached_sets else None
+        if set_object is not None:
+            crawlers = await self.getPages([DeckboxCrawler.getSetUrl(set_object["id"], page, order_by, order)
+                                            for page in pages])
+            if crawlers[0].getPageType() != "unknown":
+                return set_object, [{"id": set_id, **crawler.getCardsFromPage()} for crawler in crawlers]
+
+            # The set was deleted since the set list was cached
+            await run_blocking(set_list_cache.delete, self._username)
+
+        # Set ids are known without the user page, both are fetched at the same time
+        if set_id.isdigit():
+            user, *set_pages = await self.getPages(
+                [DeckboxCrawler.getUserUrl(self._username)] +
+                [DeckboxCrawler.getSetUrl(set_id, page, order_by, order) for page in pages]
+            )
+            set_object = await run_blocking(user.getUserSets, set_id)
+            set_pages = [{"id": set_id, **crawler.getCardsFromPage()} for crawler in set_pages]
+        else:
+            user = await self.getUserPage()
+            set_object = await run_blocking(user.getUserSets, set_id)
+            set_pages = [] if set_object is None else await self.getSetPages(set_id, set_object["id"], pages,
+                                                                             order_by, order)
+
+        return set_object, set_pages
+
+    async def getSetPages(self, set_id, deckbox_set_id, pages, order_by='name', order='asc'):
+        crawlers = await self.getPages([DeckboxCrawler.getSetUrl(deckbox_set_id, page, order_by, order)
+                                        for page in pages])
+
+        return [{"id": set_id, **crawler.getCardsFromPage()} for crawler in crawlers]
+
+    async def getPages(self, page_urls):
+        """
+        :return: a DeckboxCrawler per url, in the same order
+        """
+        return await asyncio.gather(*[self.getPage(page_url) for page_url in page_urls])
+
+    async def getPage(self, page_url):
+        return DeckboxCrawler.fromPage(self._username, page_url, await self.fetchPage(page_url))
+
+    async def fetchPage(self, page_url):
+        page_cache = DeckboxCrawler.page_cache
+        try:
+            if not page_cache:
+                return get_body(page_url, DownloadedPage(*await self.downloadPage(page_url)))
+
+            # The page cache makes blocking Redis calls and waits for concurrent identical
+            # downloads (single flight), it runs in the default executor. Its downloads run on this loop
+            return await run_blocking(page_cache.get, page_url, self.getDownloader(asyncio.get_event_loop()))
+        except PageDownloadError as e:
+            return DeckboxCrawler.getNotFoundPage(e)
+
+    def getDownloader(self, loop):
+        """
+        :return: function downloading a page on the loop from another thread, with the
+        arguments and the result attributes of http_client.fetch the page cache uses
+        """
+        def download(page_url, headers=None):
+            future = asyncio.run_coroutine_threadsafe(self.downloadPage(page_url, headers), loop)
+
+            return DownloadedPage(*future.result())
+
+        return download
+
+    async def downloadPage(self, page_url, headers=None):
+        """
+        Download a page, retrying connection errors and 5xx responses with exponential backoff
+        :param headers: request headers (conditional requests of the page cache)
+        :return: (status, headers, body) tuple
+        """
+        if self._semaphore is None:
+            # Created here to be bound to the running loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        async with self._semaphore:
+            self.log("Get cards from url: " + page_url)
+
+            for retry in range(http_client.HTTP_RETRIES + 1):
+                last_retry = retry == http_client.HTTP_RETRIES
+                try:
+                    async with runner.get_session().get(page_url, headers=headers, timeout=get_timeout()) as response:
+                        metrics.inc("upstream_requests_total", upstream=DeckboxCrawler._DECKBOX_DOMAIN,
+                                    status=response.status)
+                        if response.status < 500 or last_retry:
+                            return response.status, response.headers, await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if last_retry:
+                        raise
+
+                await asyncio.sleep(http_client.HTTP_BACKOFF_FACTOR * 2 ** retry)
+
+    def log(self, message):
+        print("LOG - " + message)
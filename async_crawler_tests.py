@@ -0,0 +1,149 @@
+import asyncio, unittest
+from unittest import mock
+import aiohttp
+import async_crawler
+import http_client
+from async_crawler import AsyncDeckboxCrawler
+from deckbox_crawler import DeckboxCrawler
+from loadtest import fake_upstream
+from offline import OfflineTestCase
+from page_cache import PageDownloadError
+
+
+class FlakySession(fake_upstream.ClientSession):
+    """
+    Session failing the first requests of each url, with an error status or a connection error
+    """
+
+    def __init__(self, failures, status=503):
+        self.failures = failures
+        self.status = status
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(url)
+        if self.requests.count(url) > self.failures:
+            return super().get(url, headers, timeout)
+        if self.status is None:
+            raise aiohttp.ClientConnectionError("Connection reset by peer")
+
+        response = fake_upstream.AsyncUpstreamResponse(fake_upstream.fetch(url, headers=headers))
+        response.status = self.status
+
+        return response
+
+
+class GatedSession(fake_upstream.ClientSession):
+    """
+    Session answering once the expected number of requests were started: pages requested one
+    after the other time out, pages requested concurrently are answered
+    """
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.requests = []
+        self.all_started = None
+
+    def get(self, url, headers=None, timeout=None):
+        if self.all_started is None:
+            self.all_started = asyncio.Event()
+        self.requests.append(url)
+        if len(self.requests) >= self.expected:
+            self.all_started.set()
+
+        return GatedResponse(self, super().get(url, headers, timeout))
+
+
+class GatedResponse:
+
+    def __init__(self, session, response):
+        self.session = session
+        self.response = response
+
+    async def __aenter__(self):
+        await asyncio.wait_for(self.session.all_started.wait(), 1)
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class AsyncDeckboxCrawlerTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.crawler = AsyncDeckboxCrawler(self.test_username)
+        self.user_url = DeckboxCrawler.getUserUrl(self.test_username)
+        patch = mock.patch.object(http_client, "HTTP_BACKOFF_FACTOR", 0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def useSession(self, session):
+        patch = mock.patch.object(async_crawler.runner, "get_session", lambda: session)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        return session
+
+    def test_retried_errors(self):
+        for status in (503, None):
+            with self.subTest(status=status):
+                session = self.useSession(FlakySession(http_client.HTTP_RETRIES, status))
+
+                status_code, headers, body = async_crawler.run(self.crawler.downloadPage(self.user_url))
+
+                self.assertEqual(status_code, 200)
+                self.assertIn("deckbox_api", body)
+                self.assertEqual(session.requests, [self.user_url] * (http_client.HTTP_RETRIES + 1))
+
+    def test_client_errors_are_not_retried(self):
+        session = self.useSession(FlakySession(1, 404))
+
+        status_code, headers, body = async_crawler.run(self.crawler.downloadPage(self.user_url))
+
+        self.assertEqual(status_code, 404)
+        self.assertEqual(session.requests, [self.user_url])
+
+    def test_retries_exhausted(self):
+        session = self.useSession(FlakySession(http_client.HTTP_RETRIES + 1))
+        self.assertEqual(async_crawler.run(self.crawler.downloadPage(self.user_url))[0], 503)
+        self.assertEqual(len(session.requests), http_client.HTTP_RETRIES + 1)
+
+        # Not parsed nor cached
+        self.useSession(FlakySession(http_client.HTTP_RETRIES + 1))
+        with self.assertRaises(PageDownloadError):
+            async_crawler.run(self.crawler.getUserPage())
+        self.assertIsNone(DeckboxCrawler.page_cache.get_cached(self.user_url))
+
+        self.useSession(FlakySession(http_client.HTTP_RETRIES + 1, None))
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            async_crawler.run(self.crawler.downloadPage(self.user_url))
+
+    def test_user_and_set_pages_in_parallel(self):
+        # Set ids are known without the user page
+        session = self.useSession(GatedSession(2))
+
+        user_set = async_crawler.run(self.crawler.getUserSetCards("590740"))
+
+        self.assertEqual(sorted(session.requests), sorted([self.user_url, DeckboxCrawler.getSetUrl("590740")]))
+        self.assertEqual((user_set["id"], user_set["page"], len(user_set["cards"])), ("590740", 1, 100))
+
+    def test_set_name_needs_the_user_page(self):
+        session = self.useSession(fake_upstream.ClientSession())
+        session.get = mock.Mock(wraps=session.get)
+
+        user_set = async_crawler.run(self.crawler.getUserSetCards("inventory"))
+
+        self.assertEqual([call[0][0] for call in session.get.call_args_list],
+                         [self.user_url, DeckboxCrawler.getSetUrl("590740")])
+        self.assertEqual(user_set["id"], "inventory")
+        # Then found in the set list cache
+        self.assertEqual(DeckboxCrawler.set_list_cache.get(self.test_username)[0],
+                         {"id": "590740", "name": "inventory"})
+
+    def test_unknown_set(self):
+        self.assertEqual(async_crawler.run(self.crawler.getUserSetCards("unknown")), async_crawler.SET_NOT_FOUND)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Batch crawl of the profiles and sets of several users (see the /api/batch endpoint).
+Items are crawled concurrently on the async crawler loop with a bounded number of
+items in flight, an item that fails only fails its own result.
+"""
+import os, asyncio
+import async_crawler
+from async_crawler import AsyncDeckboxCrawler
+from decorators import page_number
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 100))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+
+CRAWL_FAILED = {"status": "error", "description": "The Deckbox pages of this item could not be read."}
+
+
+def log(message):
+    print("LOG - " + message)
+
+
+def username(value):
+    """
+    Type of the users argument
+    """
+    if not isinstance(value, str) or not value:
+        raise ValueError("Usernames must be non empty strings.")
+
+    return value
+
+
+def set_item(value):
+    """
+    Type of the sets argument: {"username": ..., "set_id": ..., "page": ...}, page is 1 by default
+    """
+    if not isinstance(value, dict) or not isinstance(value.get("set_id"), (str, int)) or value["set_id"] == "":
+        raise ValueError('Sets must be objects with a "username" and a "set_id".')
+
+    return {
+        "username": username(value.get("username")),
+        "set_id": str(value["set_id"]),
+        "page": page_number(value.get("page", 1)),
+    }
+
+
+def get_item_key(item):
+    return item["username"].lower(), item.get("set_id"), item.get("page")
+
+
+async def crawl_item(item):
+    deckbox_crawler = AsyncDeckboxCrawler(item["username"])
+    if "set_id" not in item:
+        user = await deckbox_crawler.getUserPage()
+        # getUserSets writes the set list cache
+        return {**user.getUserProfile(), "sets": await async_crawler.run_blocking(user.getUserSets)}
+
+    if item["page"] == "all":
+        return await deckbox_crawler.getUserSetAllPages(item["set_id"])
+
+    return await deckbox_crawler.getUserSetCards(item["set_id"], item["page"])
+
+
+async def crawl_items(items, concurrency):
+    # Created here to be bound to the running loop
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def crawl_bounded(item):
+        async with semaphore:
+            try:
+                return await crawl_item(item)
+            except Exception as e:
+                log("batch item {} failed: {!r}".format(item, e))
+                return dict(CRAWL_FAILED)
+
+    return await asyncio.gather(*[crawl_bounded(item) for item in items])
+
+
+def crawl(items, concurrency=BATCH_CONCURRENCY):
+    """
+    :param items: users ({"username": ...}) and sets (see set_item)
+    :return: crawled data in the order of items, an error dict for the items that failed
+    """
+    return async_crawler.run(crawl_items(items, concurrency))
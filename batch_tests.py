@@ -0,0 +1,108 @@
+import json, unittest
+from unittest import mock
+from flask import Response
+import api
+import batch
+import http_client
+from loadtest import fake_upstream
+from offline import OfflineTestCase
+
+fetch = fake_upstream.fetch
+
+
+def fetch_with_broken_user(url, **kwargs):
+    # Deckbox fails on every page of this user
+    if "/users/broken" in url:
+        return fake_upstream.UpstreamResponse(url, Response("Internal Server Error", status=500))
+
+    return fetch(url, **kwargs)
+
+
+class BatchTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.object(http_client, "HTTP_BACKOFF_FACTOR", 0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def post(self, data):
+        response = self.app.post("/api/batch", data=json.dumps(data), content_type="application/json",
+                                 base_url="https://localhost")
+
+        return response.status_code, json.loads(response.get_data(as_text=True))
+
+    def test_batch(self):
+        status, data = self.post({"users": ["deckbox_api"],
+                                  "sets": [{"username": "deckbox_api", "set_id": "inventory"},
+                                           {"username": "deckbox_api", "set_id": "608751", "page": "all"}]})
+
+        self.assertEqual(status, 200)
+        user, inventory, deck = data["items"]
+        self.assertEqual(user["request"], {"username": "deckbox_api"})
+        self.assertEqual(user["result"]["sets"][0], {"id": 590740, "name": "inventory"})
+        self.assertEqual(inventory["request"], {"username": "deckbox_api", "set_id": "inventory", "page": 1})
+        self.assertEqual(inventory["result"], self.getJson("/api/users/deckbox_api/inventory")[1])
+        self.assertEqual(deck["result"], self.getJson("/api/users/deckbox_api/sets/608751")[1])
+        self.assertEqual({item["status"] for item in data["items"]}, {"ok"})
+
+    def test_single_card_metadata_lookup(self):
+        with mock.patch.object(api, "get_cards_meta", mock.Mock(wraps=api.get_cards_meta)) as get_cards_meta:
+            self.post({"sets": [{"username": "deckbox_api", "set_id": set_id} for set_id in ("inventory", "608751")]})
+
+        self.assertEqual(get_cards_meta.call_count, 1)
+
+    def test_duplicates(self):
+        status, data = self.post({"users": ["deckbox_api", "Deckbox_API"],
+                                  "sets": [{"username": "deckbox_api", "set_id": "inventory"},
+                                           {"username": "DECKBOX_API", "set_id": "inventory", "page": 1},
+                                           {"username": "deckbox_api", "set_id": "inventory", "page": 2}]})
+
+        self.assertEqual(status, 200)
+        # Usernames are compared without their case
+        self.assertEqual([dict(item["request"], username=item["request"]["username"].lower())
+                          for item in data["items"]], [
+            {"username": "deckbox_api"},
+            {"username": "deckbox_api", "set_id": "inventory", "page": 1},
+            {"username": "deckbox_api", "set_id": "inventory", "page": 2},
+        ])
+
+    def test_item_limit(self):
+        with mock.patch.object(batch, "BATCH_MAX_ITEMS", 2):
+            self.assertEqual(self.post({"users": ["deckbox_api", "other"]})[0], 200)
+
+            status, error = self.post({"users": ["deckbox_api", "other", "third"]})
+            self.assertEqual(status, 400)
+            self.assertEqual(error, {"status": "error",
+                                     "description": "A batch must have between 1 and 2 users and sets."})
+
+            # Duplicates are not counted
+            self.assertEqual(self.post({"users": ["deckbox_api", "other", "Other"]})[0], 200)
+
+        self.assertEqual(self.post({})[0], 400)
+        self.assertEqual(self.post({"users": [], "sets": []})[0], 400)
+
+    def test_invalid_items(self):
+        self.assertEqual(self.post({"users": [""]})[0], 400)
+        self.assertEqual(self.post({"sets": [{"username": "deckbox_api"}]})[0], 400)
+        self.assertEqual(self.post({"sets": [{"username": "deckbox_api", "set_id": "inventory", "page": "x"}]})[0],
+                         400)
+
+    def test_item_errors(self):
+        with mock.patch.object(fake_upstream, "fetch", fetch_with_broken_user):
+            status, data = self.post({"users": ["broken", "deckbox_api"],
+                                      "sets": [{"username": "broken", "set_id": "inventory"},
+                                               {"username": "deckbox_api", "set_id": "unknown"}]})
+
+        self.assertEqual(status, 200)
+        broken_user, user, broken_set, unknown_set = data["items"]
+        self.assertEqual(broken_user, {"request": {"username": "broken"}, "status": "error",
+                                       "description": batch.CRAWL_FAILED["description"]})
+        self.assertEqual(broken_set["description"], batch.CRAWL_FAILED["description"])
+        self.assertEqual(user["status"], "ok")
+        self.assertEqual(unknown_set, {"request": {"username": "deckbox_api", "set_id": "unknown", "page": 1},
+                                       "status": "error", "description": "The user doesn't have the specified set."})
+
+
+if __name__ == '__main__':
+    unittest.main()
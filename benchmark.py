@@ -0,0 +1,203 @@
+"""
+Offline parser and serializer benchmarks.
+Deckbox HTML snapshots from tests/fixtures/html are injected into the crawler
+instead of downloading pages, so no network access is needed.
+
+    $ python benchmark.py --output bench.json
+    $ python benchmark.py --compare bench.json
+"""
+import argparse, datetime, json, os, platform, statistics, subprocess, sys, time, tracemalloc
+from flask import Flask
+from deckbox_crawler import DeckboxCrawler
+from decorators import marshal_with, paginate_deckbox_results
+from page_cache import get_page_type
+from schemas import DeckboxCardSchema, SetSchema, UserSchema
+from serializers import compile_schema
+
+SNAPSHOTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "html")
+
+
+def load_snapshot(name):
+    with open(os.path.join(SNAPSHOTS_PATH, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class SnapshotCrawler(DeckboxCrawler):
+    """
+    Crawler serving saved HTML snapshots instead of calling Deckbox
+    :param pages: dict of page type (see page_cache.get_page_type) to HTML
+    """
+
+    def __init__(self, pages, username="deckbox_api"):
+        self._pages = pages
+        super().__init__(username)
+        self.loadUserPage()
+
+    def fetchPage(self, page_url):
+        return self._pages[get_page_type(page_url)]
+
+    def log(self, message):
+        pass
+
+
+def get_benchmarks():
+    """
+    :return: list of (name, setup, run, rows) where run(state) is the timed operation,
+    setup() returns its state and rows(state) the number of rows parsed or serialized
+    """
+    profile = load_snapshot("profile.html")
+    pages = {
+        "profile": profile,
+        "friends": load_snapshot("friends.html"),
+        "inventory": load_snapshot("inventory.html"),
+        "deck": load_snapshot("deck.html"),
+        "cards": load_snapshot("cards.html"),
+        "card": load_snapshot("card.html"),
+    }
+
+    def crawler_for(set_page):
+        return lambda: SnapshotCrawler({"profile": profile, "friends": pages["friends"], "set": pages[set_page],
+                                        "cards": pages[set_page], "default": pages[set_page]})
+
+    def get_cards_from_page(crawler):
+        crawler.getPage(crawler._HTTP + crawler._DECKBOX_DOMAIN + "/sets/1")
+        return crawler.getCardsFromPage()
+
+    def get_card(crawler):
+        crawler.getPage(crawler._HTTP + crawler._DECKBOX_DOMAIN + "/mtg/card")
+        return crawler.getCard()
+
+    def count_cards(rv):
+        return len(rv["cards"]) if "cards" in rv else len(rv["mainboard"]["cards"]) + len(rv["sideboard"]["cards"])
+
+    app = Flask(__name__)
+
+    def serialize(schema, data, **kwargs):
+        serializer = marshal_with(schema, **kwargs)(lambda: data)
+
+        def run(_):
+            with app.test_request_context("/"):
+                return serializer()
+
+        return run
+
+    inventory = get_cards_from_page(crawler_for("inventory")())
+    deck = get_cards_from_page(crawler_for("deck")())
+    user = {**crawler_for("inventory")().getUserProfile(), "sets": crawler_for("inventory")().getUserSets()}
+
+    return [
+        ("getCardsFromPage:inventory", crawler_for("inventory"), get_cards_from_page, count_cards),
+        ("getCardsFromPage:deck", crawler_for("deck"), get_cards_from_page, count_cards),
+        ("getCardsFromPage:cards", crawler_for("cards"), get_cards_from_page, count_cards),
+        ("getCard", crawler_for("card"), get_card, lambda rv: 1),
+        ("getUserFriends", crawler_for("inventory"), lambda c: c.getUserFriends(), len),
+        ("getUserProfile", crawler_for("inventory"), lambda c: c.getUserProfile(), lambda rv: 1),
+        ("marshal_with:DeckboxCardSchema", lambda: None,
+         serialize(DeckboxCardSchema(many=True), inventory, pagination=True, paginator=paginate_deckbox_results),
+         lambda rv: len(inventory["cards"])),
+        ("marshal_with:SetSchema", lambda: None, serialize(SetSchema(), deck), lambda rv: count_cards(deck)),
+        ("marshal_with:UserSchema", lambda: None, serialize(UserSchema(), user), lambda rv: 1),
+        ("marshal_with:compiled:DeckboxCardSchema", lambda: None,
+         serialize(compile_schema(DeckboxCardSchema(many=True)), inventory, pagination=True,
+                   paginator=paginate_deckbox_results),
+         lambda rv: len(inventory["cards"])),
+        ("marshal_with:compiled:SetSchema", lambda: None, serialize(compile_schema(SetSchema()), deck),
+         lambda rv: count_cards(deck)),
+        ("marshal_with:compiled:UserSchema", lambda: None, serialize(compile_schema(UserSchema()), user),
+         lambda rv: 1),
+    ]
+
+
+def run_benchmark(setup, run, rows, iterations, warmup):
+    for _ in range(warmup):
+        run(setup())
+
+    timings = []
+    row_count = 0
+    for _ in range(iterations):
+        state = setup()
+        start = time.perf_counter()
+        rv = run(state)
+        timings.append(time.perf_counter() - start)
+        row_count = rows(rv)
+
+    # Allocations are measured on a separate run, tracemalloc slows everything down
+    state = setup()
+    tracemalloc.start()
+    start_current, _ = tracemalloc.get_traced_memory()
+    rv = run(state)
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del rv
+
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "rows": row_count,
+        "mean_ms": total / iterations * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "p95_ms": sorted(timings)[max(0, int(round(iterations * 0.95)) - 1)] * 1000,
+        "pages_per_sec": iterations / total if total else None,
+        "rows_per_sec": row_count * iterations / total if total else None,
+        "peak_alloc_bytes": peak - start_current,
+        "retained_alloc_bytes": current - start_current,
+        "live_blocks": blocks,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    for name, result in sorted(results.items()):
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            print("{:<36} {:>10.3f}ms (new)".format(name, result["mean_ms"]), file=sys.stderr)
+            continue
+        ratio = result["mean_ms"] / previous["mean_ms"] if previous["mean_ms"] else float("inf")
+        print("{:<36} {:>10.3f}ms vs {:>10.3f}ms  x{:.2f}".format(name, result["mean_ms"], previous["mean_ms"], ratio),
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("-w", "--warmup", type=int, default=3)
+    parser.add_argument("-k", "--filter", default=None, help="only run benchmarks containing this string")
+    parser.add_argument("-o", "--output", default=None, help="write results to this file instead of stdout")
+    parser.add_argument("--compare", default=None, help="previous results file to compare with")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup, run, rows in get_benchmarks():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_benchmark(setup, run, rows, args.iterations, args.warmup)
+
+    report = {
+        "commit": get_commit(),
+        "date": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
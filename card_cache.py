@@ -0,0 +1,117 @@
+import os, re, json, zlib
+import redis
+from schemas import CardSchema
+
+CARD_META_TTL = int(os.environ.get("CARD_META_TTL", 7 * 24 * 3600))
+# Names Scryfall could not resolve are remembered for a shorter time
+CARD_META_MISS_TTL = int(os.environ.get("CARD_META_MISS_TTL", 24 * 3600))
+
+# Only the Scryfall fields serialized by CardSchema are kept, types and subtypes
+# are computed from type_line when dumping. The collection statistics also use
+# colors, legalities and prices (see collection_stats)
+CARD_META_FIELDS = tuple(sorted(
+    {field.attribute or name for name, field in CardSchema._declared_fields.items()
+     if name not in ("types", "subtypes")} | {"colors", "color_identity", "legalities", "prices"}
+))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    return _WHITESPACE.sub(" ", name).strip().lower()
+
+
+def get_name_aliases(name):
+    """
+    Names a card can be looked up with: split and double faced cards are also
+    known by their first face (Give // Take -> Give)
+    """
+    aliases = [name]
+    if " //" in name:
+        aliases.append(name.split(" //")[0])
+
+    return aliases
+
+
+def compact(card):
+    return {k: card[k] for k in CARD_META_FIELDS if k in card}
+
+
+class CardMetaCache:
+    """
+    Redis cache for Scryfall card metadata.
+    Entries are stored under a namespaced key per normalized card name, with a TTL,
+    as zlib compressed JSON holding only the fields the schemas serialize.
+    Names Scryfall does not know are cached as misses (negative caching).
+    """
+    KEY_PREFIX = "card_meta:v2:"
+    MISSING = b"\x00"
+
+    def __init__(self, redis_client, ttl=CARD_META_TTL, miss_ttl=CARD_META_MISS_TTL):
+        self._redis = redis_client
+        self._ttl = ttl
+        self._miss_ttl = miss_ttl
+
+    def key(self, name):
+        return self.KEY_PREFIX + normalize_name(name)
+
+    def get_many(self, names):
+        """
+        :return: dict of name to card metadata, None for cached misses,
+        names not cached at all are missing
+        """
+        names = list(names)
+        if not names:
+            return {}
+
+        try:
+            values = self._redis.mget([self.key(name) for name in names])
+        except redis.RedisError:
+            return {}
+
+        return {name: self.decode(value) for name, value in zip(names, values) if value is not None}
+
+    def set_many(self, cards):
+        """
+        Store Scryfall cards under all of their name aliases
+        :param cards: Scryfall card objects
+        :return: dict of normalized alias to the compacted card metadata
+        """
+        cards_meta = {}
+        for card in cards:
+            meta = compact(card)
+            for alias in get_name_aliases(card["name"]):
+                cards_meta[normalize_name(alias)] = meta
+
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for alias, meta in cards_meta.items():
+                pipe.set(self.KEY_PREFIX + alias, self.encode(meta), ex=self._ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+        return cards_meta
+
+    def set_missing(self, names):
+        """
+        Remember names Scryfall could not resolve
+        """
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for name in names:
+                pipe.set(self.key(name), self.MISSING, ex=self._miss_ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    @staticmethod
+    def encode(meta):
+        return zlib.compress(json.dumps(meta, separators=(',', ':')).encode("utf-8"))
+
+    @classmethod
+    def decode(cls, value):
+        if value == cls.MISSING:
+            return None
+
+        return json.loads(zlib.decompress(value).decode("utf-8"))
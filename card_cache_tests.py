@@ -0,0 +1,104 @@
+import json, unittest
+from unittest import mock
+import fakeredis
+import redis
+import api
+from singleflight import SingleFlight
+from card_cache import CardMetaCache, CARD_META_FIELDS, compact, normalize_name, get_name_aliases
+
+
+class BrokenRedis:
+    """
+    Redis client whose calls all fail
+    """
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("Redis is down")
+        return fail
+
+
+class CardMetaCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.card_meta_cache = CardMetaCache(self.redis, ttl=3600, miss_ttl=60)
+        self.fixture_path = "tests/fixtures/"
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards = json.load(f)
+
+    def getCard(self, name):
+        return next(card for card in self.cards if card["name"] == name)
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("  Black   LOTUS "), "black lotus")
+        self.assertEqual(get_name_aliases("Give // Take"), ["Give // Take", "Give"])
+        self.assertEqual(get_name_aliases("Black Lotus"), ["Black Lotus"])
+
+    def test_compact(self):
+        card = self.getCard("Black Lotus")
+        meta = compact(card)
+
+        self.assertTrue(set(meta) <= set(CARD_META_FIELDS))
+        self.assertNotIn("oracle_id", meta)
+        self.assertEqual(meta["name"], "Black Lotus")
+        self.assertEqual(meta["legalities"], card["legalities"])
+
+    def test_set_many_get_many(self):
+        cards_meta = self.card_meta_cache.set_many(self.cards)
+
+        self.assertEqual(cards_meta["black lotus"], compact(self.getCard("Black Lotus")))
+        self.assertEqual(self.card_meta_cache.get_many(["Black Lotus", "black  lotus", "Unknown Card"]), {
+            "Black Lotus": compact(self.getCard("Black Lotus")),
+            "black  lotus": compact(self.getCard("Black Lotus")),
+        })
+        self.assertEqual(self.card_meta_cache.get_many([]), {})
+
+    def test_split_cards(self):
+        self.card_meta_cache.set_many([self.getCard("Give // Take")])
+
+        cards_meta = self.card_meta_cache.get_many(["Give // Take", "Give"])
+        self.assertEqual(cards_meta["Give"], cards_meta["Give // Take"])
+        self.assertEqual(cards_meta["Give"]["name"], "Give // Take")
+
+    def test_entries_expire(self):
+        self.card_meta_cache.set_many([self.getCard("Black Lotus")])
+
+        ttl = self.redis.ttl(self.card_meta_cache.key("Black Lotus"))
+        self.assertTrue(0 < ttl <= 3600)
+
+    def test_missing_names(self):
+        self.card_meta_cache.set_missing(["Unknown Card"])
+
+        self.assertEqual(self.card_meta_cache.get_many(["Unknown Card", "unknown card", "Other Card"]),
+                         {"Unknown Card": None, "unknown card": None})
+        self.assertTrue(0 < self.redis.ttl(self.card_meta_cache.key("Unknown Card")) <= 60)
+
+    def test_missing_names_are_not_searched_again(self):
+        resolve_names = mock.Mock(return_value=[self.getCard("Black Lotus")])
+
+        with mock.patch.object(api, "card_meta_cache", self.card_meta_cache), \
+                mock.patch.object(api, "single_flight", SingleFlight(self.redis)), \
+                mock.patch.object(api, "card_index", None), \
+                mock.patch.object(api.scryfall, "resolve_names", resolve_names):
+            cards_meta = api.get_cards_meta(["Black Lotus", "Unknown Card"])
+            self.assertEqual(cards_meta, {"Black Lotus": compact(self.getCard("Black Lotus")), "Unknown Card": None})
+            self.assertEqual(resolve_names.call_count, 1)
+            self.assertEqual(sorted(resolve_names.call_args[0][0]), ["Black Lotus", "Unknown Card"])
+
+            resolve_names.reset_mock()
+            self.assertEqual(api.get_cards_meta(["Black Lotus", "Unknown Card"]), cards_meta)
+            resolve_names.assert_not_called()
+
+    def test_redis_errors(self):
+        card_meta_cache = CardMetaCache(BrokenRedis())
+
+        self.assertEqual(card_meta_cache.get_many(["Black Lotus"]), {})
+        self.assertEqual(card_meta_cache.set_many([self.getCard("Black Lotus")]),
+                         {"black lotus": compact(self.getCard("Black Lotus"))})
+
+
+if __name__ == '__main__':
+    unittest.main()
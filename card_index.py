@@ -0,0 +1,280 @@
+"""
+Offline card metadata index built from a Scryfall bulk data file
+(https://scryfall.com/docs/api/bulk-data).
+
+    $ python card_index.py import default-cards.json --index cards.sqlite
+
+The bulk file is streamed, never loaded whole, and re-imports only write
+the cards whose metadata changed.
+"""
+import argparse, hashlib, json, os, sqlite3, threading, time, zlib
+from card_cache import compact, normalize_name
+
+CARD_INDEX_PATH = os.environ.get("CARD_INDEX_PATH", "cards.sqlite")
+IMPORT_BATCH_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    name_key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    released_at TEXT,
+    hash TEXT NOT NULL,
+    data BLOB NOT NULL,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    name_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    Stream the items of a top level JSON array from a text file object
+    Raises ValueError if the file is empty, truncated or not a JSON array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+
+    while True:
+        chunk = f.read(chunk_size)
+        buffer += chunk
+        position = 0
+
+        while True:
+            # Skip whitespace and separators
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if not started:
+                if position == len(buffer):
+                    # Only whitespace so far, read more data
+                    if not chunk:
+                        raise ValueError("Bulk data file must contain a JSON array")
+                    break
+                if buffer[position] != "[":
+                    raise ValueError("Bulk data file must contain a JSON array")
+                started = True
+                position += 1
+                continue
+
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # Incomplete item, read more data
+                if not chunk:
+                    raise
+                break
+
+            yield item
+            position = end
+
+        buffer = buffer[position:]
+
+        if not chunk:
+            return
+
+
+def get_aliases(card):
+    names = [card["name"], card["name"].split(" //")[0]]
+    names.extend(face["name"] for face in card.get("card_faces", []) if "name" in face)
+
+    return {normalize_name(name) for name in names}
+
+
+class CardIndex:
+    """
+    SQLite index of Scryfall card metadata keyed by normalized card name.
+    Split and double faced cards can also be found by any of their face names.
+    """
+
+    def __init__(self, path=CARD_INDEX_PATH, readonly=True):
+        self._path = path
+        self._readonly = readonly
+        self._local = threading.local()
+
+        if not readonly:
+            self.connection.executescript(_SCHEMA)
+
+    @classmethod
+    def open(cls, path=CARD_INDEX_PATH):
+        """
+        :return: a read only CardIndex, None if no index has been imported yet
+        """
+        if not path or not os.path.exists(path):
+            return None
+
+        return cls(path)
+
+    @property
+    def connection(self):
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self._readonly:
+                connection = sqlite3.connect("file:{}?mode=ro".format(self._path), uri=True,
+                                             check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self._path)
+            self._local.connection = connection
+
+        return connection
+
+    def get_many(self, names):
+        """
+        :return: dict of name to card metadata, names not in the index are missing
+        """
+        keys = {normalize_name(name): name for name in names}
+        if not keys:
+            return {}
+
+        rv = {}
+        keys_list = list(keys)
+        # Stay under SQLite's default limit of 999 query variables
+        for i in range(0, len(keys_list), 900):
+            chunk = keys_list[i:i + 900]
+            rows = self.connection.execute(
+                "SELECT aliases.alias, cards.data FROM aliases JOIN cards ON cards.name_key = aliases.name_key "
+                "WHERE aliases.alias IN ({})".format(",".join("?" * len(chunk))),
+                chunk
+            )
+            for alias, data in rows:
+                rv[keys[alias]] = self.decode(data)
+
+        return rv
+
+    def get(self, name):
+        return self.get_many([name]).get(name)
+
+    def iter_all(self):
+        for data, in self.connection.execute("SELECT data FROM cards ORDER BY name"):
+            yield self.decode(data)
+
+    #-------------------------
+    #  IMPORT
+    #-------------------------
+    def import_bulk_file(self, path, prune=False, log=print):
+        """
+        Import a Scryfall bulk data JSON file.
+        When several printings share a name the most recent one is kept.
+        :param prune: remove the cards that are not in this file anymore
+        :return: dict of import statistics
+        """
+        connection = self.connection
+        generation = int(time.time())
+        stats = {"read": 0, "inserted": 0, "updated": 0, "unchanged": 0, "pruned": 0}
+        batch = {}
+
+        with open(path, encoding="utf-8") as f:
+            for card in iter_json_array(f):
+                stats["read"] += 1
+                if "name" not in card:
+                    continue
+
+                name_key = normalize_name(card["name"])
+                previous = batch.get(name_key)
+                if previous and (previous.get("released_at") or "") > (card.get("released_at") or ""):
+                    continue
+                batch[name_key] = card
+
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self._import_batch(batch, generation, stats)
+                    batch = {}
+
+                if stats["read"] % 10000 == 0:
+                    log("LOG - {read} cards read".format(**stats))
+
+        self._import_batch(batch, generation, stats)
+
+        if prune:
+            stats["pruned"] = connection.execute("DELETE FROM cards WHERE generation < ?", (generation,)).rowcount
+            connection.execute("DELETE FROM aliases WHERE name_key NOT IN (SELECT name_key FROM cards)")
+
+        connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                           ("last_import", json.dumps({"file": os.path.abspath(path), "generation": generation,
+                                                       **stats})))
+        connection.commit()
+
+        return stats
+
+    def _import_batch(self, batch, generation, stats):
+        connection = self.connection
+        keys = list(batch)
+        existing = {}
+        for i in range(0, len(keys), 900):
+            chunk = keys[i:i + 900]
+            rows = connection.execute(
+                "SELECT name_key, released_at, hash FROM cards WHERE name_key IN ({})".format(
+                    ",".join("?" * len(chunk))),
+                chunk
+            )
+            existing.update((name_key, (released_at, data_hash)) for name_key, released_at, data_hash in rows)
+
+        for name_key, card in batch.items():
+            data = self.encode(compact(card))
+            data_hash = hashlib.sha1(data).hexdigest()
+            released_at = card.get("released_at")
+            previous = existing.get(name_key)
+
+            if previous and previous[1] == data_hash:
+                connection.execute("UPDATE cards SET generation = ? WHERE name_key = ?", (generation, name_key))
+                stats["unchanged"] += 1
+                continue
+
+            # An older printing from a file imported earlier doesn't replace a newer one
+            if previous and previous[0] and released_at and previous[0] > released_at:
+                connection.execute("UPDATE cards SET generation = ? WHERE name_key = ?", (generation, name_key))
+                stats["unchanged"] += 1
+                continue
+
+            connection.execute(
+                "INSERT OR REPLACE INTO cards (name_key, name, released_at, hash, data, generation) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name_key, card["name"], released_at, data_hash, data, generation)
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO aliases (alias, name_key) VALUES (?, ?)",
+                [(alias, name_key) for alias in get_aliases(card)]
+            )
+            stats["updated" if previous else "inserted"] += 1
+
+        connection.commit()
+
+    @staticmethod
+    def encode(meta):
+        return zlib.compress(json.dumps(meta, separators=(',', ':')).encode("utf-8"))
+
+    @staticmethod
+    def decode(data):
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+    import_parser = subparsers.add_parser("import", help="import a Scryfall bulk data JSON file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--index", default=CARD_INDEX_PATH)
+    import_parser.add_argument("--prune", action="store_true", help="remove cards missing from this file")
+    args = parser.parse_args()
+
+    if args.command != "import":
+        parser.print_help()
+        return
+
+    start = time.time()
+    stats = CardIndex(args.index, readonly=False).import_bulk_file(args.file, prune=args.prune)
+    print("LOG - imported {} in {:.1f}s: {}".format(args.file, time.time() - start, stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import io, json, os, shutil, tempfile, unittest
+from unittest import mock
+from card_index import CardIndex, iter_json_array, get_aliases
+from card_cache import compact
+
+
+class IterJsonArrayTestCase(unittest.TestCase):
+
+    def items(self, text, chunk_size=4):
+        return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_items(self):
+        items = [{"name": "Black Lotus", "text": "[{,]}"}, {"name": "Give // Take"}, 3, "]"]
+        text = json.dumps(items, indent=2)
+
+        for chunk_size in (1, 3, 7, 1 << 16):
+            self.assertEqual(self.items(text, chunk_size), items)
+
+    def test_empty_array(self):
+        self.assertEqual(self.items("[]"), [])
+        self.assertEqual(self.items("  \n [ \n ] \n"), [])
+
+    def test_leading_whitespace(self):
+        self.assertEqual(self.items(" " * 100 + "[1, 2]", chunk_size=8), [1, 2])
+
+    def test_empty_file(self):
+        for text in ("", "   \n\t "):
+            with self.assertRaises(ValueError):
+                self.items(text)
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            self.items('{"name": "Black Lotus"}')
+
+    def test_truncated_file(self):
+        with self.assertRaises(ValueError):
+            self.items('[{"name": "Black Lotus"}, {"name": "Give')
+
+
+class CardIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixture_path = "tests/fixtures/"
+        self.directory = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.directory, "cards.sqlite")
+        self.generation = 1500000000
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards = json.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeBulkFile(self, cards, name="cards.json"):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cards, f)
+
+        return path
+
+    def importCards(self, cards, prune=False):
+        # Each import gets its own generation
+        self.generation += 1
+        with mock.patch("card_index.time.time", return_value=self.generation):
+            return CardIndex(self.index_path, readonly=False).import_bulk_file(self.writeBulkFile(cards), prune=prune,
+                                                                                log=lambda message: None)
+
+    def getCard(self, name):
+        return next(card for card in self.cards if card["name"] == name)
+
+    def test_open_without_index(self):
+        self.assertIsNone(CardIndex.open(self.index_path))
+
+    def test_aliases(self):
+        card = {"name": "Give // Take", "card_faces": [{"name": "Give"}, {"name": "Take"}]}
+        self.assertEqual(get_aliases(card), {"give // take", "give", "take"})
+        self.assertEqual(get_aliases(self.getCard("Black Lotus")), {"black lotus"})
+
+    def test_import(self):
+        stats = self.importCards(self.cards)
+        self.assertEqual(stats["read"], len(self.cards))
+        self.assertEqual(stats["inserted"], len(self.cards))
+
+        card_index = CardIndex.open(self.index_path)
+        self.assertEqual(card_index.get_many(["black  LOTUS", "Give", "Unknown Card"]), {
+            "black  LOTUS": compact(self.getCard("Black Lotus")),
+            "Give": compact(self.getCard("Give // Take")),
+        })
+        self.assertEqual(sorted(card["name"] for card in card_index.iter_all()),
+                         sorted(card["name"] for card in self.cards))
+
+    def test_reimport(self):
+        self.importCards(self.cards)
+
+        lotus = dict(self.getCard("Black Lotus"), type_line="Artifact — Changed")
+        cards = [lotus if card["name"] == "Black Lotus" else card for card in self.cards]
+        stats = self.importCards(cards)
+
+        self.assertEqual((stats["inserted"], stats["updated"], stats["unchanged"]), (0, 1, len(self.cards) - 1))
+        self.assertEqual(CardIndex.open(self.index_path).get("Black Lotus")["type_line"], "Artifact — Changed")
+
+    def test_most_recent_printing(self):
+        old = dict(self.getCard("Black Lotus"), released_at="1993-08-05", set="lea")
+        new = dict(self.getCard("Black Lotus"), released_at="2010-01-01", set="vma")
+        self.importCards([new, old])
+
+        self.assertEqual(CardIndex.open(self.index_path).get("Black Lotus")["set"], "vma")
+
+    def test_prune(self):
+        self.importCards(self.cards)
+        stats = self.importCards(self.cards[1:], prune=True)
+
+        self.assertEqual(stats["pruned"], 1)
+        self.assertIsNone(CardIndex.open(self.index_path).get(self.cards[0]["name"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""
+Compact representation of the rows of inventory pages (inventory, tradelist,
+wishlist and custom sets), used from parsing to serialization instead of dicts.
+
+A record keeps its fields in slots and its foil, promo, textless and signed
+marks in a bit field. Editions, conditions and languages are interned: rows
+with the same value share a single dict. Adding the card metadata references
+the cached Scryfall dict instead of merging it into a new dict per row.
+
+Records are read only mappings with the keys of the former row dicts, so they
+can be read like them. They become dicts when dumped (see serializers and
+json_encoder.dumps).
+"""
+import collections.abc
+
+FIELDS = ("id", "count", "name", "edition", "condition", "lang")
+FLAGS = ("is_foil", "is_promo", "is_textless", "is_signed")
+
+KEYS = FIELDS + FLAGS
+_KEYS = frozenset(KEYS)
+_FIELDS = frozenset(FIELDS)
+_FLAG_BITS = {flag: 1 << i for i, flag in enumerate(FLAGS)}
+
+
+class InternTable:
+    """
+    Shared {"code", "name"} dicts, one per distinct value. They must not be mutated.
+    """
+    __slots__ = ("_values",)
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, code, name):
+        key = (code, name)
+        value = self._values.get(key)
+        if value is None:
+            value = self._values[key] = {"code": code, "name": name}
+
+        return value
+
+    def __len__(self):
+        return len(self._values)
+
+
+editions = InternTable()
+conditions = InternTable()
+languages = InternTable()
+
+
+def get_flags(*values):
+    """
+    :param values: booleans in the order of FLAGS
+    :return: bit field of the flags
+    """
+    flags = 0
+    for i, value in enumerate(values):
+        if value:
+            flags |= 1 << i
+
+    return flags
+
+
+class CardRecord(collections.abc.Mapping):
+    __slots__ = ("id", "count", "name", "edition", "condition", "lang", "flags", "meta")
+
+    def __init__(self, id, count, name, edition, condition, lang, flags=0, meta=None):
+        """
+        :param edition: interned edition, see editions (same for condition and lang)
+        :param flags: bit field, see get_flags
+        :param meta: card metadata, its values take precedence like when it was merged into the row
+        """
+        self.id = id
+        self.count = count
+        self.name = name
+        self.edition = edition
+        self.condition = condition
+        self.lang = lang
+        self.flags = flags
+        self.meta = meta
+
+    def with_meta(self, meta):
+        """
+        :param meta: card metadata, None for cards Scryfall doesn't know
+        :return: a record of the same row with the metadata
+        """
+        return CardRecord(self.id, self.count, self.name, self.edition, self.condition, self.lang, self.flags, meta)
+
+    def __getitem__(self, key):
+        meta = self.meta
+        if meta is not None and key in meta:
+            return meta[key]
+        if key in _FIELDS:
+            return getattr(self, key)
+        if key in _FLAG_BITS:
+            return bool(self.flags & _FLAG_BITS[key])
+
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Without the KeyError of Mapping.get, serializers look up many keys unenriched rows don't have
+        meta = self.meta
+        if meta is not None and key in meta:
+            return meta[key]
+        if key in _FIELDS:
+            return getattr(self, key)
+        if key in _FLAG_BITS:
+            return bool(self.flags & _FLAG_BITS[key])
+
+        return default
+
+    def __contains__(self, key):
+        return key in _KEYS or (self.meta is not None and key in self.meta)
+
+    def __iter__(self):
+        yield from KEYS
+        if self.meta:
+            yield from (key for key in self.meta if key not in _KEYS)
+
+    def __len__(self):
+        return len(KEYS) + (len(self.meta.keys() - _KEYS) if self.meta else 0)
+
+    def to_dict(self):
+        card = {
+            "id": self.id,
+            "count": self.count,
+            "name": self.name,
+            "edition": self.edition,
+            "condition": self.condition,
+            "lang": self.lang,
+        }
+        for flag, bit in _FLAG_BITS.items():
+            card[flag] = bool(self.flags & bit)
+        if self.meta:
+            card.update(self.meta)
+
+        return card
+
+    def __repr__(self):
+        return "CardRecord({!r})".format(self.to_dict())
+
+
+def extend_card(card, meta):
+    """
+    Add card metadata to a parsed card, a record or a dict (deck and cards pages, synced rows)
+    :param meta: card metadata, None for cards Scryfall doesn't know
+    """
+    if type(card) is CardRecord:
+        return card.with_meta(meta)
+
+    return {**card, **(meta or {})}
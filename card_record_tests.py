@@ -0,0 +1,98 @@
+import collections.abc, json, unittest
+from card_record import CardRecord, KEYS, InternTable, editions, conditions, languages, get_flags, extend_card
+from json_encoder import dumps
+
+
+class CardRecordTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.edition = editions.get("M11", "Magic 2011")
+        self.condition = conditions.get("NM", "Near Mint")
+        self.lang = languages.get("en", "English")
+        self.record = CardRecord("1", 4, "Annul", self.edition, self.condition, self.lang,
+                                 get_flags(True, False, False, True))
+        self.row = {
+            "id": "1",
+            "count": 4,
+            "name": "Annul",
+            "edition": {"code": "M11", "name": "Magic 2011"},
+            "condition": {"code": "NM", "name": "Near Mint"},
+            "lang": {"code": "en", "name": "English"},
+            "is_foil": True,
+            "is_promo": False,
+            "is_textless": False,
+            "is_signed": True,
+        }
+        self.meta = {"name": "Annul", "cmc": 1, "type_line": "Instant", "set": "m11"}
+
+    def test_interning(self):
+        table = InternTable()
+
+        self.assertIs(table.get("M11", "Magic 2011"), table.get("M11", "Magic 2011"))
+        self.assertIsNot(table.get("M11", "Magic 2011"), table.get("M12", "Magic 2012"))
+        self.assertEqual(len(table), 2)
+
+    def test_flags(self):
+        self.assertEqual(get_flags(), 0)
+        self.assertEqual(get_flags(True, False, True), 0b101)
+
+    def test_mapping(self):
+        self.assertIsInstance(self.record, collections.abc.Mapping)
+        self.assertEqual(dict(self.record), self.row)
+        self.assertEqual(self.record, self.row)
+        self.assertEqual(len(self.record), len(KEYS))
+        self.assertEqual(list(self.record), list(KEYS))
+        self.assertEqual(list(self.record.items()), list(self.row.items()))
+        self.assertEqual(list(self.record.values()), list(self.row.values()))
+
+    def test_lookups(self):
+        self.assertEqual(self.record["name"], "Annul")
+        self.assertIs(self.record["edition"], self.edition)
+        self.assertIs(self.record["is_foil"], True)
+        self.assertIs(self.record["is_promo"], False)
+        self.assertIn("is_signed", self.record)
+        self.assertNotIn("cmc", self.record)
+        self.assertIsNone(self.record.get("cmc"))
+        self.assertEqual(self.record.get("cmc", 0), 0)
+
+        with self.assertRaises(KeyError):
+            self.record["cmc"]
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.record["count"] = 2
+        with self.assertRaises(AttributeError):
+            self.record.price = 1
+
+    def test_with_meta(self):
+        record = self.record.with_meta(dict(self.meta, name="Annul (M11)"))
+
+        # Metadata values take precedence like when they were merged into the row
+        self.assertEqual(record["name"], "Annul (M11)")
+        self.assertEqual(record["cmc"], 1)
+        self.assertIn("type_line", record)
+        self.assertEqual(len(record), len(KEYS) + 3)
+        self.assertEqual(dict(record), {**self.row, **self.meta, "name": "Annul (M11)"})
+        self.assertEqual(record.to_dict(), dict(record))
+        # The record itself is unchanged
+        self.assertNotIn("cmc", self.record)
+
+    def test_extend_card(self):
+        self.assertEqual(extend_card(self.record, self.meta), {**self.row, **self.meta})
+        self.assertIs(type(extend_card(self.record, self.meta)), CardRecord)
+        self.assertEqual(extend_card(self.record, None), self.row)
+        self.assertEqual(extend_card(self.row, self.meta), {**self.row, **self.meta})
+        self.assertEqual(extend_card(self.row, None), self.row)
+
+    def test_dumps(self):
+        self.assertEqual(json.loads(dumps(self.record.with_meta(self.meta)).decode("utf-8")), {**self.row, **self.meta})
+        self.assertEqual(json.loads(dumps({"cards": [self.record]}).decode("utf-8")), {"cards": [self.row]})
+
+    def test_repr(self):
+        self.assertEqual(repr(self.record), "CardRecord({!r})".format(self.row))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Statistics of a collection (value, mana curve, colors, types, format legality).
+Rows and their Scryfall metadata are laid out in columnar numpy arrays, one entry
+per distinct card and one per row, and aggregated with vectorized operations.
+Results are cached by a hash of the crawled rows and of their card metadata, i.e. per
+version of the collection and of the prices.
+"""
+import os, json, hashlib
+import numpy as np
+import redis
+from json_encoder import dumps
+
+STATS_CACHE_TTL = int(os.environ.get("STATS_CACHE_TTL", 3600))
+
+COLORS = ("W", "U", "B", "R", "G")
+TYPES = ("Artifact", "Battle", "Creature", "Enchantment", "Instant", "Land", "Planeswalker", "Sorcery", "Tribal")
+FORMATS = ("standard", "pioneer", "modern", "legacy", "vintage", "commander", "pauper")
+# Mana values from this one are counted together
+CURVE_MAX = 7
+# Scryfall legality values a card can be played with
+PLAYABLE = ("legal", "restricted")
+
+
+def get_price(prices, key):
+    try:
+        return float(prices[key])
+    except (KeyError, TypeError, ValueError):
+        return np.nan
+
+
+def get_card_columns(names, cards_meta):
+    """
+    :param names: distinct card names
+    :param cards_meta: dict of name to Scryfall metadata, None for unknown cards
+    :return: dict of column name to array, one entry per name
+    """
+    metas = [cards_meta.get(name) or {} for name in names]
+    prices = [meta.get("prices") or {} for meta in metas]
+    type_lines = [meta.get("type_line", "").split(" — ")[0].split(" ") for meta in metas]
+    colors = [set(meta.get("colors", meta.get("color_identity", []))) for meta in metas]
+    legalities = [meta.get("legalities") or {} for meta in metas]
+
+    return {
+        "known": np.array([bool(meta) for meta in metas], dtype=bool),
+        "cmc": np.array([meta.get("cmc") or 0 for meta in metas], dtype=float),
+        "usd": np.array([get_price(p, "usd") for p in prices], dtype=float),
+        "usd_foil": np.array([get_price(p, "usd_foil") for p in prices], dtype=float),
+        "eur": np.array([get_price(p, "eur") for p in prices], dtype=float),
+        "colors": np.array([[color in card_colors for color in COLORS] for card_colors in colors],
+                           dtype=bool).reshape(-1, len(COLORS)),
+        "types": np.array([[card_type in card_types for card_type in TYPES] for card_types in type_lines],
+                          dtype=bool).reshape(-1, len(TYPES)),
+        "legal": np.array([[legality.get(f) in PLAYABLE for f in FORMATS] for legality in legalities],
+                          dtype=bool).reshape(-1, len(FORMATS)),
+    }
+
+
+def get_row_count(row):
+    try:
+        return int(row.get("count") or 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def get_collection_stats(rows, cards_meta):
+    """
+    :param rows: parsed rows of the collection (name, count, is_foil)
+    :param cards_meta: dict of card name to Scryfall metadata, see api.get_cards_meta
+    :return: dict of statistics, counted in copies
+    """
+    names = sorted({row["name"] for row in rows})
+    name_index = {name: i for i, name in enumerate(names)}
+    cards = get_card_columns(names, cards_meta)
+
+    card = np.array([name_index[row["name"]] for row in rows], dtype=np.intp)
+    copies = np.array([get_row_count(row) for row in rows], dtype=np.int64)
+    foil = np.array([bool(row.get("is_foil")) for row in rows], dtype=bool)
+
+    known = cards["known"][card]
+    land = cards["types"][card, TYPES.index("Land")]
+    spells = known & ~land
+    spell_copies = copies * spells
+
+    # Foil copies at their foil price when Scryfall has one
+    usd = np.where(foil & ~np.isnan(cards["usd_foil"][card]), cards["usd_foil"][card], cards["usd"][card])
+    eur = cards["eur"][card]
+
+    curve = np.bincount(np.minimum(cards["cmc"][card], CURVE_MAX).astype(np.intp), weights=spell_copies,
+                        minlength=CURVE_MAX + 1)
+    color_counts = cards["colors"][card].sum(axis=1)
+    colors = (cards["colors"][card] * spell_copies[:, None]).sum(axis=0)
+    types = (cards["types"][card] * copies[:, None]).sum(axis=0)
+    legal = (cards["legal"][card] * copies[:, None]).sum(axis=0)
+    total_spells = int(spell_copies.sum())
+
+    return {
+        "cards": len(names),
+        "copies": int(copies.sum()),
+        "unknown_copies": int(copies[~known].sum()),
+        "value": {
+            "usd": round(float(np.nansum(usd * copies)), 2),
+            "eur": round(float(np.nansum(eur * copies)), 2),
+            "priced_copies": int(copies[~np.isnan(usd)].sum()),
+        },
+        "average_cmc": round(float((cards["cmc"][card] * spell_copies).sum() / total_spells), 2)
+        if total_spells else 0.0,
+        "mana_curve": {
+            (str(cmc) if cmc < CURVE_MAX else "{}+".format(CURVE_MAX)): int(count) for cmc, count in enumerate(curve)
+        },
+        "colors": {
+            **{color: int(count) for color, count in zip(COLORS, colors)},
+            "colorless": int(spell_copies[color_counts == 0].sum()),
+            "multicolor": int(spell_copies[color_counts > 1].sum()),
+        },
+        "types": {card_type: int(count) for card_type, count in zip(TYPES, types)},
+        "legalities": {card_format: int(count) for card_format, count in zip(FORMATS, legal)},
+    }
+
+
+class CollectionStatsCache:
+    """
+    Redis cache of the statistics of each version of a collection and of its card metadata:
+    new prices or metadata of its cards change the key. Entries expire after STATS_CACHE_TTL.
+    """
+    KEY_PREFIX = "stats:v2:"
+
+    def __init__(self, redis_client, ttl=STATS_CACHE_TTL):
+        self._redis = redis_client
+        self._ttl = ttl
+
+    def key(self, rows, cards_meta):
+        digest = hashlib.sha1(dumps(rows))
+        digest.update(b"\x00" + dumps(sorted(cards_meta.items(), key=lambda item: item[0])))
+
+        return self.KEY_PREFIX + digest.hexdigest()
+
+    def get(self, rows, cards_meta, compute):
+        """
+        :param cards_meta: dict of name to card metadata of the rows, see get_collection_stats
+        :param compute: function computing the statistics on a cache miss
+        """
+        key = self.key(rows, cards_meta)
+        try:
+            cached = self._redis.get(key)
+        except redis.RedisError:
+            return compute()
+
+        if cached is not None:
+            return json.loads(cached.decode("utf-8"))
+
+        stats = compute()
+        try:
+            self._redis.set(key, dumps(stats), ex=self._ttl)
+        except redis.RedisError:
+            pass
+
+        return stats
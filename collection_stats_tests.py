@@ -0,0 +1,146 @@
+import unittest
+from unittest import mock
+import fakeredis
+from card_record import CardRecord, editions, conditions, languages, get_flags
+from collection_stats import get_collection_stats, CollectionStatsCache
+from deckbox_crawler import DeckboxCrawler
+from offline import OfflineTestCase
+
+CARDS_META = {
+    "Black Lotus": {"name": "Black Lotus", "cmc": 0, "type_line": "Artifact", "colors": [],
+                    "legalities": {"vintage": "restricted", "legacy": "banned"},
+                    "prices": {"usd": "10000.00", "usd_foil": None, "eur": "9000.00"}},
+    "Annul": {"name": "Annul", "cmc": 1, "type_line": "Instant", "colors": ["U"],
+              "legalities": {"modern": "legal", "pauper": "legal"}, "prices": {"usd": "0.10", "usd_foil": "1.50"}},
+    "Nicol Bolas, Planeswalker": {"name": "Nicol Bolas, Planeswalker", "cmc": 8,
+                                  "type_line": "Legendary Planeswalker — Bolas", "colors": ["U", "B", "R"],
+                                  "legalities": {"modern": "legal"}, "prices": {"usd": "5.00"}},
+    "Island": {"name": "Island", "cmc": 0, "type_line": "Basic Land — Island", "colors": [],
+               "legalities": {"modern": "legal"}, "prices": {}},
+    "Unknown Card": None,
+}
+
+
+def row(name, count=1, is_foil=False):
+    return {"name": name, "count": count, "is_foil": is_foil}
+
+
+class CollectionStatsTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def test_empty_collection(self):
+        self.assertEqual(get_collection_stats([], CARDS_META), {
+            "cards": 0,
+            "copies": 0,
+            "unknown_copies": 0,
+            "value": {"usd": 0.0, "eur": 0.0, "priced_copies": 0},
+            "average_cmc": 0.0,
+            "mana_curve": {"0": 0, "1": 0, "2": 0, "3": 0, "4": 0, "5": 0, "6": 0, "7+": 0},
+            "colors": {"W": 0, "U": 0, "B": 0, "R": 0, "G": 0, "colorless": 0, "multicolor": 0},
+            "types": {"Artifact": 0, "Battle": 0, "Creature": 0, "Enchantment": 0, "Instant": 0, "Land": 0,
+                      "Planeswalker": 0, "Sorcery": 0, "Tribal": 0},
+            "legalities": {"standard": 0, "pioneer": 0, "modern": 0, "legacy": 0, "vintage": 0, "commander": 0,
+                           "pauper": 0},
+        })
+
+    def test_unknown_cards(self):
+        stats = get_collection_stats([row("Unknown Card", 3), row("Not Looked Up")], CARDS_META)
+
+        self.assertEqual((stats["cards"], stats["copies"], stats["unknown_copies"]), (2, 4, 4))
+        self.assertEqual(stats["value"], {"usd": 0.0, "eur": 0.0, "priced_copies": 0})
+        self.assertEqual(stats["average_cmc"], 0.0)
+        self.assertEqual(sum(stats["mana_curve"].values()), 0)
+        self.assertEqual(stats["colors"]["colorless"], 0)
+
+    def test_collection(self):
+        rows = [row("Black Lotus"), row("Annul", 4), row("Annul", 2, is_foil=True), row("Nicol Bolas, Planeswalker"),
+                row("Island", 20), row("Unknown Card", 2)]
+        stats = get_collection_stats(rows, CARDS_META)
+
+        self.assertEqual((stats["cards"], stats["copies"], stats["unknown_copies"]), (5, 30, 2))
+        self.assertEqual(stats["value"], {"usd": 10008.4, "eur": 9000.0, "priced_copies": 8})
+        # Lands and unknown cards are not spells
+        self.assertEqual(stats["average_cmc"], round((0 + 6 * 1 + 8) / 8, 2))
+        self.assertEqual(stats["mana_curve"], {"0": 1, "1": 6, "2": 0, "3": 0, "4": 0, "5": 0, "6": 0, "7+": 1})
+        self.assertEqual(stats["colors"], {"W": 0, "U": 7, "B": 1, "R": 1, "G": 0, "colorless": 1, "multicolor": 1})
+        self.assertEqual(stats["types"]["Instant"], 6)
+        self.assertEqual(stats["types"]["Land"], 20)
+        self.assertEqual(stats["types"]["Planeswalker"], 1)
+        self.assertEqual(stats["legalities"], {"standard": 0, "pioneer": 0, "modern": 27, "legacy": 0, "vintage": 1,
+                                               "commander": 0, "pauper": 6})
+
+    def test_invalid_counts(self):
+        stats = get_collection_stats([{"name": "Annul", "count": "x"}, {"name": "Annul", "count": None}], CARDS_META)
+
+        self.assertEqual(stats["copies"], 2)
+
+    def test_records(self):
+        records = [CardRecord("1", 2, "Annul", editions.get("M11", "Magic 2011"), conditions.get("NM", "Near Mint"),
+                              languages.get("en", "English"), get_flags(True)),
+                   CardRecord("2", 1, "Unknown Card", None, None, None)]
+
+        self.assertEqual(get_collection_stats(records, CARDS_META),
+                         get_collection_stats([record.to_dict() for record in records], CARDS_META))
+
+
+class CollectionStatsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.stats_cache = CollectionStatsCache(self.redis, ttl=60)
+
+    def test_cached_per_version(self):
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return {"copies": len(computed)}
+
+        rows = [row("Annul", 4)]
+        cards_meta = {"Annul": CARDS_META["Annul"]}
+        self.assertEqual(self.stats_cache.get(rows, cards_meta, compute), {"copies": 1})
+        self.assertEqual(self.stats_cache.get([row("Annul", 4)], dict(cards_meta), compute), {"copies": 1})
+        self.assertTrue(0 < self.redis.ttl(self.stats_cache.key(rows, cards_meta)) <= 60)
+
+        self.assertEqual(self.stats_cache.get([row("Annul", 3)], cards_meta, compute), {"copies": 2})
+
+    def test_cached_per_prices(self):
+        rows = [row("Annul", 4)]
+        cards_meta = {"Annul": CARDS_META["Annul"]}
+        new_prices = {"Annul": dict(CARDS_META["Annul"], prices={"usd": "0.25"})}
+
+        self.assertEqual(self.stats_cache.get(rows, cards_meta, lambda: {"value": 0.4}), {"value": 0.4})
+        self.assertEqual(self.stats_cache.get(rows, new_prices, lambda: {"value": 1.0}), {"value": 1.0})
+        self.assertEqual(self.stats_cache.get(rows, {"Annul": None}, lambda: {"value": 0}), {"value": 0})
+        self.assertEqual(self.stats_cache.get(rows, cards_meta, lambda: {"value": -1}), {"value": 0.4})
+
+
+class CollectionStatsEndpointTestCase(OfflineTestCase):
+
+    def test_pages_are_crawled_once(self):
+        page_cache = DeckboxCrawler.page_cache
+        with mock.patch.object(page_cache, "get", mock.Mock(wraps=page_cache.get)):
+            status, stats = self.getJson("/api/users/" + self.test_username + "/inventory/stats")
+            set_urls = [call[0][0] for call in page_cache.get.call_args_list if "/sets/" in call[0][0]]
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(set_urls), 3)
+        self.assertEqual(len(set(set_urls)), 3)
+        # The inventory snapshot has 100 rows on each of its 3 pages
+        self.assertEqual(stats["copies"], 3 * sum(int(card["count"]) for card in self.getFirstPageCards()))
+
+    def test_deck(self):
+        status, stats = self.getJson("/api/users/" + self.test_username + "/sets/608751/stats")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(stats["id"], "608751")
+        self.assertGreater(stats["copies"], 0)
+
+    def getFirstPageCards(self):
+        return self.getJson("/api/users/" + self.test_username + "/inventory")[1]["items"]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Snapshots of user collections (inventory, tradelist, wishlist) for incremental sync.
+Each snapshot keeps the parsed rows keyed by Deckbox row id, with the version
+they were added and last changed at, and the versions rows were removed at
+(tombstones). A client sends back the token of its last sync and gets the rows
+added, changed and removed since.
+
+Tokens are "<epoch>.<version>": the epoch identifies the snapshot, a token of
+an expired snapshot or older than the pruned tombstones asks for a full resync.
+"""
+import os, time, json, hashlib
+from json_encoder import dumps
+
+SYNC_SNAPSHOT_TTL = int(os.environ.get("SYNC_SNAPSHOT_TTL", 30 * 24 * 3600))
+SYNC_MAX_TOMBSTONES = int(os.environ.get("SYNC_MAX_TOMBSTONES", 10000))
+
+
+def get_token(epoch, version):
+    return "{}.{}".format(epoch, version)
+
+
+def parse_token(token):
+    """
+    :return: (epoch, version) tuple, None if the token is invalid
+    """
+    try:
+        epoch, version = token.split(".")
+        return int(epoch), int(version)
+    except (AttributeError, ValueError):
+        return None
+
+
+class CollectionSnapshots:
+    KEY_PREFIX = "sync:v1:"
+
+    def __init__(self, redis_client, ttl=SYNC_SNAPSHOT_TTL, max_tombstones=SYNC_MAX_TOMBSTONES):
+        self._redis = redis_client
+        self._ttl = ttl
+        self._max_tombstones = max_tombstones
+
+    def get_keys(self, username, set_name):
+        prefix = self.KEY_PREFIX + username.lower() + ":" + set_name + ":"
+
+        return prefix + "meta", prefix + "rows", prefix + "removed"
+
+    def update(self, username, set_name, rows):
+        """
+        Compare the rows of a full crawl with the snapshot and store the differences as a new version
+        :param rows: parsed rows, with their Deckbox "id"
+        :return: token of the snapshot version
+        """
+        meta_key, rows_key, removed_key = self.get_keys(username, set_name)
+        meta = self._redis.hgetall(meta_key)
+        if meta:
+            epoch, version = int(meta[b"epoch"]), int(meta[b"version"])
+            stored = {row_id.decode("utf-8"): json.loads(entry.decode("utf-8"))
+                      for row_id, entry in self._redis.hgetall(rows_key).items()}
+        else:
+            epoch, version, stored = int(time.time() * 1000), 0, {}
+
+        new_version = version + 1
+        current = {row["id"]: row for row in rows if row.get("id")}
+        writes = {}
+        for row_id, row in current.items():
+            row_hash = hashlib.sha1(dumps(row)).hexdigest()
+            previous = stored.get(row_id)
+            if previous is None:
+                writes[row_id] = {"added": new_version, "version": new_version, "hash": row_hash, "row": row}
+            elif previous["hash"] != row_hash:
+                writes[row_id] = {"added": previous["added"], "version": new_version, "hash": row_hash, "row": row}
+        removed = [row_id for row_id in stored if row_id not in current]
+
+        pipe = self._redis.pipeline()
+        if writes or removed or not meta:
+            version = new_version
+            if writes:
+                pipe.hmset(rows_key, {row_id: dumps(entry) for row_id, entry in writes.items()})
+                pipe.zrem(removed_key, *writes)
+            if removed:
+                pipe.hdel(rows_key, *removed)
+                pipe.zadd(removed_key, **{row_id: version for row_id in removed})
+            pipe.hmset(meta_key, {"epoch": epoch, "version": version, "synced_at": time.time()})
+        for key in (meta_key, rows_key, removed_key):
+            pipe.expire(key, self._ttl)
+        pipe.execute()
+
+        self.prune_tombstones(meta_key, removed_key)
+
+        return get_token(epoch, version)
+
+    def prune_tombstones(self, meta_key, removed_key):
+        """
+        Drop the oldest tombstones, older tokens then get a full resync
+        """
+        excess = self._redis.zcard(removed_key) - self._max_tombstones
+        if excess <= 0:
+            return
+
+        pruned = self._redis.zrange(removed_key, 0, excess - 1, withscores=True)
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyrank(removed_key, 0, excess - 1)
+        pipe.hset(meta_key, "min_version", int(pruned[-1][1]))
+        pipe.execute()
+
+    def get_changes(self, username, set_name, since=None):
+        """
+        :param since: token of the last sync, None for all the rows
+        :return: dict with the rows added and changed, the removed row ids, and the current token.
+        reset is True when the token can't be used and all the rows are returned as added.
+        """
+        meta_key, rows_key, removed_key = self.get_keys(username, set_name)
+        since = parse_token(since)
+        since_version = since[1] if since else 0
+
+        # Read the snapshot at once, another request can update it meanwhile
+        pipe = self._redis.pipeline()
+        pipe.hgetall(meta_key)
+        pipe.hvals(rows_key)
+        pipe.zrangebyscore(removed_key, "({}".format(since_version), "+inf")
+        meta, entries, removed = pipe.execute()
+
+        epoch, version = int(meta[b"epoch"]), int(meta[b"version"])
+        min_version = int(meta.get(b"min_version", 0))
+        entries = [json.loads(entry.decode("utf-8")) for entry in entries]
+        entries.sort(key=lambda entry: (entry["row"]["name"], entry["row"]["id"]))
+
+        reset = since is None or since[0] != epoch or not min_version <= since_version <= version
+        if reset:
+            added, changed, removed = [entry["row"] for entry in entries], [], []
+        else:
+            added = [entry["row"] for entry in entries if entry["added"] > since_version]
+            changed = [entry["row"] for entry in entries
+                       if entry["version"] > since_version >= entry["added"]]
+            removed = [row_id.decode("utf-8") for row_id in removed]
+
+        return {
+            "token": get_token(epoch, version),
+            "reset": reset,
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+        }
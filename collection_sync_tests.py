@@ -0,0 +1,112 @@
+import unittest
+import fakeredis
+from collection_sync import CollectionSnapshots, get_token, parse_token
+
+
+def row(row_id, name, count=1):
+    return {"id": row_id, "name": name, "count": count}
+
+
+class CollectionSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.snapshots = CollectionSnapshots(self.redis, ttl=3600, max_tombstones=3)
+        self.test_username = "deckbox_api"
+        self.rows = [row("1", "Black Lotus"), row("2", "Annul", 4), row("3", "Counterspell")]
+
+    def update(self, rows):
+        return self.snapshots.update(self.test_username, "inventory", rows)
+
+    def getChanges(self, since=None):
+        return self.snapshots.get_changes(self.test_username, "inventory", since)
+
+    def test_tokens(self):
+        self.assertEqual(get_token(1500000000000, 3), "1500000000000.3")
+        self.assertEqual(parse_token("1500000000000.3"), (1500000000000, 3))
+        for token in (None, "", "3", "a.b", "1.2.3"):
+            self.assertIsNone(parse_token(token))
+
+    def test_first_sync(self):
+        token = self.update(self.rows)
+        changes = self.getChanges()
+
+        self.assertEqual(changes["token"], token)
+        self.assertTrue(changes["reset"])
+        self.assertEqual(changes["added"], sorted(self.rows, key=lambda r: r["name"]))
+        self.assertEqual((changes["changed"], changes["removed"]), ([], []))
+
+    def test_no_changes(self):
+        token = self.update(self.rows)
+
+        self.assertEqual(self.update(list(reversed(self.rows))), token)
+        self.assertEqual(self.getChanges(token), {"token": token, "reset": False, "added": [], "changed": [],
+                                                  "removed": []})
+
+    def test_changes(self):
+        first = self.update(self.rows)
+        second = self.update([row("1", "Black Lotus", 2), row("2", "Annul", 4), row("4", "Dark Ritual")])
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.getChanges(first), {
+            "token": second,
+            "reset": False,
+            "added": [row("4", "Dark Ritual")],
+            "changed": [row("1", "Black Lotus", 2)],
+            "removed": ["3"],
+        })
+
+        # A row added and changed since the token is only added
+        third = self.update([row("1", "Black Lotus", 2), row("2", "Annul", 4), row("4", "Dark Ritual", 3)])
+        changes = self.getChanges(first)
+        self.assertEqual((changes["added"], changes["changed"]), ([row("4", "Dark Ritual", 3)],
+                                                                 [row("1", "Black Lotus", 2)]))
+        self.assertEqual(self.getChanges(second)["changed"], [row("4", "Dark Ritual", 3)])
+        self.assertEqual(self.getChanges(third)["changed"], [])
+
+    def test_readded_row(self):
+        first = self.update(self.rows)
+        self.update(self.rows[1:])
+        third = self.update(self.rows)
+
+        # Its tombstone is dropped, the row is added again
+        changes = self.getChanges(first)
+        self.assertEqual((changes["added"], changes["changed"], changes["removed"]), ([row("1", "Black Lotus")], [], []))
+        self.assertEqual(self.getChanges(third)["removed"], [])
+
+    def test_invalid_tokens(self):
+        token = self.update(self.rows)
+        epoch, version = parse_token(token)
+
+        for since in ("invalid", get_token(epoch + 1, version), get_token(epoch, version + 1)):
+            changes = self.getChanges(since)
+            self.assertTrue(changes["reset"])
+            self.assertEqual(len(changes["added"]), 3)
+            self.assertEqual(changes["token"], token)
+
+    def test_pruned_tombstones(self):
+        rows = [row(str(i), "Card {}".format(i)) for i in range(10)]
+        first = self.update(rows)
+        second = self.update(rows[2:])
+        # Only the 3 most recent tombstones are kept
+        self.update(rows[4:])
+
+        self.assertEqual(self.redis.zcard(self.snapshots.get_keys(self.test_username, "inventory")[2]), 3)
+        self.assertTrue(self.getChanges(first)["reset"])
+        changes = self.getChanges(second)
+        self.assertFalse(changes["reset"])
+        self.assertEqual(sorted(changes["removed"]), ["2", "3"])
+
+    def test_snapshots_are_per_set(self):
+        self.update(self.rows)
+
+        changes = self.snapshots.get_changes("Deckbox_API", "inventory")
+        self.assertEqual(len(changes["added"]), 3)
+        token = self.snapshots.update(self.test_username, "wishlist", self.rows[:1])
+        self.assertEqual(len(self.snapshots.get_changes(self.test_username, "wishlist", token)["added"]), 0)
+        self.assertEqual(len(self.snapshots.get_changes(self.test_username, "wishlist")["added"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
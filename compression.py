@@ -0,0 +1,105 @@
+"""
+Response compression negotiated with the Accept-Encoding header: brotli when
+the brotli package is installed, gzip otherwise. Small responses are sent as is.
+Large compressed bodies are cached in Redis by content hash, the same cached
+pages and card metadata produce the same responses, which are then compressed once.
+"""
+import os, gzip, hashlib
+import redis
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+# Below this size compressing again is cheaper than a Redis round trip
+COMPRESSION_CACHE_MIN_SIZE = int(os.environ.get("COMPRESSION_CACHE_MIN_SIZE", 16 * 1024))
+COMPRESSION_CACHE_TTL = int(os.environ.get("COMPRESSION_CACHE_TTL", 600))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+}
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+def get_encodings():
+    """
+    :return: supported encodings, preferred first
+    """
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+class ResponseCompressor:
+    """
+    :param redis_client: cache for the compressed bodies, None to disable it
+    """
+    KEY_PREFIX = "compressed:v1:"
+
+    def __init__(self, redis_client, min_size=COMPRESSION_MIN_SIZE, cache_min_size=COMPRESSION_CACHE_MIN_SIZE,
+                 cache_ttl=COMPRESSION_CACHE_TTL):
+        self._redis = redis_client
+        self._min_size = min_size
+        self._cache_min_size = cache_min_size
+        self._cache_ttl = cache_ttl
+        self.encodings = get_encodings()
+
+    def negotiate(self, accept_encodings):
+        """
+        :param accept_encodings: werkzeug Accept of the Accept-Encoding header
+        :return: the encoding to use, None if the client doesn't accept any
+        """
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+
+        return best
+
+    def compress_response(self, response, accept_encodings):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate(accept_encodings)
+        body = response.get_data()
+        if encoding is None or len(body) < self._min_size:
+            return response
+
+        response.set_data(self.get_compressed(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    def get_compressed(self, body, encoding):
+        if self._redis is None or len(body) < self._cache_min_size:
+            return compress(body, encoding)
+
+        key = self.KEY_PREFIX + encoding + ":" + hashlib.sha1(body).hexdigest()
+        try:
+            compressed = self._redis.get(key)
+        except redis.RedisError:
+            return compress(body, encoding)
+
+        if compressed is None:
+            compressed = compress(body, encoding)
+            try:
+                self._redis.set(key, compressed, ex=self._cache_ttl)
+            except redis.RedisError:
+                pass
+
+        return compressed
@@ -0,0 +1,90 @@
+import gzip, json, unittest
+from unittest import mock
+import brotli
+from werkzeug.http import parse_accept_header as accept
+import compression
+from compression import ResponseCompressor
+from offline import OfflineTestCase
+from singleflight_tests import BrokenRedis
+
+
+class CompressionTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/users/" + self.test_username + "/inventory"
+        self.compressor = ResponseCompressor(self.redis, min_size=1024, cache_min_size=16 * 1024, cache_ttl=600)
+
+    def test_negotiate(self):
+        self.assertEqual(self.compressor.negotiate(accept("gzip, deflate, br")), "br")
+        self.assertEqual(self.compressor.negotiate(accept("gzip, br;q=0.5")), "gzip")
+        self.assertEqual(self.compressor.negotiate(accept("gzip, br;q=0")), "gzip")
+        self.assertEqual(self.compressor.negotiate(accept("*")), "br")
+        self.assertIsNone(self.compressor.negotiate(accept("identity")))
+
+    def test_compressed_responses(self):
+        identity = self.get(self.url, {"Accept-Encoding": "identity"})
+        self.assertIsNone(identity.headers.get("Content-Encoding"))
+        self.assertIn("Accept-Encoding", identity.headers["Vary"])
+
+        for encoding, decompress in (("br", brotli.decompress), ("gzip", gzip.decompress)):
+            with self.subTest(encoding=encoding):
+                response = self.get(self.url, {"Accept-Encoding": encoding})
+
+                self.assertEqual(response.headers["Content-Encoding"], encoding)
+                self.assertIn("Accept-Encoding", response.headers["Vary"])
+                self.assertEqual(decompress(response.get_data()), identity.get_data())
+                self.assertLess(len(response.get_data()), len(identity.get_data()))
+
+    def test_small_responses(self):
+        # fakeredis has no CLIENT command
+        with mock.patch.object(self.redis, "client_list", return_value=[]):
+            response = self.get("/status", {"Accept-Encoding": "gzip, br"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+        self.assertEqual(json.loads(response.get_data(as_text=True))["redis"]["connection"], "ok")
+
+    def test_errors_are_not_compressed(self):
+        response = self.get("/api/users/" + self.test_username + "/sets/unknown", {"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+
+    def test_compressed_body_cache(self):
+        body = json.dumps([{"name": "Card {}".format(i)} for i in range(2000)]).encode("utf-8")
+
+        with mock.patch.object(compression, "compress", mock.Mock(wraps=compression.compress)) as compress:
+            compressed = self.compressor.get_compressed(body, "gzip")
+            self.assertEqual(self.compressor.get_compressed(body, "gzip"), compressed)
+            self.assertEqual(compress.call_count, 1)
+
+            # Per encoding
+            self.assertEqual(brotli.decompress(self.compressor.get_compressed(body, "br")), body)
+            self.assertEqual(compress.call_count, 2)
+
+            # Small bodies are compressed again rather than cached
+            self.compressor.get_compressed(body[:1024], "gzip")
+            self.compressor.get_compressed(body[:1024], "gzip")
+            self.assertEqual(compress.call_count, 4)
+
+        self.assertEqual(gzip.decompress(compressed), body)
+        self.assertEqual(len(self.redis.keys(ResponseCompressor.KEY_PREFIX + "*")), 2)
+
+    def test_cached_compressed_responses(self):
+        first = self.get(self.url + "?page=all", {"Accept-Encoding": "br"})
+
+        with mock.patch.object(compression, "compress") as compress:
+            second = self.get(self.url + "?page=all", {"Accept-Encoding": "br"})
+
+        compress.assert_not_called()
+        self.assertEqual(second.get_data(), first.get_data())
+
+    def test_redis_errors(self):
+        compressor = ResponseCompressor(BrokenRedis(), cache_min_size=0)
+
+        self.assertEqual(gzip.decompress(compressor.get_compressed(b"page" * 100, "gzip")), b"page" * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
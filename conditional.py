@@ -0,0 +1,68 @@
+"""
+Validators for conditional requests (If-None-Match / If-Modified-Since).
+ETags are a hash of the crawled data, with the card metadata it is extended with,
+computed before it is serialized, so a request for unchanged data can be answered
+with a 304 right away.
+ETags are weak, compressed and uncompressed bodies share them.
+"""
+import os, time, calendar, hashlib
+import redis
+from json_encoder import dumps
+
+VALIDATORS_TTL = int(os.environ.get("VALIDATORS_TTL", 7 * 24 * 3600))
+# Responses of a new release can differ for the same data
+VALIDATORS_VERSION = os.environ.get("HEROKU_SLUG_COMMIT", "")
+
+
+def get_etag(data, *parts):
+    """
+    :param parts: strings the response also depends on (path and query string...)
+    """
+    etag = hashlib.sha1(dumps(data))
+    for part in parts + (VALIDATORS_VERSION,):
+        etag.update(b"\x00" + part.encode("utf-8"))
+
+    return etag.hexdigest()
+
+
+class ValidatorCache:
+    """
+    Redis store of the last ETag of each request, its Last-Modified date is the time the ETag last changed
+    """
+    KEY_PREFIX = "validators:v1:"
+
+    def __init__(self, redis_client, ttl=VALIDATORS_TTL):
+        self._redis = redis_client
+        self._ttl = ttl
+
+    def get_last_modified(self, request_key, etag):
+        """
+        :return: timestamp, None if it couldn't be stored
+        """
+        key = self.KEY_PREFIX + hashlib.sha1(request_key.encode("utf-8")).hexdigest()
+
+        try:
+            entry = self._redis.hgetall(key)
+            if entry.get(b"etag") == etag.encode("utf-8"):
+                return float(entry[b"last_modified"])
+
+            last_modified = int(time.time())
+            pipe = self._redis.pipeline()
+            pipe.hmset(key, {"etag": etag, "last_modified": last_modified})
+            pipe.expire(key, self._ttl)
+            pipe.execute()
+        except redis.RedisError:
+            return None
+
+        return last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    # If-Modified-Since is ignored when If-None-Match is sent (RFC 7232)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and last_modified is not None:
+        return calendar.timegm(request.if_modified_since.utctimetuple()) >= int(last_modified)
+
+    return False
@@ -0,0 +1,54 @@
+import unittest
+import api
+from offline import OfflineTestCase
+
+
+class ConditionalRequestsTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/users/" + self.test_username + "/inventory"
+
+    def poll(self, etag):
+        return self.get(self.url, headers={"If-None-Match": etag})
+
+    def test_repeated_poll(self):
+        # The metadata of the first response is resolved from Scryfall, then read from the cache
+        first = self.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.headers["ETag"].startswith('W/"'))
+
+        for encoding in ("identity", "gzip", "br"):
+            response = self.get(self.url, headers={"If-None-Match": first.headers["ETag"], "Accept-Encoding": encoding})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(), b"")
+
+    def test_unrelated_card_cache_write(self):
+        etag = self.get(self.url).headers["ETag"]
+
+        self.assertEqual(self.get("/api/cards/Counterspell").status_code, 200)
+        self.assertEqual(self.poll(etag).status_code, 304)
+
+    def test_metadata_change(self):
+        first = self.get(self.url)
+        name = self.getJson(self.url)[1]["items"][0]["name"]
+        meta = api.card_meta_cache.get_many([name])[name]
+
+        # New metadata for a card of the response
+        api.card_meta_cache.set_many([dict(meta, cmc=meta["cmc"] + 1)])
+
+        response = self.poll(first.headers["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(self.poll(response.headers["ETag"]).status_code, 304)
+
+    def test_crawled_data_change(self):
+        etag = self.get(self.url).headers["ETag"]
+
+        response = self.get(self.url + "?page=2", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
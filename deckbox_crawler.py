@@ -1,9 +1,17 @@
-import re, datetime, urllib.parse, base64, json
+import os, re, datetime, urllib.parse, base64, json
 from pyquery import PyQuery
+import http_client
+import deckbox_parser
+from metrics import metrics
+from page_cache import PageDownloadError, get_body
+from set_list_cache import find_set
+
+# Deckbox base url, can point to a local stand-in server (see loadtest/fake_upstream.py)
+DECKBOX_URL = urllib.parse.urlsplit(os.environ.get("DECKBOX_URL", "https://deckbox.org"))
 
 class DeckboxCrawler:
-    _HTTP           = "https://"
-    _DECKBOX_DOMAIN = "deckbox.org"
+    _HTTP           = DECKBOX_URL.scheme + "://"
+    _DECKBOX_DOMAIN = DECKBOX_URL.netloc
 
     _ORDER_BY_PARAMETER = 's'
     _ORDER_BY_LIST = {
@@ -27,11 +35,30 @@ class DeckboxCrawler:
     _CARDS_QUERY_SEPARATOR = "!"
     _TOOLTIP = "/mtg/<cardname>/tooltip"
 
+    # page_cache.PageCache instance, set by the application
+    page_cache = None
+    # set_list_cache.SetListCache instance, set by the application
+    set_list_cache = None
+
     def __init__(self, username):
-        page_url = self._HTTP + urllib.parse.quote("{}/users/{}".format(self._DECKBOX_DOMAIN, username))
-        self.getPage(page_url)
+        # Pages are only fetched by the operations needing them
+        self._username = username
+        self._page_url = None
+        self._page = None
+
+    @classmethod
+    def fromPage(cls, username, page_url, html):
+        """
+        Build a crawler on an already downloaded page, without fetching anything
+        """
+        crawler = cls.__new__(cls)
+        crawler._username = username
+        crawler.loadPage(page_url, html)
+
+        return crawler
 
     def getUserProfile(self):
+        self.loadUserPage()
         details = [h.text() for h in self._page(".dl_with_img .details dd").items()]
         #Parse last seen online date
         details[2] = int(re.search(', ([0-9]+), ', details[2]).group(1))
@@ -50,7 +77,7 @@ class DeckboxCrawler:
         }
 
     def getUserFriends(self):
-        self.getPage(self._page_url + "/friends")
+        self.getPage(self.getUserUrl(self._username) + "/friends")
 
         friends = []
 
@@ -74,6 +101,7 @@ class DeckboxCrawler:
         return friends
 
     def getUserSets(self, set_id = None):
+        self.loadUserPage()
         sets = []
 
         #Get all sets
@@ -90,33 +118,49 @@ class DeckboxCrawler:
             else:
                 current_set["name"] = a.attr("data-title")
 
-            if set_id and (set_id == current_set["id"] or set_id == current_set["name"]):
-                return current_set
-
             sets.append(current_set)
 
-        # Should already have returned the specified set
+        if self.set_list_cache and sets:
+            self.set_list_cache.set(self._username, sets)
+
         if set_id:
-            return None
+            return find_set(sets, set_id)
 
         return sets
 
+    def findUserSet(self, set_id):
+        """
+        Find a set of the user in the cached set list, then on the user page
+        :return: (set, cached) tuple, set is None if the user doesn't have it
+        """
+        cached_sets = self.set_list_cache.get(self._username) if self.set_list_cache else None
+        set_object = find_set(cached_sets, set_id) if cached_sets else None
+        if set_object is not None:
+            return set_object, True
+
+        return self.getUserSets(set_id), False
+
     def getUserSetCards(self, set_id, page=1, order_by='name', order='asc'):
-        set_object = self.getUserSets(set_id)
+        set_object, cached = self.findUserSet(set_id)
+
+        if set_object is not None:
+            self.getPage(self.getSetUrl(set_object["id"], page, order_by, order))
+
+            if cached and self.getPageType() == "unknown":
+                # The set was deleted since the set list was cached
+                self.set_list_cache.delete(self._username)
+                set_object = self.getUserSets(set_id)
+                if set_object is not None:
+                    self.getPage(self.getSetUrl(set_object["id"], page, order_by, order))
 
         if set_object == None:
             return {"status": "error", "description": "The user doesn't have the specified set."}
 
-        parameters = {}
-        parameters['p'] = str(page)
-        parameters[self._ORDER_BY_PARAMETER] = self._ORDER_BY_LIST[order_by] if order_by in self._ORDER_BY_LIST else 'name'
-        parameters[self._ORDER_PARAMETER] = self._ORDER_LIST[order] if order in self._ORDER_LIST else 'asc'
-
-        set_url  = self._HTTP + self._DECKBOX_DOMAIN + "/sets/" + set_object["id"] + "?" + urllib.parse.urlencode(parameters)
-        self.getPage(set_url)
         return {"id": set_id, **self.getCardsFromPage()}
 
     def getCards(self, page = 1, order_by = 'name', order = 'asc', filters = None):
+        if self._page is None:
+            self.loadUserPage()
         card_filters = self.getFiltersFromPage()
         parameters = {}
         parameters['p'] = str(page)
@@ -199,10 +243,63 @@ class DeckboxCrawler:
     def log(self, message):
         print("LOG - " + message)
 
+    @classmethod
+    def getUserUrl(cls, username):
+        return cls._HTTP + cls._DECKBOX_DOMAIN + urllib.parse.quote("/users/{}".format(username))
+
+    @classmethod
+    def getSetUrl(cls, set_id, page=1, order_by='name', order='asc'):
+        parameters = {}
+        parameters['p'] = str(page)
+        parameters[cls._ORDER_BY_PARAMETER] = cls._ORDER_BY_LIST[order_by] if order_by in cls._ORDER_BY_LIST else 'name'
+        parameters[cls._ORDER_PARAMETER] = cls._ORDER_LIST[order] if order in cls._ORDER_LIST else 'asc'
+
+        return cls._HTTP + cls._DECKBOX_DOMAIN + "/sets/" + set_id + "?" + urllib.parse.urlencode(parameters)
+
+    def loadUserPage(self):
+        """
+        Fetch the user page, unless it is the current page
+        """
+        user_url = self.getUserUrl(self._username)
+        if self._page_url != user_url:
+            self.getPage(user_url)
+
     def getPage(self, page_url):
         self.log("Get cards from url: " + page_url)
+        with metrics.timer("fetch"):
+            html = self.fetchPage(page_url)
+        with metrics.timer("parse"):
+            self.loadPage(page_url, html)
+
+    def loadPage(self, page_url, html):
         self._page_url = page_url
-        self._page = PyQuery(url=page_url)
+        self._page = PyQuery(html, parser='html')
+
+    def fetchPage(self, page_url):
+        try:
+            if self.page_cache:
+                return self.page_cache.get(page_url, self.downloadPage)
+
+            return get_body(page_url, self.downloadPage(page_url))
+        except PageDownloadError as e:
+            return self.getNotFoundPage(e)
+
+    @staticmethod
+    def getNotFoundPage(error):
+        """
+        Deckbox not found pages are parsed like any page without cards (unknown page type,
+        e.g. a deleted set), other errors are raised
+        """
+        if error.status_code != 404 or not error.body:
+            raise error
+
+        return error.body
+
+    def downloadPage(self, page_url, headers=None):
+        """
+        Download a page through the shared pooled HTTP session
+        """
+        return http_client.fetch(page_url, headers=headers)
 
     def getFiltersFromPage(self):
         filters = {}
@@ -232,15 +329,19 @@ class DeckboxCrawler:
         }
         return filters
 
-    def getCardsFromPage(self):
+    def getPageType(self):
         if self._page(".main.simple_table.with_details"):
-            page_type = "deck"
+            return "deck"
         elif self._page(".set_cards.with_details"):
-            page_type = "inventory"
+            return "inventory"
         elif self._page(".set_cards.simple_table"):
-            page_type = "cards"
-        else:
-            page_type = "unknown"
+            return "cards"
+
+        return "unknown"
+
+    @metrics.timed("parse")
+    def getCardsFromPage(self):
+        page_type = self.getPageType()
 
         cards, sideboard = self.getCardsFromTable(page_type)
 
@@ -301,175 +402,8 @@ class DeckboxCrawler:
     # Cards Parser
     #-------------------------
     def getCardsFromTable(self, page_type):
-        cards       = []
-        sideboard   = []
-
-        # Parse cards on deck page
-        if page_type == "deck":
-            tables = {
-                "mainboard": self._page(".main.simple_table.with_details tr").items(),
-                "sideboard": self._page(".sideboard.simple_table.with_details tr").items()
-            }
-            for table_type, table in tables.items():
-                for tr in table:
-                    if tr.attr("id") == None:
-                        continue
-
-                    '''
-                    Deck card HTML example:
-                    <tr id="13008_main">
-                        <td class="card_count">1</td>
-                        <td class="card_name">
-                            <a class="simple" href="https://deckbox.org/mtg/Phantom%20General" target="_blank">Phantom General</a>
-                        </td>
-                        <td>Creature  - Spirit Soldier</td>
-                        <td class="center"><img class="mtg_mana mtg_mana_3" src="/images/icon_spacer.gif"><img class="mtg_mana mtg_mana_W" src="/images/icon_spacer.gif"></td>
-                        <td class="center"><div class="mtg_edition_container " onclick="">
-                               <img src="/images/mtg/editions/RTR_U.jpg" data-title="Last Important Printing - Return to Ravnica" class="">
-                             </div></td>
-                        <td class="center minimum_width">$0.22</td>
-                    </tr>
-                    '''
-
-                    card = {}
-                    card["count"]   = tr.find("td.card_count").text()
-                    card["name"]    = tr.find("a").text()
-                    # card["tooltip"] = self._HTTP + self._DECKBOX_DOMAIN + self._TOOLTIP.replace("<cardname>", urllib.parse.quote(card["name"]))
-                    # card_types = re.split(r'\s+-\s+', tr.find("td").eq(2).text())
-                    # card["types"]   = re.split(r'\s', card_types[0]) if len(card_types) > 1 else card_types
-                    # card["subtypes"]= re.split(r'\s', card_types[1]) if len(card_types) > 1 else []
-                    # card_cost = []
-                    # for img in tr.find("td").eq(3).find('img').items():
-                    #     card_cost.append(re.sub("(mtg_mana |mtg_mana_)", "", img.attr("class")))
-                    # card["cost"]    = "".join(card_cost)
-
-                    {
-                        "mainboard": cards,
-                        "sideboard": sideboard,
-                    }.get(table_type).append(card)
-
-        # Parse cards on default set (inventory, wishlist, tradelist) page
-        elif page_type == "cards":
-            for tr in self._page(".set_cards.simple_table tr").items():
-                if tr.attr("id") == None:
-                    continue
-
-                '''
-                Default card HTML example:
-                <tr id="7730" >
-                    <td class="card_name">
-                      <div class="relative">
-                        <a class="simple" target="_blank" href="http://deckbox.org/mtg/Annul">Annul</a>
-                      </div>
-                    </td>
-                    <td><span>Instant</span></td>
-                    <td class="card_cost"><img class="mtg_mana mtg_mana_U" src="/images/icon_spacer.gif" /></td>
-                    <td class="center price"><span data-title="$0.03 / $0.14 / $0.43 / $0.68">$0.14</span></td>
-                </tr>
-                '''
-
-                card = {}
-                card["name"]    = tr.find("a").text()
-                card["tooltip"] = self._HTTP + self._DECKBOX_DOMAIN + self._TOOLTIP.replace("<cardname>", urllib.parse.quote(card["name"]))
-                card_types  = re.split(r'\s+-\s+', tr.find("td").eq(1).find("span").text())
-                card["types"]   = re.split(r'\s', card_types[0]) if len(card_types) > 1 else card_types
-                card["subtypes"]= re.split(r'\s', card_types[1]) if len(card_types) > 1 else []
-                card_cost = []
-                for img in tr.find("td.card_cost img").items():
-                    card_cost.append(re.sub("(mtg_mana |mtg_mana_)", "", img.attr("class")))
-                card["cost"]    = "".join(card_cost)
-
-                cards.append(card)
-        # Parse cards on default set (inventory, wishlist, tradelist) page
-        else:
-            for tr in self._page("#set_cards_table_details tr").items():
-                if tr.attr("id") == None:
-                    continue
-
-                '''
-                Default set card HTML example:
-                <tr class="" id="734306" onclick="">
-                    <td class="inventory_count card_count">1</td>
-                    <td>
-                        <a class="simple" href="https://deckbox.org/mtg/Abhorrent%20Overlord?printing=21860&amp;lang=us" target="_blank">
-                            Abhorrent Overlord
-                        </a>
-                    </td>
-                    <td class="center minimum_width">$0.29</td>
-                    <td class="minimum_width">
-                        <div class="mtg_edition_container " onclick="">
-                            <img src="/images/mtg/editions/THS_R.jpg" data-title="Theros (Card #75)" class="">
-                        </div>
-                    <img src="/images/icon_spacer.gif" class="sprite s_star2" data-title="Near Mint">
-                    <img src="/images/icon_spacer_16_11.png" class="flag flag-us" data-title="English"></td>
-                    <td class="minimum_width">Creature  - Demon</td>
-                </tr>
-
-                <tr id="734306" class="even">
-                    <td id="card_count_734306" class="card_count">1</td>
-                    <td>
-                      <a class="simple" target="_blank" href="http://deckbox.org/mtg/Abhorrent Overlord" data-tt="http://deckbox.org//system/images/mtg/cards/373661.jpg">
-                        Abhorrent Overlord
-                      </a>
-                    </td>
-                    <td class="details_col">
-                        <span class="mtg_edition_price">
-                            <span data-title="$0.10 / $0.28 / $1.45 / $0.94">$0.28</span>
-                        </span>
-                        <div class="mtg_edition_container">
-                            <img src="/images/mtg/editions/THS_R.jpg" data-title="Theros" class="">
-                        </div>
-                        <img src="/images/icon_spacer.gif" class="sprite s_star2 " data-title="Near Mint">
-                        <img src="/images/icon_spacer_16_11.gif" class="flag flag-us" data-title="English">
-                        <img src="/images/icon_spacer.gif" class="sprite s_colors " data-title="Foil">
-                    </td>
-                    <td class="type_line minimum_width">Creature  - Demon</td>
-                    <td class="mana_cost minimum_width">
-                        <img class="mtg_mana mtg_mana_5" src="/images/icon_spacer.gif">
-                        <img class="mtg_mana mtg_mana_B" src="/images/icon_spacer.gif">
-                        <img class="mtg_mana mtg_mana_B" src="/images/icon_spacer.gif">
-                    </td>
-                </tr>
-                '''
-
-                card = {}
-                card["count"]   = tr.find("td.card_count").text()
-                card["name"]    = tr.find("a").text()
-                # card["tooltip"] = self._HTTP + self._DECKBOX_DOMAIN + self._TOOLTIP.replace("<cardname>", urllib.parse.quote(card["name"]))
-
-                edition_container = tr.find(".mtg_edition_container img")
-                card["edition"] = {}
-                try:
-                    card["edition"]["code"] = re.search(".*/(.*)_.\.jpg$", edition_container.attr("src")).group(1),
-                except:
-                    card["edition"]["code"] = None
-
-                card["edition"]["name"] = edition_container.attr("data-title")
-
-                # card["rarity"]  = re.search(".*_(.)\.jpg$", edition_container.attr("src")).group(1)
-
-                card["condition"] = {
-                    "code": re.sub("(sprite |\s)", "", tr.find(".sprite:first").attr("class")),
-                    "name": tr.find(".sprite:first").attr("data-title")
-                } if tr.find(".sprite:first") else {"code": None, "name": None}
-                card["is_foil"]     = True if tr.find(".sprite.s_colors") else False
-                card["is_promo"]    = True if tr.find(".sprite.s_rosette") else False
-                card["is_textless"] = True if tr.find(".sprite.s_square") else False
-                card["is_signed"]   = True if tr.find(".sprite.s_letter") else False
-                card["lang"] = {
-                    "code": re.sub("(flag |\s)", "", tr.find(".flag").attr("class")),
-                    "name": tr.find(".flag").attr("data-title")
-                } if tr.find(".flag") else {"code": None, "name": None}
-
-                # card_types = re.split(r'\s+-\s+', tr.find("td").eq(3).text())
-                # card["types"]   = re.split(r'\s', card_types[0]) if len(card_types) > 1 else card_types
-                # card["subtypes"]= re.split(r'\s', card_types[1]) if len(card_types) > 1 else []
-
-                # card_cost = []
-                # for img in tr.find("td.mana_cost img").items():
-                #     card_cost.append(re.sub("(mtg_mana |mtg_mana_)", "", img.attr("class")))
-                # card["cost"]    = "".join(card_cost)
-
-                cards.append(card)
-
-        return (cards, sideboard)
+        return deckbox_parser.parse_cards_table(
+            self._page[0],
+            page_type,
+            self._HTTP + self._DECKBOX_DOMAIN + self._TOOLTIP
+        )
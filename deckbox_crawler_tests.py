@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+from flask import Response
+import http_client
+from loadtest import fake_upstream
+from deckbox_crawler import DeckboxCrawler
+from page_cache import PageCache
+from offline import OfflineTestCase
+
+NOT_FOUND_PAGE = "<html><body><h1>The page you were looking for doesn't exist.</h1></body></html>"
+fetch = fake_upstream.fetch
+
+
+class DeckboxCrawlerErrorsTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/users/" + self.test_username + "/inventory"
+
+    def fetchWithDeletedSet(self, url, **kwargs):
+        # Deckbox answers its not found page for the deleted set
+        if "/sets/1?" in url:
+            return fake_upstream.UpstreamResponse(url, Response(NOT_FOUND_PAGE, status=404))
+
+        return fetch(url, **kwargs)
+
+    def test_upstream_errors(self):
+        with mock.patch.dict(fake_upstream.app.config, ERROR_RATE=1), \
+                mock.patch.object(http_client, "HTTP_BACKOFF_FACTOR", 0):
+            self.assertEqual(self.get(self.url).status_code, 500)
+            self.assertEqual(self.get(self.url + "?page=all").status_code, 500)
+
+        # The error pages were neither parsed nor cached
+        self.assertIsNone(DeckboxCrawler.page_cache.get_cached(DeckboxCrawler.getUserUrl(self.test_username)))
+        self.assertEqual(self.redis.keys(PageCache.KEY_PREFIX + "*"), [])
+        self.assertEqual(self.get(self.url).status_code, 200)
+
+    def test_deleted_set(self):
+        # The inventory snapshot has 100 rows on each of its 3 pages
+        for url, rows in ((self.url, 100), (self.url + "?page=all", 300)):
+            with self.subTest(url=url):
+                DeckboxCrawler.set_list_cache.set(self.test_username, [{"id": "1", "name": "inventory"}])
+                # Used by the synchronous and the asynchronous crawlers
+                http_client.fetch.side_effect = self.fetchWithDeletedSet
+                with mock.patch.object(fake_upstream, "fetch", self.fetchWithDeletedSet):
+                    status, data = self.getJson(url)
+
+                self.assertEqual(status, 200)
+                self.assertEqual(len(data["items"]), rows)
+                # The set list was read again from the user page
+                self.assertEqual(DeckboxCrawler.set_list_cache.get(self.test_username)[0],
+                                 {"id": "590740", "name": "inventory"})
+
+
+if __name__ == '__main__':
+    unittest.main()
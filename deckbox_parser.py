@@ -0,0 +1,247 @@
+"""
+Fast parser for Deckbox cards tables.
+It works directly on the lxml tree with precompiled XPath expressions and
+regexes, and walks each row once to extract all of its fields, instead of
+running one PyQuery/cssselect query per field.
+It returns what the previous PyQuery parser returned, inventory rows as
+card records (see card_record).
+"""
+import re, urllib.parse
+from lxml import etree
+import card_record
+from card_record import CardRecord
+
+
+def _has_class(*classes):
+    # Same translation as cssselect for .class selectors
+    return " and ".join(
+        "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(c) for c in classes
+    )
+
+
+_DECK_ROWS = [
+    ("mainboard", etree.XPath("//*[{}]//tr[@id]".format(_has_class("main", "simple_table", "with_details")))),
+    ("sideboard", etree.XPath("//*[{}]//tr[@id]".format(_has_class("sideboard", "simple_table", "with_details")))),
+]
+_CARDS_ROWS = etree.XPath("//*[{}]//tr[@id]".format(_has_class("set_cards", "simple_table")))
+_INVENTORY_ROWS = etree.XPath("//*[@id='set_cards_table_details']//tr[@id]")
+_STRING = etree.XPath("string()")
+
+# PyQuery squashes these characters only, then strips the text
+_WHITESPACE = re.compile(u"[\x20\x09\x0C\u200B\x0A\x0D]+")
+_TYPES_SEPARATOR = re.compile(r"\s+-\s+")
+_SPACE = re.compile(r"\s")
+_MANA_CLASS = re.compile("(mtg_mana |mtg_mana_)")
+_EDITION_CODE = re.compile(r".*/(.*)_.\.jpg$")
+_CONDITION_CLASS = re.compile(r"(sprite |\s)")
+_LANG_CLASS = re.compile(r"(flag |\s)")
+
+
+def _text(elements):
+    return " ".join(_WHITESPACE.sub(" ", _STRING(e)).strip() for e in elements)
+
+
+def _has_ancestor_class(element, class_name, stop, tag=None):
+    # Ancestors are only looked up to the row element (included)
+    for ancestor in element.iterancestors():
+        if (tag is None or ancestor.tag == tag) and class_name in (ancestor.get("class") or "").split():
+            return True
+        if ancestor is stop:
+            break
+
+    return False
+
+
+class _Row:
+    """
+    Elements of a table row needed by the parsers, collected in a single walk
+    """
+    __slots__ = ("anchors", "counts", "tds", "cost_imgs", "edition_img", "condition", "flag", "sprite_classes")
+
+    def __init__(self, tr):
+        self.anchors = []
+        self.counts = []
+        self.tds = []
+        self.cost_imgs = []
+        self.edition_img = None
+        self.condition = None
+        self.flag = None
+        self.sprite_classes = set()
+
+        for el in tr.iter():
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue
+
+            class_attr = el.get("class")
+            classes = class_attr.split() if class_attr else ()
+
+            if tag == "a":
+                self.anchors.append(el)
+            elif tag == "td":
+                self.tds.append(el)
+                if "card_count" in classes:
+                    self.counts.append(el)
+            elif tag == "img":
+                if self.edition_img is None and _has_ancestor_class(el, "mtg_edition_container", tr):
+                    self.edition_img = el
+                if _has_ancestor_class(el, "card_cost", tr, tag="td"):
+                    self.cost_imgs.append(el)
+
+            if "sprite" in classes:
+                if self.condition is None:
+                    self.condition = el
+                self.sprite_classes.update(classes)
+
+            if "flag" in classes and self.flag is None:
+                self.flag = el
+
+
+def _split_types(type_line):
+    card_types = _TYPES_SEPARATOR.split(type_line)
+    types = _SPACE.split(card_types[0]) if len(card_types) > 1 else card_types
+    subtypes = _SPACE.split(card_types[1]) if len(card_types) > 1 else []
+
+    return types, subtypes
+
+
+def parse_deck_rows(root):
+    '''
+    Deck card HTML example:
+    <tr id="13008_main">
+        <td class="card_count">1</td>
+        <td class="card_name">
+            <a class="simple" href="https://deckbox.org/mtg/Phantom%20General" target="_blank">Phantom General</a>
+        </td>
+        <td>Creature  - Spirit Soldier</td>
+        <td class="center"><img class="mtg_mana mtg_mana_3" src="/images/icon_spacer.gif"><img class="mtg_mana mtg_mana_W" src="/images/icon_spacer.gif"></td>
+        <td class="center"><div class="mtg_edition_container " onclick="">
+               <img src="/images/mtg/editions/RTR_U.jpg" data-title="Last Important Printing - Return to Ravnica" class="">
+             </div></td>
+        <td class="center minimum_width">$0.22</td>
+    </tr>
+    '''
+    tables = {"mainboard": [], "sideboard": []}
+
+    for table_type, rows in _DECK_ROWS:
+        for tr in rows(root):
+            row = _Row(tr)
+            tables[table_type].append({
+                "count": _text(row.counts),
+                "name": _text(row.anchors),
+            })
+
+    return tables["mainboard"], tables["sideboard"]
+
+
+def parse_cards_rows(root, tooltip_template):
+    '''
+    Default card HTML example:
+    <tr id="7730" >
+        <td class="card_name">
+          <div class="relative">
+            <a class="simple" target="_blank" href="http://deckbox.org/mtg/Annul">Annul</a>
+          </div>
+        </td>
+        <td><span>Instant</span></td>
+        <td class="card_cost"><img class="mtg_mana mtg_mana_U" src="/images/icon_spacer.gif" /></td>
+        <td class="center price"><span data-title="$0.03 / $0.14 / $0.43 / $0.68">$0.14</span></td>
+    </tr>
+    '''
+    cards = []
+
+    for tr in _CARDS_ROWS(root):
+        row = _Row(tr)
+        card = {}
+        card["name"] = _text(row.anchors)
+        card["tooltip"] = tooltip_template.replace("<cardname>", urllib.parse.quote(card["name"]))
+        type_line = _text(row.tds[1].iter("span")) if len(row.tds) > 1 else ""
+        card["types"], card["subtypes"] = _split_types(type_line)
+        card["cost"] = "".join(_MANA_CLASS.sub("", img.get("class")) for img in row.cost_imgs)
+
+        cards.append(card)
+
+    return cards
+
+
+def parse_inventory_rows(root):
+    '''
+    Default set card HTML example:
+    <tr id="734306" class="even">
+        <td id="card_count_734306" class="card_count">1</td>
+        <td>
+          <a class="simple" target="_blank" href="http://deckbox.org/mtg/Abhorrent Overlord" data-tt="http://deckbox.org//system/images/mtg/cards/373661.jpg">
+            Abhorrent Overlord
+          </a>
+        </td>
+        <td class="details_col">
+            <span class="mtg_edition_price">
+                <span data-title="$0.10 / $0.28 / $1.45 / $0.94">$0.28</span>
+            </span>
+            <div class="mtg_edition_container">
+                <img src="/images/mtg/editions/THS_R.jpg" data-title="Theros" class="">
+            </div>
+            <img src="/images/icon_spacer.gif" class="sprite s_star2 " data-title="Near Mint">
+            <img src="/images/icon_spacer_16_11.gif" class="flag flag-us" data-title="English">
+            <img src="/images/icon_spacer.gif" class="sprite s_colors " data-title="Foil">
+        </td>
+        <td class="type_line minimum_width">Creature  - Demon</td>
+        <td class="mana_cost minimum_width">
+            <img class="mtg_mana mtg_mana_5" src="/images/icon_spacer.gif">
+            <img class="mtg_mana mtg_mana_B" src="/images/icon_spacer.gif">
+            <img class="mtg_mana mtg_mana_B" src="/images/icon_spacer.gif">
+        </td>
+    </tr>
+    '''
+    cards = []
+
+    for tr in _INVENTORY_ROWS(root):
+        row = _Row(tr)
+
+        edition_img = row.edition_img
+        edition_match = _EDITION_CODE.search(edition_img.get("src") or "") if edition_img is not None else None
+        edition_code = (edition_match.group(1),) if edition_match else None
+        edition_name = edition_img.get("data-title") if edition_img is not None else None
+
+        condition = card_record.conditions.get(
+            _CONDITION_CLASS.sub("", row.condition.get("class")),
+            row.condition.get("data-title")
+        ) if row.condition is not None else card_record.conditions.get(None, None)
+        lang = card_record.languages.get(
+            _LANG_CLASS.sub("", row.flag.get("class")),
+            row.flag.get("data-title")
+        ) if row.flag is not None else card_record.languages.get(None, None)
+        flags = card_record.get_flags(
+            "s_colors" in row.sprite_classes,
+            "s_rosette" in row.sprite_classes,
+            "s_square" in row.sprite_classes,
+            "s_letter" in row.sprite_classes,
+        )
+
+        cards.append(CardRecord(
+            tr.get("id"),
+            _text(row.counts),
+            _text(row.anchors),
+            card_record.editions.get(edition_code, edition_name),
+            condition,
+            lang,
+            flags,
+        ))
+
+    return cards
+
+
+def parse_cards_table(root, page_type, tooltip_template):
+    """
+    Parse the cards table(s) of a Deckbox page
+    :param root: lxml root element of the page
+    :param page_type: deck, cards or inventory (default)
+    :param tooltip_template: tooltip url containing a <cardname> placeholder
+    :return: (cards, sideboard) tuple, sideboard is only filled for decks
+    """
+    if page_type == "deck":
+        return parse_deck_rows(root)
+    elif page_type == "cards":
+        return parse_cards_rows(root, tooltip_template), []
+
+    return parse_inventory_rows(root), []
@@ -0,0 +1,62 @@
+import json, os, unittest
+from pyquery import PyQuery
+from card_record import CardRecord
+from deckbox_parser import parse_cards_table
+from json_encoder import dumps
+
+SNAPSHOTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "html")
+TOOLTIP_TEMPLATE = "https://deckbox.org/mtg/<cardname>/tooltip"
+
+
+def load_snapshot(name):
+    with open(os.path.join(SNAPSHOTS_PATH, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class DeckboxParserTestCase(unittest.TestCase):
+    """
+    Rows parsed from the HTML snapshots, the expected rows (*_rows.json) are
+    the ones the PyQuery parser returned
+    """
+
+    maxDiff = None
+
+    def parse(self, page_type, html=None):
+        root = PyQuery(html or load_snapshot(page_type + ".html"), parser='html')[0]
+        cards, sideboard = parse_cards_table(root, page_type, TOOLTIP_TEMPLATE)
+
+        return {"cards": cards, "sideboard": sideboard}
+
+    def assertRows(self, page_type):
+        expected = json.loads(load_snapshot(page_type + "_rows.json"))
+
+        self.assertEqual(json.loads(dumps(self.parse(page_type)).decode("utf-8")), expected)
+
+    def test_inventory(self):
+        self.assertRows("inventory")
+
+    def test_deck(self):
+        self.assertRows("deck")
+
+    def test_cards(self):
+        self.assertRows("cards")
+
+    def test_inventory_records(self):
+        cards = self.parse("inventory")["cards"]
+
+        self.assertTrue(all(isinstance(card, CardRecord) for card in cards))
+        self.assertEqual(cards[0]["edition"]["code"], ("THS",))
+
+    def test_unknown_edition(self):
+        html = load_snapshot("inventory.html")
+        first_edition = html.index('src="/images/mtg/editions/')
+        html = html[:first_edition] + 'src="/images/mtg/editions/unknown.png"' + \
+            html[html.index('"', first_edition + len('src="')) + 1:]
+
+        card = self.parse("inventory", html)["cards"][0]
+        self.assertIsNone(card["edition"]["code"])
+        self.assertEqual(card["edition"]["name"], "Theros (Card #1)")
+
+
+if __name__ == '__main__':
+    unittest.main()
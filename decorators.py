@@ -1,8 +1,12 @@
-import functools
+import functools, itertools
 from math import ceil
-from flask import jsonify
+from flask import request, Response, stream_with_context
+from json_encoder import dumps, json_response
+from metrics import metrics
 from flask_restful import reqparse
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 
 def parse_request(*args, **kwargs):
     """
@@ -37,6 +41,19 @@ def parse_request(*args, **kwargs):
     return decorator
 
 
+def page_number(value):
+    """
+    Type of the page argument of Deckbox sets: a page number, or "all" for every page
+    """
+    if value == "all":
+        return value
+
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Page must be an integer or "all".')
+
+
 def pagination_args_parser(default_page_size=100):
     parser = reqparse.RequestParser()
     parser.add_argument('page', type=int, default=1,
@@ -61,6 +78,46 @@ def paginate_deckbox_results(results, serializer, args_parser=None):
     )
 
 
+def stream_deckbox_results(pages, serializer):
+    for page in pages:
+        yield from serializer(page['cards'])
+
+
+def is_error(rv):
+    """
+    Errors of the crawlers: {"status": "error", "description": ...}
+    """
+    return isinstance(rv, dict) and rv.get("status") == "error"
+
+
+def is_stream_request():
+    """
+    Streamed responses are asked with ?stream=1 or an "Accept: application/x-ndjson" header
+    """
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def stream_response(items):
+    """
+    NDJSON response, one JSON document per line, each line is sent as soon as its item is produced
+    """
+    items = iter(items)
+    # The first item is produced before sending the headers, so that errors still get their status code
+    try:
+        first = [next(items)]
+    except StopIteration:
+        first = []
+
+    def generate():
+        for item in itertools.chain(first, items):
+            yield dumps(item) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
 def paginate_list(results, serializer, args_parser=pagination_args_parser()):
     """Very simple pagination helper for lists.
     This logic could be more elaborated and moved into a class.
@@ -85,8 +142,11 @@ def paginate_list(results, serializer, args_parser=pagination_args_parser()):
 
 
 def marshal_with(schema, pagination=False, paginator=paginate_list, args_parser=pagination_args_parser(),
-                 success_code=200, **kwargs):
+                 success_code=200, streamer=None, error_code=404, **kwargs):
     """Decorator to serialize output using specified schema
+    :param streamer: function yielding the serialized items of a streamed result,
+    enables NDJSON responses for streaming requests (see is_stream_request)
+    :param error_code: status of the crawler errors (see is_error), answered as they are
     :param kwargs will be passed down to the dump method from marshmallow Schema
     """
     serializer = functools.partial(schema.dump, **kwargs)
@@ -95,16 +155,33 @@ def marshal_with(schema, pagination=False, paginator=paginate_list, args_parser=
         @functools.wraps(f)
         def inner(*fargs, **fkwargs):
             rv = f(*fargs, **fkwargs)
-            if pagination:
-                if isinstance(rv, list):
-                    rv = paginator(rv, serializer, args_parser)
+            if isinstance(rv, Response):
+                return rv
+
+            if streamer and is_stream_request():
+                # An error is the first and only page, it is answered before streaming
+                pages = iter([rv]) if isinstance(rv, dict) else iter(rv)
+                first_page = next(pages, None)
+                if is_error(first_page):
+                    return json_response(first_page, error_code)
+
+                pages = itertools.chain([first_page], pages) if first_page is not None else pages
+                response = stream_response(streamer(pages, serializer))
+                response.status_code = success_code
+                return response
+
+            if is_error(rv):
+                return json_response(rv, error_code)
+
+            with metrics.timer("serialize"):
+                if pagination:
+                    if isinstance(rv, list):
+                        rv = paginator(rv, serializer, args_parser)
+                    else:
+                        rv = paginator(rv, serializer, args_parser)
                 else:
-                    rv = paginator(rv, serializer, args_parser)
-            else:
-                rv = serializer(rv)
-            response = jsonify(rv)
-            response.status_code = success_code
-            return response
+                    rv = serializer(rv)
+            return json_response(rv, success_code)
 
         return inner
 
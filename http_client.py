@@ -0,0 +1,71 @@
+import os, urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import metrics
+
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", 0.3))
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+HTTP_USER_AGENT = os.environ.get("HTTP_USER_AGENT", "deckbox-api (+https://github.com/T0RAT0RA/deckbox-api)")
+
+_session = None
+
+
+def get_session():
+    """
+    Return the process wide HTTP session.
+    The session keeps connections alive and pools them per host, so consecutive
+    requests to the same upstream reuse the same TCP/TLS connection.
+    """
+    global _session
+
+    if _session is None:
+        _session = create_session()
+
+    return _session
+
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                   retries=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR):
+    """
+    Build a session with a pooled adapter and retries with exponential backoff
+    :param pool_connections: number of hosts to keep a connection pool for
+    :param pool_maxsize: maximum number of connections kept alive per host
+    :param retries: number of retries on connection errors and 5xx responses
+    :param backoff_factor: sleep between retries is backoff_factor * 2 ** (retry - 1)
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        method_whitelist=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.headers.update({"User-Agent": HTTP_USER_AGENT})
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def fetch(url, timeout=None, **kwargs):
+    """
+    GET an url through the shared session
+    :param timeout: (connect, read) timeout, defaults to HTTP_CONNECT_TIMEOUT / HTTP_TIMEOUT
+    :param kwargs: passed down to requests.Session.get
+    :return: requests.Response
+    """
+    response = get_session().get(url, timeout=timeout or (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT), **kwargs)
+    metrics.inc("upstream_requests_total", upstream=urllib.parse.urlsplit(url).netloc, status=response.status_code)
+
+    return response
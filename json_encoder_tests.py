@@ -0,0 +1,68 @@
+import datetime, json, unittest
+from unittest import mock
+from types import MappingProxyType
+from flask import Flask
+import json_encoder
+from card_record import CardRecord, editions, conditions, languages
+from json_encoder import dumps, get_encoder, json_response
+
+
+class JsonEncoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            "name": "Lim-Dûl's High Guard",
+            "cards": [{"count": 4, "price": 0.25, "is_foil": False, "tags": None}],
+            "b": "</script>",
+            "a": {"z": 1, "y": [1, 2.5, "x"]},
+        }
+        self.expected = json.dumps(self.data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    def getEncoders(self):
+        for name, _ in json_encoder.ENCODERS:
+            try:
+                yield get_encoder(name)
+            except ImportError:
+                pass
+
+    def test_encoders(self):
+        # Same JSON documents as the standard library, with sorted keys
+        for name, encode in self.getEncoders():
+            with self.subTest(encoder=name):
+                self.assertEqual(json.loads(encode(self.data).decode("utf-8")), self.data)
+                self.assertEqual(list(json.loads(encode(self.data).decode("utf-8"))), ["a", "b", "cards", "name"])
+
+    def test_mappings(self):
+        record = CardRecord("1", 1, "Annul", editions.get("M11", "Magic 2011"), conditions.get(None, None),
+                            languages.get(None, None))
+        mapping = MappingProxyType({"name": "Annul"})
+
+        # Converted by the encoder or, when it can't, by the fallback of dumps
+        for name, encode in self.getEncoders():
+            with self.subTest(encoder=name), mock.patch.object(json_encoder, "_dumps", encode):
+                self.assertEqual(json.loads(dumps([record, mapping]).decode("utf-8")),
+                                 [record.to_dict(), {"name": "Annul"}])
+
+    def test_fallback(self):
+        # Values only Flask's encoder knows, or too large for the C encoders
+        with Flask(__name__).app_context():
+            self.assertEqual(json.loads(dumps({"date": datetime.date(2018, 1, 2), "count": 2 ** 70})),
+                             {"date": "Tue, 02 Jan 2018 00:00:00 GMT", "count": 2 ** 70})
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+    def test_unknown_encoder(self):
+        self.assertEqual(get_encoder("json")[0], "json")
+        with self.assertRaises(ValueError):
+            get_encoder("simplejson")
+
+    def test_json_response(self):
+        response = json_response({"status": "error"}, 404)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_data(), b'{"status":"error"}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+"""
+Local stand-in for deckbox.org and api.scryfall.com, used to load test the api
+without hitting the real services. It serves the recorded pages from
+tests/fixtures/html and the Scryfall cards from tests/fixtures/scryfall.
+
+    $ python loadtest/fake_upstream.py --port 8001 --latency 0.05 --error-rate 0.01
+    $ DECKBOX_URL=http://localhost:8001 SCRYFALL_API_URL=http://localhost:8001 gunicorn api:app
+
+The offline tests use it in process instead, see fetch and ClientSession.
+"""
+import argparse, json, os, random, re, time, urllib.parse
+import requests
+from flask import Flask, Response, request, abort, jsonify
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+SCRYFALL_PAGE_SIZE = 175
+# Sets rendered with the inventory page, every other set id gets the deck page
+INVENTORY_SET_IDS = {"590740", "590741", "590742"}
+
+app = Flask(__name__)
+app.config.update(
+    LATENCY=float(os.environ.get("FAKE_UPSTREAM_LATENCY", 0)),
+    JITTER=float(os.environ.get("FAKE_UPSTREAM_JITTER", 0)),
+    ERROR_RATE=float(os.environ.get("FAKE_UPSTREAM_ERROR_RATE", 0)),
+)
+
+
+def load_page(name):
+    with open(os.path.join(FIXTURES_PATH, "html", name), encoding="utf-8") as f:
+        return f.read()
+
+
+PAGES = {name: load_page(name + ".html") for name in ("profile", "friends", "inventory", "deck", "cards", "card")}
+with open(os.path.join(FIXTURES_PATH, "scryfall", "cards.json"), encoding="utf-8") as f:
+    SCRYFALL_CARDS = json.load(f)
+
+
+@app.before_request
+def inject_latency_and_errors():
+    latency = app.config["LATENCY"] + random.uniform(0, app.config["JITTER"])
+    if latency > 0:
+        time.sleep(latency)
+
+    if random.random() < app.config["ERROR_RATE"]:
+        abort(503)
+
+
+def html(page):
+    # Deckbox answers conditional requests
+    response = Response(page, mimetype="text/html")
+    response.add_etag()
+
+    return response.make_conditional(request)
+
+
+@app.route("/users/<username>")
+def user_profile(username):
+    return html(PAGES["profile"])
+
+
+@app.route("/users/<username>/friends")
+def user_friends(username):
+    return html(PAGES["friends"])
+
+
+@app.route("/sets/<set_id>")
+def user_set(set_id):
+    if set_id not in INVENTORY_SET_IDS:
+        return html(PAGES["deck"])
+
+    page = request.args.get("p", "1")
+    return html(PAGES["inventory"].replace("Page 1 of", "Page {} of".format(page)))
+
+
+@app.route("/games/mtg/cards")
+def cards():
+    return html(PAGES["cards"])
+
+
+@app.route("/mtg/<path:cardname>")
+def card(cardname):
+    return html(PAGES["card"])
+
+
+def match_names(query):
+    # Exact names (!"name") and name regexes (name:/regex/)
+    exact_names = {name.lower() for name in re.findall(r'!"(.*?)"', query)}
+    patterns = re.findall(r"name:/(.*?)/(?= or |$)", query)
+    matches = [c for c in SCRYFALL_CARDS if c["name"].lower() in exact_names]
+
+    for pattern in patterns:
+        try:
+            found = [c for c in SCRYFALL_CARDS if re.search(pattern, c["name"], re.IGNORECASE)]
+        except re.error:
+            found = [c for c in SCRYFALL_CARDS if pattern.lower() in c["name"].lower()]
+
+        matches.extend(c for c in found if c not in matches)
+
+    return matches
+
+
+@app.route("/cards/search")
+def scryfall_search():
+    query = request.args.get("q", "")
+    page = int(request.args.get("page", 1))
+    cards = match_names(query)
+
+    if not cards:
+        response = jsonify({"object": "error", "code": "not_found", "status": 404,
+                            "details": "Your query didn't match any cards."})
+        response.status_code = 404
+        return response
+
+    offset = (page - 1) * SCRYFALL_PAGE_SIZE
+    has_more = offset + SCRYFALL_PAGE_SIZE < len(cards)
+    rv = {
+        "object": "list",
+        "total_cards": len(cards),
+        "has_more": has_more,
+        "data": cards[offset:offset + SCRYFALL_PAGE_SIZE],
+    }
+    if has_more:
+        rv["next_page"] = request.base_url + "?" + urllib.parse.urlencode({"q": query, "page": page + 1})
+
+    return jsonify(rv)
+
+
+#-------------------------
+#  IN PROCESS CLIENTS
+#-------------------------
+class UpstreamResponse:
+    """
+    Response of this app with the attributes of a requests.Response the api reads
+    """
+
+    def __init__(self, url, response):
+        self.url = url
+        self.status_code = response.status_code
+        self.headers = dict(response.headers)
+        self.text = response.get_data(as_text=True)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError("{} Error for url: {}".format(self.status_code, self.url), response=self)
+
+
+def fetch(url, timeout=None, params=None, headers=None, **kwargs):
+    """
+    Answer a request for any host from this app without a server, replaces http_client.fetch
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = "&".join(filter(None, [parts.query, urllib.parse.urlencode(params or {})]))
+    response = app.test_client().get(urllib.parse.urlunsplit(("", "", parts.path, query, "")), headers=headers or {})
+
+    return UpstreamResponse(url, response)
+
+
+class AsyncUpstreamResponse:
+    def __init__(self, response):
+        self.status = response.status_code
+        self.headers = response.headers
+        self._text = response.text
+
+    async def text(self):
+        return self._text
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class ClientSession:
+    """
+    aiohttp.ClientSession answering from this app without a server, see async_crawler.AsyncRunner.get_session
+    """
+
+    def get(self, url, headers=None, timeout=None):
+        return AsyncUpstreamResponse(fetch(url, headers=headers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=app.config["LATENCY"], help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=app.config["JITTER"], help="random extra latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=app.config["ERROR_RATE"],
+                        help="ratio of requests answered with a 503")
+    args = parser.parse_args()
+
+    app.config.update(LATENCY=args.latency, JITTER=args.jitter, ERROR_RATE=args.error_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
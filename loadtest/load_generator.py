@@ -0,0 +1,122 @@
+"""
+Load generator for the api, reports req/s and latency percentiles per endpoint.
+Run the api against loadtest/fake_upstream.py to avoid hitting Deckbox and Scryfall.
+
+    $ python loadtest/load_generator.py --url http://localhost:8000 --concurrency 20 --duration 30
+"""
+import argparse, itertools, json, math, threading, time
+import requests
+
+DEFAULT_ENDPOINTS = [
+    "/api/users/deckbox_api",
+    "/api/users/deckbox_api/friends/",
+    "/api/users/deckbox_api/sets/",
+    "/api/users/deckbox_api/inventory",
+    "/api/users/deckbox_api/wishlist",
+    "/api/users/deckbox_api/tradelist",
+    "/api/users/deckbox_api/sets/608751",
+    "/api/cards/Nicol Bolas",
+]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+class LoadGenerator:
+    def __init__(self, base_url, endpoints, concurrency, duration, timeout):
+        self._base_url = base_url.rstrip("/")
+        self._endpoints = itertools.cycle(endpoints)
+        self._lock = threading.Lock()
+        self._concurrency = concurrency
+        self._duration = duration
+        self._timeout = timeout
+        self.results = {endpoint: {"latencies": [], "errors": 0} for endpoint in endpoints}
+
+    def next_endpoint(self):
+        with self._lock:
+            return next(self._endpoints)
+
+    def worker(self, deadline):
+        session = requests.Session()
+        # The api redirects plain http requests to https (SSLify)
+        session.headers["X-Forwarded-Proto"] = "https"
+
+        while time.time() < deadline:
+            endpoint = self.next_endpoint()
+            start = time.perf_counter()
+            try:
+                ok = session.get(self._base_url + endpoint, timeout=self._timeout).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.results[endpoint]["latencies"].append(elapsed)
+                if not ok:
+                    self.results[endpoint]["errors"] += 1
+
+    def run(self):
+        deadline = time.time() + self._duration
+        threads = [threading.Thread(target=self.worker, args=(deadline,)) for _ in range(self._concurrency)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        return self.report(time.time() - start)
+
+    def report(self, elapsed):
+        report = {"duration": elapsed, "concurrency": self._concurrency, "endpoints": {}}
+        for endpoint, result in self.results.items():
+            latencies = [l * 1000 for l in result["latencies"]]
+            report["endpoints"][endpoint] = {
+                "requests": len(latencies),
+                "errors": result["errors"],
+                "req_per_sec": len(latencies) / elapsed if elapsed else None,
+                "p50_ms": percentile(latencies, 50),
+                "p90_ms": percentile(latencies, 90),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": max(latencies) if latencies else None,
+            }
+        total = sum(len(r["latencies"]) for r in self.results.values())
+        report["req_per_sec"] = total / elapsed if elapsed else None
+
+        return report
+
+
+def print_report(report):
+    print("{:<45} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}".format("endpoint", "requests", "errors", "req/s", "p50 ms",
+                                                             "p90 ms", "p99 ms"))
+    for endpoint, r in sorted(report["endpoints"].items()):
+        print("{:<45} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            endpoint, r["requests"], r["errors"], r["req_per_sec"] or 0,
+            r["p50_ms"] or 0, r["p90_ms"] or 0, r["p99_ms"] or 0))
+    print("total: {:.1f} req/s".format(report["req_per_sec"] or 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("-d", "--duration", type=float, default=30, help="seconds")
+    parser.add_argument("-e", "--endpoint", action="append", help="endpoint to hit, can be repeated")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = LoadGenerator(args.url, args.endpoint or DEFAULT_ENDPOINTS, args.concurrency, args.duration,
+                           args.timeout).run()
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Per-stage timing and counters of the hot path, exposed in the Prometheus text format on /metrics.
+
+Stages (page download, parsing, card cache, Scryfall, serialization...) are timed
+with metrics.timer(stage) and summed per request; when the request ends each
+stage total is observed in a histogram labelled with the endpoint. Timers running
+outside of a request (background threads, the async crawler loop) are ignored,
+the async crawl is timed as a whole by the request waiting for it.
+
+Metrics are accumulated in the process and added to a Redis hash every
+METRICS_FLUSH_INTERVAL seconds, so /metrics reports all the workers together.
+METRICS_ENABLED=0 turns timers into a shared no-op object and counters into a single test.
+"""
+import os, time, threading, functools
+import redis
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+METRICS_PREFIX = "deckbox_api_"
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS_HELP = {
+    "request_seconds": ("histogram", "Request duration by endpoint."),
+    "stage_seconds": ("histogram", "Time spent in each stage of a request, by endpoint."),
+    "requests_total": ("counter", "Requests by endpoint and status."),
+    "page_cache_requests_total": ("counter", "Deckbox page cache lookups by result (hit, stale, miss, error)."),
+    "card_meta_requests_total": ("counter", "Card metadata lookups by source (index, cache, scryfall, missing)."),
+    "upstream_requests_total": ("counter", "Requests to Deckbox and Scryfall by status."),
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                          for k, v in sorted(labels.items())) + "}"
+
+
+def get_series_order(series):
+    # Histogram buckets in the order of their bound, after the other series of the same labels
+    head, _, le = series.partition('le="')
+
+    return (head, float(le.rstrip('"}')) if le else float("-inf"))
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("_metrics", "_stage", "_started_at")
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.add_stage_time(self._stage, time.perf_counter() - self._started_at)
+        return False
+
+
+class Metrics:
+    KEY = "metrics:v1"
+
+    # Redis client the metrics are flushed to, set by the application
+    redis_client = None
+
+    def __init__(self, enabled=METRICS_ENABLED, flush_interval=METRICS_FLUSH_INTERVAL, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self._flush_interval = flush_interval
+        self._buckets = buckets
+        self._pending = {}
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def timer(self, stage):
+        """
+        Context manager adding the time spent in its block to a stage of the current request
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+
+        return _StageTimer(self, stage)
+
+    def timed(self, stage):
+        """
+        Decorator version of timer
+        """
+
+        def decorator(f):
+            @functools.wraps(f)
+            def inner(*fargs, **fkwargs):
+                with self.timer(stage):
+                    return f(*fargs, **fkwargs)
+
+            return inner
+
+        return decorator
+
+    def add_stage_time(self, stage, seconds):
+        stages = getattr(self._local, "stages", None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0) + seconds
+
+    def start_request(self):
+        if self.enabled:
+            self._local.stages = {}
+            self._local.started_at = time.perf_counter()
+
+    def end_request(self, endpoint, status):
+        stages = getattr(self._local, "stages", None)
+        if not self.enabled or stages is None:
+            return
+
+        self._local.stages = None
+        endpoint = endpoint or "none"
+        self.observe("request_seconds", time.perf_counter() - self._local.started_at, endpoint=endpoint)
+        for stage, seconds in stages.items():
+            self.observe("stage_seconds", seconds, endpoint=endpoint, stage=stage)
+        self.inc("requests_total", endpoint=endpoint, status=status)
+        self.flush_if_due()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+
+        series = METRICS_PREFIX + name + format_labels(labels)
+        with self._lock:
+            self._pending[series] = self._pending.get(series, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+
+        name, labels = METRICS_PREFIX + name, format_labels(labels)
+        updates = [(name + "_sum" + labels, value), (name + "_count" + labels, 1)]
+        # Buckets are cumulative, le is the last label so that buckets sort by their bound
+        bucket = name + "_bucket" + (labels[:-1] + "," if labels else "{") + 'le="'
+        updates.extend((bucket + str(le) + '"}', 1 if value <= le else 0) for le in self._buckets)
+        updates.append((bucket + '+Inf"}', 1))
+
+        with self._lock:
+            for series, amount in updates:
+                self._pending[series] = self._pending.get(series, 0) + amount
+
+    def flush_if_due(self):
+        if self.enabled and time.time() - self._flushed_at >= self._flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Add the pending metrics to the Redis totals, they are kept for the next flush if Redis is unavailable
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.time()
+
+        if not pending or self.redis_client is None:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipe.hincrbyfloat(self.KEY, series, value)
+            pipe.execute()
+        except redis.RedisError:
+            with self._lock:
+                for series, value in pending.items():
+                    self._pending[series] = self._pending.get(series, 0) + value
+
+    def render(self):
+        """
+        :return: all the workers metrics in the Prometheus text exposition format
+        """
+        self.flush()
+        totals = {}
+        if self.redis_client is not None:
+            try:
+                totals = {k.decode("utf-8"): float(v) for k, v in self.redis_client.hgetall(self.KEY).items()}
+            except redis.RedisError:
+                pass
+        with self._lock:
+            for series, value in self._pending.items():
+                totals[series] = totals.get(series, 0) + value
+
+        lines = []
+        for name, (metric_type, description) in sorted(METRICS_HELP.items()):
+            name = METRICS_PREFIX + name
+            names = (name, name + "_bucket", name + "_sum", name + "_count")
+            series = sorted((s for s in totals if s.split("{", 1)[0] in names), key=get_series_order)
+            if not series:
+                continue
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            lines.extend("{} {}".format(s, repr(totals[s])) for s in series)
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
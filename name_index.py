@@ -0,0 +1,186 @@
+"""
+In-process card name search index: prefix, substring and typo tolerant matches.
+Prefixes are looked up by bisecting the sorted normalized names (a flattened
+trie), substrings and typos through trigram postings lists.
+"""
+import bisect, threading, time
+from array import array
+from collections import Counter
+from card_cache import normalize_name
+
+FUZZY_CANDIDATES = 50
+# Delay before building the index again after a failed build
+NAME_INDEX_RETRY_DELAY = 60
+
+
+def get_trigrams(key):
+    padded = "  " + key + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Levenshtein distance, stops as soon as it exceeds max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+
+class NameIndex:
+    """
+    :param cards: card metadata dicts, one per card name, of the whole bulk data:
+    a search without results means the card doesn't exist
+    """
+
+    def __init__(self, cards):
+        self.built_at = time.time()
+        self._names = []
+        self._cards = []
+        self._postings = {}
+        self._ids_by_name = {}
+        # Normalized names and their ids, sorted by name
+        self._sorted = ([], [])
+        self._lock = threading.Lock()
+        self.add(cards)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, cards):
+        """
+        Add cards to the index, names already indexed are kept as they are
+        """
+        with self._lock:
+            added = []
+            for card in cards:
+                key = normalize_name(card["name"])
+                if key in self._ids_by_name:
+                    continue
+
+                i = len(self._names)
+                self._ids_by_name[key] = i
+                self._names.append(key)
+                self._cards.append(card)
+                for trigram in get_trigrams(key):
+                    self._postings.setdefault(trigram, array("I")).append(i)
+                added.append((key, i))
+
+            if added:
+                # Replaced at once, concurrent searches see either the previous or the new names
+                merged = sorted(list(zip(*self._sorted)) + added)
+                self._sorted = ([key for key, _ in merged], [i for _, i in merged])
+
+    def prefix(self, key):
+        keys, ids = self._sorted
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_left(keys, key + "\uffff", start)
+
+        return ids[start:end]
+
+    def substring(self, key):
+        if len(key) < 3:
+            keys, ids = self._sorted
+            return [i for k, i in zip(keys, ids) if key in k]
+
+        # Unpadded trigrams of the query are in every name containing it
+        trigrams = {key[i:i + 3] for i in range(len(key) - 2)}
+        postings = sorted((self._postings.get(t, ()) for t in trigrams), key=len)
+        if not postings or not postings[0]:
+            return []
+
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return []
+
+        return sorted((i for i in candidates if key in self._names[i]), key=self._names.__getitem__)
+
+    def fuzzy(self, key, max_distance=None):
+        if max_distance is None:
+            max_distance = max(1, len(key) // 5)
+
+        counter = Counter()
+        for trigram in get_trigrams(key):
+            counter.update(self._postings.get(trigram, ()))
+
+        matches = []
+        for i, _ in counter.most_common(FUZZY_CANDIDATES):
+            distance = edit_distance(key, self._names[i], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, self._names[i], i))
+
+        return [i for _, _, i in sorted(matches)]
+
+    def search(self, name):
+        """
+        Cards matching a name: exact and prefix matches first, then the other
+        names containing it. Only if nothing matched, names within a few typos.
+        """
+        key = normalize_name(name)
+        if not key:
+            return [self._cards[i] for i in self._sorted[1]]
+
+        ids = self.prefix(key)
+        seen = set(ids)
+        ids.extend(i for i in self.substring(key) if i not in seen)
+
+        if not ids:
+            ids = self.fuzzy(key)
+
+        return [self._cards[i] for i in ids]
+
+
+class NameIndexLoader:
+    """
+    Build the name index in a background thread of each worker, and rebuild it
+    when it gets older than max_age. Requests never wait for a build.
+    :param load: function returning the cards to index
+    """
+
+    def __init__(self, load, max_age, retry_delay=NAME_INDEX_RETRY_DELAY):
+        self._load = load
+        self._max_age = max_age
+        self._retry_delay = retry_delay
+        self._index = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._failed_at = 0
+
+    def get(self):
+        """
+        :return: the current index, None until the first one is built
+        """
+        index = self._index
+        if index is None or time.time() - index.built_at >= self._max_age:
+            self.build_in_background()
+
+        return index
+
+    def build_in_background(self):
+        with self._lock:
+            if self._building or time.time() - self._failed_at < self._retry_delay:
+                return
+            self._building = True
+
+        threading.Thread(target=self.build, daemon=True).start()
+
+    def build(self):
+        try:
+            self._index = NameIndex(self._load())
+        except Exception as e:
+            print("LOG - name index build failed: {!r}".format(e))
+            self._failed_at = time.time()
+        finally:
+            self._building = False
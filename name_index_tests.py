@@ -0,0 +1,174 @@
+import json, time, threading, unittest, urllib.parse
+from unittest import mock
+import fakeredis
+import api
+from card_cache import CardMetaCache, compact
+from name_index import NameIndex, NameIndexLoader, edit_distance
+
+
+class StaticLoader:
+    """
+    Name index loader always returning the same index
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self):
+        return self.index
+
+
+class NameIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixture_path = "tests/fixtures/"
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards = [compact(card) for card in json.load(f)]
+        self.index = NameIndex(self.cards)
+
+    def search(self, name, index=None):
+        return [card["name"] for card in (index or self.index).search(name)]
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("annul", "annul", 1), 0)
+        self.assertEqual(edit_distance("anul", "annul", 1), 1)
+        self.assertEqual(edit_distance("counterspell", "cuonterspel", 3), 3)
+        self.assertEqual(edit_distance("annul", "black lotus", 2), 3)
+
+    def test_exact_and_prefix_first(self):
+        self.assertEqual(self.search("Annul"), ["Annul"])
+        self.assertEqual(self.search("  black LOTUS"), ["Black Lotus"])
+        self.assertEqual(self.search("A"), ["Abhorrent Overlord", "Absorb Vis", "Anax and Cymede", "Annul",
+                                            # Names containing it, after the prefix matches
+                                            "Black Lotus", "Dark Ritual", "Give // Take", "Lim-Dûl's High Guard",
+                                            "Llanowar Elves", "Nicol Bolas, Planeswalker", "Pay No Heed",
+                                            "Phantom General"])
+
+    def test_substring(self):
+        self.assertEqual(self.search("bolt"), ["Lightning Bolt"])
+        self.assertEqual(self.search("ol"), ["Lightning Bolt", "Nicol Bolas, Planeswalker"])
+        self.assertEqual(self.search("bolas, plane"), ["Nicol Bolas, Planeswalker"])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.search("Lightnig Bolt"), ["Lightning Bolt"])
+        self.assertEqual(self.search("Conterspell"), ["Counterspell"])
+        self.assertEqual(self.search("Zzyzx"), [])
+
+    def test_empty_query(self):
+        self.assertEqual(self.search(""), sorted(card["name"] for card in self.cards))
+
+    def test_add(self):
+        index = NameIndex(self.cards[:3])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(self.search("bolt", index), [])
+
+        index.add(self.cards + [dict(self.cards[0], set="dup")])
+        self.assertEqual(len(index), len(self.cards))
+        self.assertEqual(self.search("bolt", index), ["Lightning Bolt"])
+        self.assertEqual(index.search(self.cards[0]["name"])[0], self.cards[0])
+
+
+class NameIndexLoaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cards = [{"name": "Black Lotus"}, {"name": "Lightning Bolt"}]
+
+    def wait_for_build(self, loader):
+        deadline = time.time() + 5
+        while loader._building and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_background_build(self):
+        release = threading.Event()
+
+        def load():
+            release.wait(5)
+            return self.cards
+
+        loader = NameIndexLoader(load, max_age=3600)
+
+        # Requests don't wait for the build
+        self.assertIsNone(loader.get())
+        self.assertIsNone(loader.get())
+        release.set()
+        self.wait_for_build(loader)
+
+        index = loader.get()
+        self.assertEqual(len(index), 2)
+        self.assertIs(loader.get(), index)
+
+    def test_rebuild_when_stale(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return self.cards
+
+        loader = NameIndexLoader(load, max_age=0)
+        loader.get()
+        self.wait_for_build(loader)
+        index = loader.get()
+        self.wait_for_build(loader)
+
+        self.assertEqual(len(loads), 2)
+        self.assertIsNot(loader.get(), index)
+
+    def test_failed_build(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            raise ValueError("cards.sqlite is corrupted")
+
+        loader = NameIndexLoader(load, max_age=3600, retry_delay=3600)
+        self.assertIsNone(loader.get())
+        self.wait_for_build(loader)
+
+        # Not built again before the retry delay
+        self.assertIsNone(loader.get())
+        self.wait_for_build(loader)
+        self.assertEqual(len(loads), 1)
+
+
+class CardSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixture_path = "tests/fixtures/"
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.app = api.app.test_client()
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards = json.load(f)
+
+    def getCardNames(self, name_index, cardname, scryfall_cards=()):
+        """
+        :param name_index: name index loader, None without a card index
+        """
+        search = mock.Mock(return_value=list(scryfall_cards))
+
+        with mock.patch.object(api, "name_index", name_index), \
+                mock.patch.object(api, "card_meta_cache", CardMetaCache(self.redis)), \
+                mock.patch.object(api.scryfall, "search", search):
+            response = self.app.get("/api/cards/" + urllib.parse.quote(cardname), base_url="https://localhost")
+
+        self.assertEqual(response.status_code, 200)
+
+        return [card["name"] for card in json.loads(response.data.decode("utf-8"))["items"]], search.called
+
+    def test_index(self):
+        name_index = StaticLoader(NameIndex([compact(card) for card in self.cards]))
+
+        self.assertEqual(self.getCardNames(name_index, "Lightnig Bolt"), (["Lightning Bolt"], False))
+        self.assertEqual(self.getCardNames(name_index, "Zzyzx"), ([], False))
+
+    def test_index_not_built_yet(self):
+        self.assertEqual(self.getCardNames(StaticLoader(None), "Annul", self.cards[3:4]), (["Annul"], True))
+
+    def test_without_card_index(self):
+        self.assertEqual(self.getCardNames(None, "Annul", self.cards[3:4]), (["Annul"], True))
+
+
+if __name__ == '__main__':
+    unittest.main()
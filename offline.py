@@ -0,0 +1,71 @@
+"""
+Base test case of the offline tests of the api: the application objects use an
+in-memory Redis, and Deckbox and Scryfall are answered in process by the local
+stand-in server (loadtest/fake_upstream.py) from the fixtures in tests/fixtures.
+"""
+import json, unittest
+from unittest import mock
+import fakeredis
+import api
+import async_crawler
+import http_client
+from loadtest import fake_upstream
+from deckbox_crawler import DeckboxCrawler
+from page_cache import PageCache
+from set_list_cache import SetListCache
+from singleflight import SingleFlight
+from card_cache import CardMetaCache
+from compression import ResponseCompressor
+from conditional import ValidatorCache
+from collection_sync import CollectionSnapshots
+from refresh_queue import DemandTracker
+from trade_index import TradeIndex
+from collection_stats import CollectionStatsCache
+from metrics import metrics
+
+
+class OfflineTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.test_username = "deckbox_api"
+        self.fixture_path = "tests/fixtures/"
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+
+        # Records the requests of the synchronous crawler and Scryfall client, and of the asynchronous crawler
+        upstream = mock.Mock(wraps=fake_upstream.fetch)
+        patches = [
+            mock.patch.multiple(api, r=self.redis, single_flight=SingleFlight(self.redis),
+                                card_meta_cache=CardMetaCache(self.redis), card_index=None,
+                                compressor=ResponseCompressor(self.redis), validator_cache=ValidatorCache(self.redis),
+                                collection_snapshots=CollectionSnapshots(self.redis),
+                                demand_tracker=DemandTracker(self.redis), trade_index=TradeIndex(self.redis),
+                                collection_stats_cache=CollectionStatsCache(self.redis)),
+            mock.patch.multiple(DeckboxCrawler, page_cache=PageCache(self.redis),
+                                set_list_cache=SetListCache(self.redis)),
+            mock.patch.object(metrics, "redis_client", self.redis),
+            mock.patch.object(http_client, "fetch", upstream),
+            mock.patch.object(fake_upstream, "fetch", upstream),
+            mock.patch.object(async_crawler.runner, "get_session", fake_upstream.ClientSession),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.app = api.app.test_client()
+
+    def getUpstreamUrls(self):
+        """
+        :return: urls requested to Deckbox and Scryfall
+        """
+        return [call[0][0] for call in http_client.fetch.call_args_list]
+
+    def get(self, url, headers=None):
+        return self.app.get(url, headers=headers or {}, base_url="https://localhost")
+
+    def getJson(self, url, headers=None):
+        response = self.get(url, headers)
+
+        return response.status_code, json.loads(response.get_data(as_text=True))
@@ -0,0 +1,223 @@
+import os, re, time, zlib, threading, urllib.parse
+import redis
+from singleflight import SingleFlight
+from metrics import metrics
+
+PAGE_CACHE_TTLS = {
+    "profile": int(os.environ.get("PAGE_CACHE_TTL_PROFILE", 300)),
+    "friends": int(os.environ.get("PAGE_CACHE_TTL_FRIENDS", 900)),
+    "set":     int(os.environ.get("PAGE_CACHE_TTL_SET", 120)),
+    "cards":   int(os.environ.get("PAGE_CACHE_TTL_CARDS", 3600)),
+    "default": int(os.environ.get("PAGE_CACHE_TTL_DEFAULT", 60)),
+}
+# How long an expired page can still be served while it is refreshed in the background
+PAGE_CACHE_STALE_TTL = int(os.environ.get("PAGE_CACHE_STALE_TTL", 3600))
+PAGE_CACHE_REFRESH_LOCK_TTL = 30
+
+_PAGE_TYPES = [
+    ("friends", re.compile(r"^/users/[^/]+/friends/?$")),
+    ("profile", re.compile(r"^/users/[^/]+/?$")),
+    ("set",     re.compile(r"^/sets/[^/]+/?$")),
+    ("cards",   re.compile(r"^/games/mtg/cards/?$")),
+]
+
+
+def normalize_url(url):
+    """
+    Normalize an url so that equivalent urls share the same cache key:
+    lowercase scheme and host, canonical path quoting and sorted query parameters.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = urllib.parse.quote(urllib.parse.unquote(parts.path)) or "/"
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+class PageDownloadError(Exception):
+    """
+    Deckbox answered an error instead of the page, the page is not cached
+    """
+
+    def __init__(self, url, status_code, body=None):
+        super().__init__("Deckbox answered {} for {}".format(status_code, url))
+        self.url = url
+        self.status_code = status_code
+        self.body = body
+
+
+def get_body(url, response):
+    """
+    :return: the body of a successful response
+    :raise PageDownloadError: on any other status
+    """
+    if response.status_code != 200:
+        raise PageDownloadError(url, response.status_code, response.text)
+
+    return response.text
+
+
+def get_page_type(url):
+    path = urllib.parse.unquote(urllib.parse.urlsplit(url).path)
+    for page_type, pattern in _PAGE_TYPES:
+        if pattern.match(path):
+            return page_type
+
+    return "default"
+
+
+class PageCache:
+    """
+    Redis cache for crawled Deckbox pages.
+    Pages are fresh for the TTL of their page type. Once expired, they are still
+    served for PAGE_CACHE_STALE_TTL seconds while a single background thread
+    refreshes them (stale-while-revalidate).
+    """
+    KEY_PREFIX = "deckbox:page:"
+    LOCK_PREFIX = "deckbox:page_refresh:"
+
+    def __init__(self, redis_client, ttls=PAGE_CACHE_TTLS, stale_ttl=PAGE_CACHE_STALE_TTL):
+        self._redis = redis_client
+        self._ttls = ttls
+        self._stale_ttl = stale_ttl
+        self._single_flight = SingleFlight(redis_client)
+
+    def get(self, url, download):
+        """
+        Return the page body for an url, downloading it on a cache miss
+        :param download: function taking an url and returning a requests.Response
+        """
+        key = self.KEY_PREFIX + normalize_url(url)
+
+        try:
+            cached = self.get_cached(url, key)
+        except redis.RedisError:
+            metrics.inc("page_cache_requests_total", result="error")
+            return get_body(url, download(url))
+
+        if cached is None:
+            metrics.inc("page_cache_requests_total", result="miss")
+            # Concurrent misses on the same page share a single download
+            return self._single_flight.do(key, lambda: self.refresh(url, download, key))
+
+        body, expired = cached
+        metrics.inc("page_cache_requests_total", result="stale" if expired else "hit")
+        if expired:
+            self.refresh_in_background(url, download, key)
+
+        return body
+
+    def get_cached(self, url, key=None):
+        """
+        :return: (body, expired) tuple, None if the page is not cached
+        """
+        entry = self._redis.hgetall(key or self.KEY_PREFIX + normalize_url(url))
+        if not entry:
+            return None
+
+        age = time.time() - float(entry[b"fetched_at"])
+
+        return zlib.decompress(entry[b"body"]).decode("utf-8"), age >= self.get_ttl(url)
+
+    def refresh(self, url, download, key=None):
+        """
+        Download a page and store it, only successful responses are cached.
+        Cached pages are revalidated with a conditional request when Deckbox sent validators.
+        :param download: function taking an url and request headers, returning a requests.Response
+        :return: the page body
+        :raise PageDownloadError: when Deckbox answers anything else than 200 or 304
+        """
+        key = key or self.KEY_PREFIX + normalize_url(url)
+        headers = self.get_conditional_headers(key)
+        response = download(url, headers=headers) if headers else download(url)
+
+        if response.status_code == 304:
+            body = self.touch(key, url)
+            if body is not None:
+                return body
+            response = download(url)
+
+        body = get_body(url, response)
+        self.set(key, url, body, response.headers)
+
+        return body
+
+    def get_conditional_headers(self, key):
+        try:
+            etag, last_modified = self._redis.hmget(key, "etag", "last_modified")
+        except redis.RedisError:
+            return {}
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag.decode("utf-8")
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified.decode("utf-8")
+
+        return headers
+
+    def set(self, key, url, body, headers=None):
+        """
+        :param headers: response headers, their ETag and Last-Modified are kept for revalidation
+        """
+        key = key or self.KEY_PREFIX + normalize_url(url)
+        entry = {
+            "body": zlib.compress(body.encode("utf-8")),
+            "fetched_at": time.time(),
+        }
+        for header, field in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+            if headers and headers.get(header):
+                entry[field] = headers[header]
+
+        try:
+            pipe = self._redis.pipeline()
+            pipe.delete(key)
+            pipe.hmset(key, entry)
+            pipe.expire(key, self.get_ttl(url) + self._stale_ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def touch(self, key, url):
+        """
+        Mark a cached page as fresh again after Deckbox answered 304 Not Modified
+        :return: the cached body, None if it expired in the meantime
+        """
+        try:
+            body = self._redis.hget(key, "body")
+            if body is None:
+                return None
+
+            pipe = self._redis.pipeline()
+            pipe.hset(key, "fetched_at", time.time())
+            pipe.expire(key, self.get_ttl(url) + self._stale_ttl)
+            pipe.execute()
+        except redis.RedisError:
+            return None
+
+        return zlib.decompress(body).decode("utf-8")
+
+    def refresh_in_background(self, url, download, key=None):
+        key = key or self.KEY_PREFIX + normalize_url(url)
+        # Only one refresh per page across all workers
+        try:
+            if not self._redis.set(self.LOCK_PREFIX + key, 1, nx=True, ex=PAGE_CACHE_REFRESH_LOCK_TTL):
+                return
+        except redis.RedisError:
+            return
+
+        def run():
+            try:
+                self.refresh(url, download, key)
+            except Exception as e:
+                print("LOG - background refresh failed for {}: {!r}".format(url, e))
+            finally:
+                try:
+                    self._redis.delete(self.LOCK_PREFIX + key)
+                except redis.RedisError:
+                    pass
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_ttl(self, url):
+        return self._ttls.get(get_page_type(url), self._ttls["default"])
@@ -0,0 +1,128 @@
+import time, threading, unittest, collections
+import fakeredis
+from page_cache import PageCache, PageDownloadError, normalize_url, get_page_type
+
+Response = collections.namedtuple("Response", ("status_code", "headers", "text"))
+
+
+class Downloader:
+    """
+    Fake download function answering with the next response, and recording the requests
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.done = threading.Event()
+
+    def __call__(self, url, headers=None):
+        self.requests.append((url, headers))
+        response = self.responses.pop(0)
+        self.done.set()
+        return response
+
+
+class PageCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.ttls = {"profile": 300, "friends": 900, "set": 120, "cards": 3600, "default": 60}
+        self.page_cache = PageCache(self.redis, ttls=self.ttls, stale_ttl=3600)
+        self.url = "https://deckbox.org/sets/1?p=2&s=n"
+
+    def expire(self, url):
+        key = PageCache.KEY_PREFIX + normalize_url(url)
+        self.redis.hset(key, "fetched_at", time.time() - self.ttls["set"] - 1)
+
+    def wait_for_refresh(self, url):
+        lock_key = PageCache.LOCK_PREFIX + PageCache.KEY_PREFIX + normalize_url(url)
+        deadline = time.time() + 5
+        while self.redis.exists(lock_key) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url("HTTPS://Deckbox.org/sets/1?s=n&p=2"),
+                         normalize_url("https://deckbox.org/sets/1?p=2&s=n"))
+        self.assertEqual(get_page_type("https://deckbox.org/sets/1"), "set")
+        self.assertEqual(get_page_type("https://deckbox.org/users/deckbox_api"), "profile")
+        self.assertEqual(get_page_type("https://deckbox.org/users/deckbox_api/friends"), "friends")
+        self.assertEqual(get_page_type("https://deckbox.org/mtg/Black%20Lotus"), "default")
+
+    def test_miss_then_hit(self):
+        download = Downloader(Response(200, {}, "page"))
+
+        self.assertEqual(self.page_cache.get(self.url, download), "page")
+        self.assertEqual(self.page_cache.get(self.url, download), "page")
+        self.assertEqual(len(download.requests), 1)
+        self.assertEqual(self.page_cache.get_cached(self.url), ("page", False))
+
+    def test_errors_are_not_cached(self):
+        download = Downloader(Response(500, {}, "error"), Response(429, {}, "slow down"), Response(200, {}, "page"))
+
+        with self.assertRaises(PageDownloadError) as context:
+            self.page_cache.get(self.url, download)
+        self.assertEqual((context.exception.status_code, context.exception.body), (500, "error"))
+        self.assertIsNone(self.page_cache.get_cached(self.url))
+        # Not shared with the next callers either
+        with self.assertRaises(PageDownloadError):
+            self.page_cache.get(self.url, download)
+        self.assertEqual(self.page_cache.get(self.url, download), "page")
+        self.assertEqual(self.page_cache.get_cached(self.url), ("page", False))
+
+    def test_revalidation_errors(self):
+        download = Downloader(Response(200, {"ETag": '"v1"'}, "page"), Response(503, {}, "unavailable"))
+        self.page_cache.get(self.url, download)
+
+        with self.assertRaises(PageDownloadError):
+            self.page_cache.refresh(self.url, download)
+        self.assertEqual(self.page_cache.get_cached(self.url), ("page", False))
+
+    def test_stale_while_revalidate(self):
+        download = Downloader(Response(200, {}, "old"), Response(200, {}, "new"))
+        self.page_cache.get(self.url, download)
+        self.expire(self.url)
+        download.done.clear()
+
+        # The expired page is served at once and refreshed in the background
+        self.assertEqual(self.page_cache.get(self.url, download), "old")
+        self.assertTrue(download.done.wait(5))
+        self.wait_for_refresh(self.url)
+
+        self.assertEqual(len(download.requests), 2)
+        self.assertEqual(self.page_cache.get_cached(self.url), ("new", False))
+        self.assertEqual(self.page_cache.get(self.url, download), "new")
+
+    def test_single_background_refresh(self):
+        self.page_cache.set(None, self.url, "old")
+        self.expire(self.url)
+        release = threading.Event()
+        calls = []
+
+        def slow_download(url, headers=None):
+            calls.append(url)
+            release.wait(5)
+            return Response(200, {}, "new")
+
+        for _ in range(5):
+            self.assertEqual(self.page_cache.get(self.url, slow_download), "old")
+        release.set()
+        self.wait_for_refresh(self.url)
+
+        self.assertEqual(len(calls), 1)
+
+    def test_revalidation(self):
+        download = Downloader(Response(200, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2018 00:00:00 GMT"},
+                                       "page"),
+                              Response(304, {}, ""))
+        self.page_cache.get(self.url, download)
+        self.expire(self.url)
+
+        self.assertEqual(self.page_cache.refresh(self.url, download), "page")
+        self.assertEqual(download.requests[1][1], {"If-None-Match": '"v1"',
+                                                   "If-Modified-Since": "Mon, 01 Jan 2018 00:00:00 GMT"})
+        self.assertEqual(self.page_cache.get_cached(self.url), ("page", False))
+
+
+if __name__ == '__main__':
+    unittest.main()
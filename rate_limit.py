@@ -0,0 +1,34 @@
+import threading, time
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter
+    :param rate: tokens added per second
+    :param capacity: maximum number of tokens, i.e. the allowed burst
+    """
+
+    def __init__(self, rate, capacity=None):
+        self._rate = float(rate)
+        self._capacity = float(capacity or rate)
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Block until the tokens are available, then consume them
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait = (tokens - self._tokens) / self._rate
+
+            time.sleep(wait)
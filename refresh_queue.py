@@ -0,0 +1,188 @@
+"""
+Redis structures shared by the web dynos and the background refresh worker (see worker.py):
+request counters telling which users and sets are hot, the schedule and queue of
+refresh jobs, and the upstream rate budget shared by all worker processes.
+
+A job is the JSON array ["user", <username>] to refresh a profile page, or
+["set", <username>, <set id>] to refresh the pages of a set (set id can be inventory,
+tradelist or wishlist). Usernames are lowercased, Deckbox ignores their case.
+"""
+import os, json, time, random
+import redis
+
+# Requests are counted in buckets, a job is hot when it had enough requests over the window
+REFRESH_BUCKET_SIZE = int(os.environ.get("REFRESH_BUCKET_SIZE", 600))
+REFRESH_DEMAND_WINDOW = int(os.environ.get("REFRESH_DEMAND_WINDOW", 3600))
+REFRESH_MIN_HITS = int(os.environ.get("REFRESH_MIN_HITS", 5))
+REFRESH_MAX_JOBS = int(os.environ.get("REFRESH_MAX_JOBS", 200))
+# Comma separated usernames always kept warm, in addition to the "refresh:v2:watched" Redis set
+REFRESH_WATCHED_USERS = [u for u in os.environ.get("REFRESH_WATCHED_USERS", "").split(",") if u]
+# A claimed job that isn't rescheduled within the lease (worker crash) runs again
+REFRESH_JOB_LEASE = int(os.environ.get("REFRESH_JOB_LEASE", 300))
+# Upstream requests per second allowed to all the workers together
+REFRESH_RATE_LIMIT = int(os.environ.get("REFRESH_RATE_LIMIT", 2))
+
+KEY_PREFIX = "refresh:v2:"
+
+
+def user_job(username):
+    return json.dumps(["user", username.lower()], separators=(',', ':'))
+
+
+def set_job(username, set_id):
+    return json.dumps(["set", username.lower(), set_id], separators=(',', ':'))
+
+
+def parse_job(job):
+    """
+    :return: (username, set_id) tuple, set_id is None for user jobs
+    """
+    kind, username, *set_id = json.loads(job)
+
+    return username, set_id[0] if set_id else None
+
+
+class DemandTracker:
+    """
+    Count the requests of each user and set
+    """
+
+    def __init__(self, redis_client, bucket_size=REFRESH_BUCKET_SIZE, window=REFRESH_DEMAND_WINDOW):
+        self._redis = redis_client
+        self._bucket_size = bucket_size
+        self._window = window
+
+    def get_bucket_key(self, bucket):
+        return KEY_PREFIX + "hits:" + str(bucket)
+
+    def hit(self, username, set_id=None):
+        key = self.get_bucket_key(int(time.time()) // self._bucket_size)
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.zincrby(key, user_job(username), 1)
+            if set_id:
+                pipe.zincrby(key, set_job(username, set_id), 1)
+            pipe.expire(key, self._window + self._bucket_size)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def get_hot(self, min_hits=REFRESH_MIN_HITS, limit=REFRESH_MAX_JOBS):
+        """
+        :return: jobs with at least min_hits requests over the window, most requested first
+        """
+        current = int(time.time()) // self._bucket_size
+        buckets = [self.get_bucket_key(current - i) for i in range(self._window // self._bucket_size)]
+        totals = {}
+        pipe = self._redis.pipeline(transaction=False)
+        for key in buckets:
+            pipe.zrangebyscore(key, 1, "+inf", withscores=True)
+        for hits in pipe.execute():
+            for job, count in hits:
+                job = job.decode("utf-8")
+                totals[job] = totals.get(job, 0) + count
+
+        hot = sorted((job for job, count in totals.items() if count >= min_hits), key=lambda job: -totals[job])
+
+        return hot[:limit]
+
+
+class RefreshQueue:
+    """
+    Schedule of the refresh jobs (sorted set of job to next run time) and queue of the jobs due.
+    Jobs are claimed with a lock before being queued so that several workers never queue the same job.
+    """
+
+    def __init__(self, redis_client, lease=REFRESH_JOB_LEASE):
+        self._redis = redis_client
+        self._lease = lease
+        self.schedule_key = KEY_PREFIX + "schedule"
+        self.queue_key = KEY_PREFIX + "queue"
+        self.watched_key = KEY_PREFIX + "watched"
+
+    def get_watched(self):
+        watched = {u.decode("utf-8") for u in self._redis.smembers(self.watched_key)}
+
+        return [user_job(u) for u in sorted(watched.union(REFRESH_WATCHED_USERS))]
+
+    def sync(self, jobs, spread):
+        """
+        Schedule new jobs at a random time within spread seconds, unschedule the jobs not listed
+        :return: (added, removed) counts
+        """
+        jobs = set(jobs)
+        scheduled = {job.decode("utf-8") for job in self._redis.zrange(self.schedule_key, 0, -1)}
+        added, removed = jobs - scheduled, scheduled - jobs
+
+        pipe = self._redis.pipeline()
+        if added:
+            now = time.time()
+            pipe.zadd(self.schedule_key, **{job: now + random.uniform(0, spread) for job in added})
+        if removed:
+            pipe.zrem(self.schedule_key, *removed)
+        pipe.execute()
+
+        return len(added), len(removed)
+
+    def enqueue_due(self, limit=100):
+        """
+        Move the jobs due to the queue, their next run is pushed back by the lease until they are rescheduled
+        :return: number of jobs queued
+        """
+        now = time.time()
+        due = self._redis.zrangebyscore(self.schedule_key, "-inf", now, start=0, num=limit)
+        queued = 0
+        for job in due:
+            if not self._redis.set(KEY_PREFIX + "claim:" + job.decode("utf-8"), 1, nx=True, ex=self._lease):
+                continue
+
+            pipe = self._redis.pipeline()
+            pipe.zadd(self.schedule_key, **{job.decode("utf-8"): now + self._lease})
+            pipe.rpush(self.queue_key, job)
+            pipe.execute()
+            queued += 1
+
+        return queued
+
+    def pop(self, timeout=1):
+        """
+        :return: next job queued, None if there was none within the timeout
+        """
+        item = self._redis.blpop(self.queue_key, timeout)
+
+        return item[1].decode("utf-8") if item else None
+
+    def reschedule(self, job, delay):
+        """
+        Release a job and run it again in delay seconds, unless it was unscheduled meanwhile
+        """
+        if self._redis.zscore(self.schedule_key, job) is not None:
+            self._redis.zadd(self.schedule_key, **{job: time.time() + delay})
+        self._redis.delete(KEY_PREFIX + "claim:" + job)
+
+
+class RateBudget:
+    """
+    Upstream requests budget shared by all the workers, counted per second in Redis
+    """
+
+    def __init__(self, redis_client, rate=REFRESH_RATE_LIMIT):
+        self._redis = redis_client
+        self._rate = rate
+
+    def acquire(self):
+        """
+        Block until a request fits in the budget
+        """
+        while True:
+            now = time.time()
+            key = KEY_PREFIX + "budget:" + str(int(now))
+            pipe = self._redis.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 2)
+            count, _ = pipe.execute()
+            if count <= self._rate:
+                return
+
+            # Jitter so that waiting workers don't all retry at the start of the next second
+            time.sleep(1 - now % 1 + random.uniform(0, 0.1))
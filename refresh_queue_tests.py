@@ -0,0 +1,46 @@
+import unittest
+import fakeredis
+from refresh_queue import DemandTracker, RefreshQueue, user_job, set_job, parse_job
+
+
+class RefreshQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.demand_tracker = DemandTracker(self.redis, bucket_size=600, window=3600)
+        self.queue = RefreshQueue(self.redis, lease=300)
+
+    def test_jobs(self):
+        self.assertEqual(parse_job(user_job("deckbox_api")), ("deckbox_api", None))
+        self.assertEqual(parse_job(set_job("deckbox_api", "inventory")), ("deckbox_api", "inventory"))
+
+    def test_usernames_case(self):
+        self.assertEqual(user_job("Deckbox_API"), user_job("deckbox_api"))
+        self.assertEqual(set_job("Deckbox_API", "wishlist"), set_job("deckbox_api", "wishlist"))
+
+        for username in ("Deckbox_API", "deckbox_api", "DECKBOX_API"):
+            self.demand_tracker.hit(username, "inventory")
+
+        self.assertEqual(self.demand_tracker.get_hot(min_hits=3),
+                         sorted([user_job("deckbox_api"), set_job("deckbox_api", "inventory")]))
+
+    def test_colons(self):
+        self.assertEqual(parse_job(user_job("user:name")), ("user:name", None))
+        self.assertEqual(parse_job(set_job("user:name", "set:1")), ("user:name", "set:1"))
+        self.assertNotEqual(set_job("a:b", "c"), set_job("a", "b:c"))
+
+    def test_queued_jobs(self):
+        jobs = [user_job("A:B"), set_job("A:B", "c:d")]
+        self.queue.sync(jobs, spread=0)
+
+        self.assertEqual(self.queue.enqueue_due(), 2)
+        popped = [self.queue.pop(), self.queue.pop()]
+        self.assertEqual(set(map(parse_job, popped)), {("a:b", None), ("a:b", "c:d")})
+
+        self.queue.reschedule(popped[0], 60)
+        self.assertEqual(self.queue.enqueue_due(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
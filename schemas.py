@@ -18,6 +18,8 @@ class CardSchema(Schema):
         if not 'type_line' in in_data:
             return in_data
 
+        # Copied, cards can be read only records (see card_record)
+        in_data = dict(in_data)
         types = in_data['type_line'].split(' — ')
         in_data['types'] = types[0].split(' ')
         try:
@@ -39,6 +41,38 @@ class DeckboxCardSchema(CardSchema):
     is_textless = fields.Boolean()
 
 
+class SyncCardSchema(DeckboxCardSchema):
+    id = fields.Str()
+
+
+class SetChangesSchema(Schema):
+    token = fields.Str()
+    reset = fields.Boolean()
+    added = fields.Nested(SyncCardSchema(), many=True)
+    changed = fields.Nested(SyncCardSchema(), many=True)
+    removed = fields.List(fields.Str())
+
+
+class TradeMatchSchema(Schema):
+    username = fields.Str()
+    they_have = fields.Nested(DeckboxCardSchema(), many=True)
+    they_want = fields.Nested(DeckboxCardSchema(), many=True)
+
+
+class CollectionStatsSchema(Schema):
+    id = fields.Str()
+    name = fields.Str()
+    cards = fields.Integer()
+    copies = fields.Integer()
+    unknown_copies = fields.Integer()
+    value = fields.Dict()
+    average_cmc = fields.Float()
+    mana_curve = fields.Dict()
+    colors = fields.Dict()
+    types = fields.Dict()
+    legalities = fields.Dict()
+
+
 class LastSeenOnlineSchema(Schema):
     date = fields.Str()
     timestamp = fields.Integer()
@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+from rate_limit import TokenBucket
+
+# Scryfall API base url, can point to a local stand-in server (see loadtest/fake_upstream.py)
+SCRYFALL_API_URL = os.environ.get("SCRYFALL_API_URL", "https://api.scryfall.com").rstrip("/")
+# Scryfall asks for 50-100ms between requests, i.e. 10 requests per second
+SCRYFALL_RATE_LIMIT = float(os.environ.get("SCRYFALL_RATE_LIMIT", 10))
+SCRYFALL_MAX_QUERY_LENGTH = int(os.environ.get("SCRYFALL_MAX_QUERY_LENGTH", 1000))
+SCRYFALL_MAX_WORKERS = int(os.environ.get("SCRYFALL_MAX_WORKERS", 4))
+
+rate_limiter = TokenBucket(SCRYFALL_RATE_LIMIT)
+
+
+def log(message):
+    print("LOG - " + message)
+
+
+def get(url, params=None):
+    rate_limiter.acquire()
+    response = http_client.fetch(url, params=params)
+
+    # Scryfall answers 404 when no card matches the query
+    if response.status_code == 404:
+        return None
+
+    response.raise_for_status()
+
+    return response.json()
+
+
+def search(query, **params):
+    """
+    Search cards on Scryfall
+    :param query: Scryfall full text search query
+    :param params: extra query string parameters (unique, order, page...)
+    :return: list of card objects of the first result page, empty if nothing matched
+    """
+    log("search cards q=" + query)
+    rv = get(SCRYFALL_API_URL + "/cards/search", {"q": query, **params})
+
+    return rv["data"] if rv else []
+
+
+def search_all(query, **params):
+    """
+    Search cards on Scryfall, following the result pages
+    :return: list of all matching card objects
+    """
+    log("search all cards q=" + query)
+    cards = []
+    rv = get(SCRYFALL_API_URL + "/cards/search", {"q": query, **params})
+
+    while rv:
+        cards.extend(rv["data"])
+        rv = get(rv["next_page"]) if rv.get("has_more") else None
+
+    return cards
+
+
+def get_names_query(names):
+    return " or ".join('!"{}"'.format(name.replace('"', '')) for name in names)
+
+
+def chunk_names(names, max_query_length=SCRYFALL_MAX_QUERY_LENGTH):
+    """
+    Split names into batches whose exact name query stays under max_query_length
+    """
+    chunk, length = [], 0
+    for name in names:
+        name_length = len(get_names_query([name])) + len(" or ")
+        if chunk and length + name_length > max_query_length:
+            yield chunk
+            chunk, length = [], 0
+        chunk.append(name)
+        length += name_length
+
+    if chunk:
+        yield chunk
+
+
+def resolve_names(names, max_workers=SCRYFALL_MAX_WORKERS, max_query_length=SCRYFALL_MAX_QUERY_LENGTH):
+    """
+    Get the Scryfall cards matching exactly a list of names.
+    Names are searched in bounded chunks, run concurrently under the shared
+    rate limiter, and every result page is read.
+    :return: list of card objects, names without any match are simply missing
+    """
+    chunks = list(chunk_names(sorted(set(names)), max_query_length))
+    if not chunks:
+        return []
+
+    if len(chunks) == 1:
+        return search_all(get_names_query(chunks[0]))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        results = executor.map(lambda chunk: search_all(get_names_query(chunk)), chunks)
+
+    return [card for cards in results for card in cards]
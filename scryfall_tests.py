@@ -0,0 +1,109 @@
+import json, threading, unittest
+from unittest import mock
+import scryfall
+
+
+class FakeScryfall:
+    """
+    Answers the search requests with pages of the fixture cards matching the exact name queries
+    """
+
+    def __init__(self, cards, page_size=2):
+        self.cards = {card["name"]: card for card in cards}
+        self.page_size = page_size
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url, params=None):
+        with self._lock:
+            self.requests.append((url, params))
+
+        if params is None:
+            # next_page url: <query>|<page>
+            query, page = url.split("|")
+            page = int(page)
+        else:
+            query, page = params["q"], 1
+
+        names = [name.strip()[2:-1] for name in query.split(" or ")]
+        cards = [self.cards[name] for name in names if name in self.cards]
+        if not cards:
+            return None
+
+        start = (page - 1) * self.page_size
+        has_more = start + self.page_size < len(cards)
+        rv = {"data": cards[start:start + self.page_size], "has_more": has_more}
+        if has_more:
+            rv["next_page"] = "{}|{}".format(query, page + 1)
+
+        return rv
+
+
+class ScryfallTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixture_path = "tests/fixtures/"
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards = json.load(f)
+        self.names = [card["name"] for card in self.cards]
+        self.fake_scryfall = FakeScryfall(self.cards)
+
+    def test_names_query(self):
+        self.assertEqual(scryfall.get_names_query(["Black Lotus", 'Say "Hi"']), '!"Black Lotus" or !"Say Hi"')
+
+    def test_chunk_names(self):
+        chunks = list(scryfall.chunk_names(self.names, max_query_length=60))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([name for chunk in chunks for name in chunk], self.names)
+        for chunk in chunks:
+            self.assertLessEqual(len(scryfall.get_names_query(chunk)), 60)
+
+        # A name longer than the limit still gets its own chunk
+        self.assertEqual(list(scryfall.chunk_names(["Nicol Bolas, Planeswalker"], max_query_length=10)),
+                         [["Nicol Bolas, Planeswalker"]])
+        self.assertEqual(list(scryfall.chunk_names([])), [])
+
+    def test_search_all_follows_pages(self):
+        with mock.patch.object(scryfall, "get", self.fake_scryfall):
+            cards = scryfall.search_all(scryfall.get_names_query(self.names[:5]))
+
+        self.assertEqual([card["name"] for card in cards], self.names[:5])
+        self.assertEqual(len(self.fake_scryfall.requests), 3)
+
+    def test_search_without_results(self):
+        with mock.patch.object(scryfall, "get", self.fake_scryfall):
+            self.assertEqual(scryfall.search_all('!"Unknown Card"'), [])
+            self.assertEqual(scryfall.search('!"Unknown Card"'), [])
+
+    def test_resolve_names(self):
+        names = self.names + ["Unknown Card"] + self.names[:3]
+
+        with mock.patch.object(scryfall, "get", self.fake_scryfall):
+            cards = scryfall.resolve_names(names, max_workers=3, max_query_length=80)
+
+        self.assertEqual(sorted(card["name"] for card in cards), sorted(self.names))
+        # Each chunk is searched once, with its pages
+        queries = [params["q"] for url, params in self.fake_scryfall.requests if params]
+        self.assertEqual(len(queries), len(set(queries)))
+        self.assertGreater(len(queries), 1)
+        for query in queries:
+            self.assertLessEqual(len(query), 80)
+
+    def test_resolve_no_names(self):
+        with mock.patch.object(scryfall, "get", self.fake_scryfall):
+            self.assertEqual(scryfall.resolve_names([]), [])
+
+        self.assertEqual(self.fake_scryfall.requests, [])
+
+    def test_not_found(self):
+        response = mock.Mock(status_code=404)
+
+        with mock.patch.object(scryfall.http_client, "fetch", return_value=response):
+            self.assertIsNone(scryfall.get(scryfall.SCRYFALL_API_URL + "/cards/search", {"q": "!\"Unknown\""}))
+        response.raise_for_status.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Precompiled serializers for the marshmallow schemas of the hot endpoints.
+A schema is compiled once into a plan of (key, attribute, default, converter)
+per field, dumping then skips marshmallow's per field machinery. The output is
+the same as Schema.dump, anything the plan doesn't cover (unknown field types,
+hooks without a known equivalent, invalid values) goes through marshmallow.
+"""
+from marshmallow import Schema, ValidationError, fields, utils, missing
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from schemas import CardSchema
+from card_record import CardRecord
+
+_UNSUPPORTED_HOOKS = [(PRE_DUMP, True), (POST_DUMP, False), (POST_DUMP, True)]
+
+
+class SchemaNotCompilable(Exception):
+    pass
+
+
+class _Fallback(Exception):
+    pass
+
+
+def get_card_types(card):
+    """
+    CardSchema.extract_types without mutating the card
+    :return: dict of the attributes extract_types would set
+    """
+    if 'type_line' not in card:
+        return None
+
+    types = card['type_line'].split(' — ')
+    if len(types) > 1:
+        return {'types': types[0].split(' '), 'subtypes': types[1].split(' ')}
+
+    return {'types': types[0].split(' ')}
+
+
+# Pre dump hooks and their non mutating equivalents
+PRE_DUMP_EQUIVALENTS = {
+    CardSchema.extract_types: get_card_types,
+}
+
+
+def compile_field(field):
+    """
+    :return: function converting a value like field._serialize
+    """
+    field_type = type(field)
+
+    if field_type is fields.String:
+        def convert(value):
+            if type(value) is str:
+                return value
+            return None if value is None else utils.ensure_text_type(value)
+
+    elif field_type is fields.Integer and not field.as_string and not field.strict:
+        def convert(value):
+            if type(value) is int:
+                return value
+            if type(value) is float:
+                return int(value)
+            return field._serialize(value, None, None)
+
+    elif field_type is fields.Boolean and field.truthy == fields.Boolean.truthy and field.falsy == fields.Boolean.falsy:
+        def convert(value):
+            if value is True or value is False:
+                return value
+            return field._serialize(value, None, None)
+
+    elif field_type is fields.List:
+        convert_item = compile_field(field.container)
+
+        def convert(value):
+            if type(value) is list:
+                return [convert_item(item) for item in value]
+            return field._serialize(value, None, None)
+
+    elif field_type is fields.Dict:
+        if field.key_container is None and field.value_container is None:
+            return lambda value: value
+
+        convert_key = compile_field(field.key_container) if field.key_container else None
+        convert_value = compile_field(field.value_container) if field.value_container else None
+
+        def convert(value):
+            if type(value) is not dict:
+                return field._serialize(value, None, None)
+            keys = [convert_key(key) for key in value] if convert_key else value.keys()
+            values = [convert_value(item) for item in value.values()] if convert_value else value.values()
+            return dict(zip(keys, values))
+
+    elif field_type is fields.Nested and not field.only and not field.exclude:
+        nested = compile_schema(field.schema)
+        many = field.many
+
+        def convert(value):
+            return None if value is None else nested.dump(value, many=many)
+
+    else:
+        raise SchemaNotCompilable("Unsupported field {!r}".format(field))
+
+    return convert
+
+
+def compile_fields(schema):
+    if type(schema).get_attribute is not Schema.get_attribute or schema.prefix:
+        raise SchemaNotCompilable("Custom attribute access")
+
+    plan = []
+    for name, field in schema.fields.items():
+        if field.load_only:
+            continue
+
+        attribute = field.attribute or name
+        if '.' in attribute:
+            raise SchemaNotCompilable("Nested attribute {}".format(attribute))
+
+        plan.append((field.data_key or name, attribute, field.default, compile_field(field)))
+
+    return plan
+
+
+def compile_pre_dump(schema):
+    if any(schema._hooks[hook] for hook in _UNSUPPORTED_HOOKS):
+        raise SchemaNotCompilable("Unsupported hooks")
+
+    processors = []
+    for attr_name in schema._hooks[(PRE_DUMP, False)]:
+        hook = getattr(type(schema), attr_name)
+        if hook not in PRE_DUMP_EQUIVALENTS:
+            raise SchemaNotCompilable("No equivalent for the {} hook".format(attr_name))
+        processors.append(PRE_DUMP_EQUIVALENTS[hook])
+
+    return processors
+
+
+class CompiledSchema:
+    """
+    Drop in replacement of a schema instance for dumping
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.many = schema.many
+        self._dict_class = schema.dict_class
+        self._plan = compile_fields(schema)
+        self._pre_dump = compile_pre_dump(schema)
+
+    def dump(self, obj, many=None):
+        many = self.many if many is None else bool(many)
+
+        try:
+            if many:
+                return [self.dump_item(item) for item in obj]
+            return self.dump_item(obj)
+        except (_Fallback, ValidationError, TypeError, ValueError, AttributeError, KeyError):
+            # Let marshmallow serialize it, or raise its own error
+            return self.schema.dump(obj, many=many)
+
+    def dump_item(self, obj):
+        if type(obj) is not dict and type(obj) is not CardRecord:
+            raise _Fallback()
+
+        for processor in self._pre_dump:
+            overrides = processor(obj)
+            if overrides:
+                obj = {**obj, **overrides}
+
+        rv = self._dict_class()
+        for key, attribute, default, convert in self._plan:
+            value = obj.get(attribute, missing)
+            if value is missing:
+                if default is missing:
+                    continue
+                value = default() if callable(default) else default
+            rv[key] = convert(value)
+
+        return rv
+
+
+def compile_schema(schema):
+    """
+    :param schema: marshmallow schema instance
+    :return: a CompiledSchema, or the schema itself if it can't be compiled
+    """
+    try:
+        return CompiledSchema(schema)
+    except SchemaNotCompilable:
+        return schema
@@ -0,0 +1,119 @@
+import json, types, unittest
+from marshmallow import Schema, fields, post_dump
+from benchmark import SnapshotCrawler, load_snapshot
+from card_cache import compact
+from card_record import CardRecord, extend_card
+from serializers import CompiledSchema, compile_schema
+from schemas import (CardSchema, DeckboxCardSchema, SyncCardSchema, SetChangesSchema, TradeMatchSchema,
+                     CollectionStatsSchema, SetSchema, UserSchema)
+
+
+class SerializersTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.fixture_path = "tests/fixtures/"
+
+        with open(self.fixture_path + "scryfall/cards.json", encoding="utf-8") as f:
+            self.cards_meta = [compact(card) for card in json.load(f)]
+
+        profile = load_snapshot("profile.html")
+        pages = {"profile": profile, "friends": load_snapshot("friends.html")}
+        self.inventory = self.getCardsFromPage(pages, load_snapshot("inventory.html"))
+        self.deck = self.getCardsFromPage(pages, load_snapshot("deck.html"))
+        crawler = SnapshotCrawler(dict(pages, default=profile))
+        self.user = {**crawler.getUserProfile(), "sets": crawler.getUserSets()}
+
+    def getCardsFromPage(self, pages, page):
+        crawler = SnapshotCrawler(dict(pages, set=page, default=page))
+        crawler.getPage(crawler._HTTP + crawler._DECKBOX_DOMAIN + "/sets/1")
+
+        return crawler.getCardsFromPage()
+
+    def getExtendedRows(self):
+        """
+        Inventory rows with the metadata of the fixture cards, and one unknown card
+        """
+        rows = self.inventory["cards"]
+        metas = self.cards_meta + [None]
+
+        return [extend_card(row, metas[i % len(metas)]) for i, row in enumerate(rows)]
+
+    def assertDumpsEqual(self, schema, obj, **kwargs):
+        compiled = compile_schema(schema)
+
+        self.assertEqual(compiled.dump(obj, **kwargs), schema.dump(obj, **kwargs))
+
+    def test_snapshots_are_records(self):
+        self.assertGreater(len(self.inventory["cards"]), 0)
+        self.assertIs(type(self.inventory["cards"][0]), CardRecord)
+
+    def test_schemas_are_compiled(self):
+        for schema in (CardSchema(), DeckboxCardSchema(many=True), SetSchema(), UserSchema(), SetChangesSchema(),
+                       TradeMatchSchema(many=True)):
+            self.assertIsInstance(compile_schema(schema), CompiledSchema)
+
+    def test_inventory(self):
+        self.assertDumpsEqual(DeckboxCardSchema(many=True), self.inventory["cards"])
+        self.assertDumpsEqual(DeckboxCardSchema(many=True), [row.to_dict() for row in self.inventory["cards"]])
+
+    def test_extended_inventory(self):
+        rows = self.getExtendedRows()
+
+        self.assertDumpsEqual(DeckboxCardSchema(many=True), rows)
+        self.assertEqual(compile_schema(DeckboxCardSchema(many=True)).dump(rows),
+                         DeckboxCardSchema(many=True).dump([row.to_dict() for row in rows]))
+
+    def test_deck(self):
+        self.assertDumpsEqual(SetSchema(), self.deck)
+
+    def test_user(self):
+        self.assertDumpsEqual(UserSchema(), self.user)
+
+    def test_cards(self):
+        self.assertDumpsEqual(CardSchema(many=True), self.cards_meta)
+        self.assertDumpsEqual(CardSchema(), self.cards_meta[0])
+        self.assertDumpsEqual(CardSchema(), {"name": "Black Lotus", "type_line": "Artifact"})
+
+    def test_nested(self):
+        rows = [dict(row.to_dict(), id=str(i)) for i, row in enumerate(self.getExtendedRows())]
+
+        self.assertDumpsEqual(SetChangesSchema(), {"token": "1.2", "reset": False, "added": rows[:3],
+                                                   "changed": rows[3:], "removed": ["12", "13"]})
+        self.assertDumpsEqual(TradeMatchSchema(many=True), [{"username": "deckbox_api", "they_have": rows[:2],
+                                                             "they_want": []}])
+        self.assertDumpsEqual(SyncCardSchema(many=True), rows)
+
+    def test_collection_stats(self):
+        self.assertDumpsEqual(CollectionStatsSchema(), {"id": "inventory", "cards": 3, "copies": 4,
+                                                        "average_cmc": 2, "mana_curve": {"0": 1}})
+
+    def test_conversions(self):
+        # Values of other types than the ones parsed go through the same conversions as marshmallow
+        self.assertDumpsEqual(DeckboxCardSchema(), {"name": 12, "count": "3", "is_foil": 1, "cmc": 2.5,
+                                                    "multiverse_id": [1, 2], "types": None})
+        self.assertDumpsEqual(DeckboxCardSchema(), {"count": None, "is_foil": None, "edition": None})
+        self.assertDumpsEqual(DeckboxCardSchema(), {})
+
+    def test_fallback(self):
+        # Other mappings than dicts and records are dumped by marshmallow
+        row = types.MappingProxyType({"name": "Black Lotus", "count": 2, "type_line": "Artifact"})
+
+        self.assertDumpsEqual(DeckboxCardSchema(), row)
+        self.assertDumpsEqual(DeckboxCardSchema(many=True), [row, {"name": "Annul", "count": 1}])
+
+    def test_not_compilable(self):
+        class WrappedSchema(Schema):
+            name = fields.Str()
+
+            @post_dump(pass_many=True)
+            def wrap(self, data, many):
+                return {"items": data}
+
+        schema = WrappedSchema(many=True)
+        self.assertIs(compile_schema(schema), schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os, json
+import redis
+
+SET_LIST_TTL = int(os.environ.get("SET_LIST_TTL", 7 * 24 * 3600))
+
+
+def find_set(sets, set_id):
+    """
+    :param set_id: set id or name (inventory, tradelist, wishlist, deck name)
+    :return: the matching set, None if there is none
+    """
+    for current_set in sets:
+        if set_id == current_set["id"] or set_id == current_set["name"]:
+            return current_set
+
+    return None
+
+
+class SetListCache:
+    """
+    Redis cache of the sets of each user (id and name, from the menu of the user page).
+    Set ids don't change, so set pages can be crawled without the user page.
+    The list is rewritten each time a user page is parsed.
+    """
+    KEY_PREFIX = "set_list:v1:"
+
+    def __init__(self, redis_client, ttl=SET_LIST_TTL):
+        self._redis = redis_client
+        self._ttl = ttl
+
+    def key(self, username):
+        return self.KEY_PREFIX + username.lower()
+
+    def get(self, username):
+        """
+        :return: list of sets, None if the user sets are not cached
+        """
+        try:
+            value = self._redis.get(self.key(username))
+        except redis.RedisError:
+            return None
+
+        return json.loads(value.decode("utf-8")) if value is not None else None
+
+    def set(self, username, sets):
+        try:
+            self._redis.set(self.key(username), json.dumps(sets, separators=(',', ':')), ex=self._ttl)
+        except redis.RedisError:
+            pass
+
+    def delete(self, username):
+        try:
+            self._redis.delete(self.key(username))
+        except redis.RedisError:
+            pass
@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+import http_client
+from deckbox_crawler import DeckboxCrawler
+from loadtest import fake_upstream
+from offline import OfflineTestCase
+from set_list_cache import SetListCache, find_set
+from singleflight_tests import BrokenRedis
+
+USER_URL = "https://deckbox.org/users/deckbox_api"
+INVENTORY_URL = "https://deckbox.org/sets/590740?p=1&s=n&o=a"
+
+
+class SetListCacheTestCase(OfflineTestCase):
+    """
+    The user page is only downloaded by the operations needing it, set ids are then read from the set list cache
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.set_list_cache = DeckboxCrawler.set_list_cache
+
+    def test_find_set(self):
+        sets = [{"id": "590740", "name": "inventory"}, {"id": "608751", "name": "Sideboard deck"}]
+
+        self.assertEqual(find_set(sets, "inventory"), sets[0])
+        self.assertEqual(find_set(sets, "608751"), sets[1])
+        self.assertEqual(find_set(sets, "Sideboard deck"), sets[1])
+        self.assertIsNone(find_set(sets, "wishlist"))
+
+    def test_friends_without_the_user_page(self):
+        self.assertEqual(self.get("/api/users/deckbox_api/friends/").status_code, 200)
+
+        self.assertEqual(self.getUpstreamUrls(), [USER_URL + "/friends"])
+
+    def test_set_pages_without_the_user_page(self):
+        self.assertEqual(self.get("/api/users/deckbox_api/inventory").status_code, 200)
+        self.assertEqual(self.getUpstreamUrls()[:2], [USER_URL, INVENTORY_URL])
+        self.assertEqual(self.set_list_cache.get("DECKBOX_API")[:3], [
+            {"id": "590740", "name": "inventory"},
+            {"id": "590741", "name": "tradelist"},
+            {"id": "590742", "name": "wishlist"},
+        ])
+
+        # Another set of the same user, whatever the case of the username, with no page cached
+        self.redis.delete(*self.redis.keys(DeckboxCrawler.page_cache.KEY_PREFIX + "*"))
+        http_client.fetch.reset_mock()
+        self.assertEqual(self.get("/api/users/Deckbox_API/wishlist").status_code, 200)
+        self.assertEqual([url for url in self.getUpstreamUrls() if "deckbox.org" in url],
+                         ["https://deckbox.org/sets/590742?p=1&s=n&o=a"])
+
+    def test_profile_writes_the_set_list(self):
+        status, user = self.getJson("/api/users/deckbox_api")
+
+        self.assertEqual(status, 200)
+        # Ids are serialized as numbers
+        self.assertEqual(self.set_list_cache.get("deckbox_api"), [{"id": str(s["id"]), "name": s["name"]}
+                                                                  for s in user["sets"]])
+
+    def test_deleted_set(self):
+        # The cached id is now a page without cards
+        self.set_list_cache.set("deckbox_api", [{"id": "1", "name": "inventory"}])
+        with mock.patch.dict(fake_upstream.PAGES, deck="<html><body></body></html>"):
+            status, inventory = self.getJson("/api/users/deckbox_api/inventory")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(inventory["items"]), 100)
+        self.assertEqual([url for url in self.getUpstreamUrls() if "deckbox.org" in url],
+                         ["https://deckbox.org/sets/1?p=1&s=n&o=a", USER_URL, INVENTORY_URL])
+        self.assertEqual(self.set_list_cache.get("deckbox_api")[0], {"id": "590740", "name": "inventory"})
+
+    def test_unknown_set(self):
+        self.set_list_cache.set("deckbox_api", [{"id": "590740", "name": "inventory"}])
+
+        self.assertEqual(self.get("/api/users/deckbox_api/sets/unknown").status_code, 404)
+        # Looked up on the user page
+        self.assertEqual(self.getUpstreamUrls(), [USER_URL])
+
+    def test_redis_errors(self):
+        with mock.patch.object(DeckboxCrawler, "set_list_cache", SetListCache(BrokenRedis())):
+            self.assertEqual(self.get("/api/users/deckbox_api/inventory").status_code, 200)
+
+        self.assertEqual(self.getUpstreamUrls()[:2], [USER_URL, INVENTORY_URL])
+
+
+if __name__ == '__main__':
+    unittest.main()
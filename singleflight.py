@@ -0,0 +1,78 @@
+import json, time, uuid
+import redis
+
+SINGLE_FLIGHT_LOCK_TTL = 30
+SINGLE_FLIGHT_RESULT_TTL = 5
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+class SingleFlight:
+    """
+    Coalesce identical upstream calls across all workers.
+    The first caller for a key takes a Redis lock and runs the call, concurrent
+    callers wait for its result instead of running the same call again.
+    """
+    KEY_PREFIX = "singleflight:"
+
+    def __init__(self, redis_client, lock_ttl=SINGLE_FLIGHT_LOCK_TTL, result_ttl=SINGLE_FLIGHT_RESULT_TTL,
+                 poll_interval=SINGLE_FLIGHT_POLL_INTERVAL, dumps=json.dumps, loads=json.loads):
+        self._redis = redis_client
+        self._lock_ttl = lock_ttl
+        self._result_ttl = result_ttl
+        self._poll_interval = poll_interval
+        self._dumps = dumps
+        self._loads = loads
+
+    def do(self, key, fn):
+        """
+        Run fn once for all concurrent callers using the same key
+        :param key: identifies the upstream call (url, query...)
+        :param fn: function without arguments, its result must be serializable with dumps
+        :return: fn result, either computed here or by the worker holding the lock
+        """
+        lock_key = self.KEY_PREFIX + "lock:" + key
+        result_key = self.KEY_PREFIX + "result:" + key
+        token = uuid.uuid4().hex
+        deadline = time.time() + self._lock_ttl
+
+        locked = False
+        # Only the Redis calls are guarded: errors of fn, Redis ones included, are raised to the caller
+        try:
+            while time.time() < deadline:
+                result = self._redis.get(result_key)
+                if result is not None:
+                    return self._loads(result)
+
+                if self._redis.set(lock_key, token, nx=True, ex=self._lock_ttl):
+                    locked = True
+                    break
+
+                # Another worker is running the call, wait until it stores the result
+                # or releases the lock without one
+                while self._redis.exists(lock_key) and time.time() < deadline:
+                    result = self._redis.get(result_key)
+                    if result is not None:
+                        return self._loads(result)
+                    time.sleep(self._poll_interval)
+        except redis.RedisError:
+            pass
+
+        if locked:
+            return self._lead(lock_key, result_key, token, fn)
+
+        return fn()
+
+    def _lead(self, lock_key, result_key, token, fn):
+        try:
+            rv = fn()
+            try:
+                self._redis.set(result_key, self._dumps(rv), ex=self._result_ttl)
+            except redis.RedisError:
+                pass
+            return rv
+        finally:
+            try:
+                if self._redis.get(lock_key) == token.encode():
+                    self._redis.delete(lock_key)
+            except redis.RedisError:
+                pass
@@ -0,0 +1,101 @@
+import time, threading, unittest, collections
+import fakeredis
+import redis
+from singleflight import SingleFlight
+from page_cache import PageCache
+
+Response = collections.namedtuple("Response", ("status_code", "headers", "text"))
+
+
+class BrokenRedis:
+    """
+    Redis client whose calls all fail
+    """
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("Redis is down")
+        return fail
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.single_flight = SingleFlight(self.redis, poll_interval=0.01)
+
+    def run_concurrently(self, fn, callers=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fn())) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        return results
+
+    def test_concurrent_calls_run_once(self):
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"cards": ["Black Lotus"]}
+
+        results = self.run_concurrently(lambda: self.single_flight.do("search", slow_call))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"cards": ["Black Lotus"]}] * 8)
+        self.assertFalse(self.redis.exists(SingleFlight.KEY_PREFIX + "lock:search"))
+
+    def test_keys_are_independent(self):
+        self.assertEqual(self.single_flight.do("a", lambda: 1), 1)
+        self.assertEqual(self.single_flight.do("b", lambda: 2), 2)
+
+    def test_failed_call_releases_the_lock(self):
+        def failing_call():
+            raise ValueError("upstream error")
+
+        with self.assertRaises(ValueError):
+            self.single_flight.do("search", failing_call)
+
+        self.assertFalse(self.redis.exists(SingleFlight.KEY_PREFIX + "lock:search"))
+        self.assertEqual(self.single_flight.do("search", lambda: "retried"), "retried")
+
+    def test_call_raising_redis_errors_runs_once(self):
+        calls = []
+
+        def failing_call():
+            calls.append(1)
+            raise redis.ConnectionError("upstream cache is down")
+
+        with self.assertRaises(redis.ConnectionError):
+            self.single_flight.do("search", failing_call)
+
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(self.redis.exists(SingleFlight.KEY_PREFIX + "lock:search"))
+
+    def test_redis_errors(self):
+        single_flight = SingleFlight(BrokenRedis())
+
+        self.assertEqual(single_flight.do("search", lambda: "uncoalesced"), "uncoalesced")
+
+    def test_page_cache_misses_share_a_download(self):
+        page_cache = PageCache(self.redis)
+        page_cache._single_flight = self.single_flight
+        calls = []
+
+        def slow_download(url, headers=None):
+            calls.append(url)
+            time.sleep(0.2)
+            return Response(200, {}, "page")
+
+        results = self.run_concurrently(lambda: page_cache.get("https://deckbox.org/sets/1", slow_download))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["page"] * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
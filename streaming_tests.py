@@ -0,0 +1,56 @@
+import json, unittest
+from unittest import mock
+from loadtest import fake_upstream
+from offline import OfflineTestCase
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class StreamingTestCase(OfflineTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/users/" + self.test_username + "/inventory"
+
+    def getLines(self, url, headers=None):
+        response = self.get(url, headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, NDJSON_MIMETYPE)
+        self.assertTrue(response.is_streamed)
+
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_stream_page(self):
+        items = self.getJson(self.url)[1]["items"]
+
+        self.assertEqual(self.getLines(self.url + "?stream=1"), items)
+        self.assertEqual(self.getLines(self.url, {"Accept": NDJSON_MIMETYPE}), items)
+
+    def test_stream_all_pages(self):
+        items = self.getJson(self.url + "?page=all")[1]["items"]
+
+        self.assertEqual(len(items), 300)
+        self.assertEqual(self.getLines(self.url + "?page=all&stream=1"), items)
+
+    def test_streamed_responses_are_not_buffered(self):
+        response = self.get(self.url + "?page=all&stream=1", {"Accept-Encoding": "gzip, br"})
+
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+        self.assertIsNone(response.headers.get("ETag"))
+        self.assertIsNone(response.headers.get("Content-Length"))
+
+    def test_not_found(self):
+        # A user page without any set
+        with mock.patch.dict(fake_upstream.PAGES, profile="<html><body></body></html>"):
+            for url in (self.url + "?stream=1", self.url + "?page=all&stream=1"):
+                with self.subTest(url=url):
+                    response = self.get(url)
+
+                    self.assertEqual(response.status_code, 404)
+                    self.assertEqual(response.mimetype, "application/json")
+                    self.assertEqual(json.loads(response.get_data(as_text=True)),
+                                     {"status": "error", "description": "The user doesn't have the specified set."})
+
+
+if __name__ == '__main__':
+    unittest.main()
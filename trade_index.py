@@ -0,0 +1,154 @@
+"""
+Inverted index of the users' tradelists and wishlists, to find who has the cards a user wants
+and who wants the cards a user trades without crawling everybody's lists.
+
+    trades:v1:have:<card name> -> set of the users with the card in their tradelist
+    trades:v1:want:<card name> -> set of the users with the card in their wishlist
+    trades:v1:user:<username>:have / :want -> hash of card name to the list rows of that card
+    trades:v1:user:<username> -> hash with the username and the time each list was indexed
+
+Lists are re-indexed each time they are completely crawled, only the card names added
+or removed since the last crawl update the inverted sets. Users whose index expired are
+removed from the inverted sets when a match finds them.
+"""
+import os, time, json
+import redis
+from card_cache import normalize_name
+from json_encoder import dumps
+
+TRADE_INDEX_TTL = int(os.environ.get("TRADE_INDEX_TTL", 30 * 24 * 3600))
+# Lists of the user asking for matches are crawled again when they were indexed longer ago
+TRADE_INDEX_MAX_AGE = int(os.environ.get("TRADE_INDEX_MAX_AGE", 900))
+
+# List indexed under each side of the index
+TRADE_LISTS = {
+    "tradelist": "have",
+    "wishlist": "want",
+}
+
+
+def get_printing(card):
+    """
+    :return: (edition code, foil) tuple of a list row
+    """
+    code = (card.get("edition") or {}).get("code")
+    if isinstance(code, (list, tuple)):
+        code = code[0] if code else None
+
+    return code, bool(card.get("is_foil"))
+
+
+class TradeIndex:
+    KEY_PREFIX = "trades:v1:"
+
+    def __init__(self, redis_client, ttl=TRADE_INDEX_TTL):
+        self._redis = redis_client
+        self._ttl = ttl
+
+    def user_key(self, username, side=None):
+        key = self.KEY_PREFIX + "user:" + username.lower()
+
+        return key + ":" + side if side else key
+
+    def card_key(self, side, name):
+        return self.KEY_PREFIX + side + ":" + name
+
+    def update(self, username, set_name, cards):
+        """
+        Index the complete content of a tradelist or a wishlist
+        :param cards: parsed rows of every page of the list
+        """
+        side = TRADE_LISTS[set_name]
+        user = username.lower()
+        rows = {}
+        for card in cards:
+            rows.setdefault(normalize_name(card["name"]), []).append({k: v for k, v in card.items() if k != "id"})
+
+        try:
+            indexed = {name.decode("utf-8") for name in self._redis.hkeys(self.user_key(username, side))}
+
+            pipe = self._redis.pipeline()
+            pipe.delete(self.user_key(username, side))
+            if rows:
+                pipe.hmset(self.user_key(username, side), {name: dumps(card_rows) for name, card_rows in rows.items()})
+                pipe.expire(self.user_key(username, side), self._ttl)
+            for name in indexed.difference(rows):
+                pipe.srem(self.card_key(side, name), user)
+            for name in set(rows).difference(indexed):
+                pipe.sadd(self.card_key(side, name), user)
+            pipe.hmset(self.user_key(username), {"username": username, set_name + "_indexed_at": time.time()})
+            pipe.expire(self.user_key(username), self._ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            print("LOG - trade index update failed for {}: {!r}".format(username, e))
+
+    def get_indexed_at(self, username):
+        """
+        :return: dict of list name to the time it was last indexed, missing if it never was
+        """
+        entry = self._redis.hgetall(self.user_key(username))
+
+        return {set_name: float(entry[(set_name + "_indexed_at").encode("utf-8")])
+                for set_name in TRADE_LISTS if (set_name + "_indexed_at").encode("utf-8") in entry}
+
+    def get_matches(self, username, users=None, strict=False):
+        """
+        Match the wishlist of a user with the tradelists of the other users, and its tradelist with their wishlists
+        :param users: lowercase usernames to match with (friends...), None for all the indexed users
+        :param strict: only match the same edition and foiling
+        :return: list of {"username", "they_have", "they_want"}, users matching both ways first
+        """
+        user = username.lower()
+        mine = {}
+        for side in ("want", "have"):
+            mine[side] = {name.decode("utf-8"): json.loads(card_rows.decode("utf-8"))
+                          for name, card_rows in self._redis.hgetall(self.user_key(username, side)).items()}
+
+        # Users having what the user wants, and wanting what the user has
+        candidates = {}
+        for my_side, their_side in (("want", "have"), ("have", "want")):
+            names = list(mine[my_side])
+            pipe = self._redis.pipeline(transaction=False)
+            for name in names:
+                pipe.smembers(self.card_key(their_side, name))
+            for name, holders in zip(names, pipe.execute()):
+                for holder in holders:
+                    holder = holder.decode("utf-8")
+                    if holder != user and (users is None or holder in users):
+                        candidates.setdefault((holder, their_side), []).append(name)
+
+        # Their rows of the matched cards, users whose index expired are dropped from the sets
+        pipe = self._redis.pipeline(transaction=False)
+        for (holder, their_side), names in candidates.items():
+            pipe.hmget(self.user_key(holder, their_side), names)
+            pipe.hget(self.user_key(holder), "username")
+        results = pipe.execute()
+
+        matches = {}
+        stale = self._redis.pipeline(transaction=False)
+        for i, ((holder, their_side), names) in enumerate(candidates.items()):
+            card_rows, display_name = results[2 * i], results[2 * i + 1]
+            my_side = "want" if their_side == "have" else "have"
+            match = matches.setdefault(holder, {"username": (display_name or holder.encode("utf-8")).decode("utf-8"),
+                                                "they_have": [], "they_want": []})
+            for name, rows in zip(names, card_rows):
+                if rows is None:
+                    stale.srem(self.card_key(their_side, name), holder)
+                    continue
+
+                rows = json.loads(rows.decode("utf-8"))
+                if strict:
+                    printings = {get_printing(row) for row in mine[my_side][name]}
+                    rows = [row for row in rows if get_printing(row) in printings]
+                match["they_" + their_side].extend(rows)
+        stale.execute()
+
+        matches = [match for match in matches.values() if match["they_have"] or match["they_want"]]
+        for match in matches:
+            match["they_have"].sort(key=lambda row: row["name"])
+            match["they_want"].sort(key=lambda row: row["name"])
+        matches.sort(key=lambda match: (not (match["they_have"] and match["they_want"]),
+                                        -len(match["they_have"]) - len(match["they_want"]),
+                                        match["username"].lower()))
+
+        return matches
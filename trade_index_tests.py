@@ -0,0 +1,79 @@
+import unittest
+import fakeredis
+from trade_index import TradeIndex, get_printing
+
+
+def card(name, code="LEA", is_foil=False, count=1):
+    return {"id": name + code, "name": name, "count": count, "edition": {"code": code, "name": code},
+            "is_foil": is_foil}
+
+
+def listed(*args, **kwargs):
+    # Rows are indexed without their Deckbox id
+    return {k: v for k, v in card(*args, **kwargs).items() if k != "id"}
+
+
+class TradeIndexTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.trade_index = TradeIndex(self.redis, ttl=3600)
+
+        self.trade_index.update("Alice", "wishlist", [card("Black Lotus"), card("Annul", "M11")])
+        self.trade_index.update("Alice", "tradelist", [card("Counterspell", "ICE")])
+        self.trade_index.update("Bob", "tradelist", [card("Black Lotus", "2ED"), card("Annul", "M11", True)])
+        self.trade_index.update("Bob", "wishlist", [card("Counterspell", "ICE")])
+        self.trade_index.update("Carol", "tradelist", [card("Annul", "M11")])
+
+    def test_get_printing(self):
+        self.assertEqual(get_printing(card("Annul", "M11", True)), ("M11", True))
+        self.assertEqual(get_printing({"name": "Annul", "edition": {"code": ["M11", "Magic 2011"]}}), ("M11", False))
+        self.assertEqual(get_printing({"name": "Annul"}), (None, False))
+
+    def test_matches(self):
+        self.assertEqual(self.trade_index.get_matches("alice"), [
+            # Matching both ways first
+            {"username": "Bob", "they_have": [listed("Annul", "M11", True), listed("Black Lotus", "2ED")],
+             "they_want": [listed("Counterspell", "ICE")]},
+            {"username": "Carol", "they_have": [listed("Annul", "M11")], "they_want": []},
+        ])
+
+    def test_strict_matches(self):
+        self.assertEqual(self.trade_index.get_matches("Alice", strict=True), [
+            {"username": "Bob", "they_have": [], "they_want": [listed("Counterspell", "ICE")]},
+            {"username": "Carol", "they_have": [listed("Annul", "M11")], "they_want": []},
+        ])
+
+    def test_matches_among_users(self):
+        matches = self.trade_index.get_matches("Alice", users={"carol"})
+
+        self.assertEqual([match["username"] for match in matches], ["Carol"])
+
+    def test_reindexed_list(self):
+        self.trade_index.update("Carol", "tradelist", [card("Black Lotus")])
+
+        self.assertEqual(self.redis.smembers(self.trade_index.card_key("have", "annul")), {b"bob"})
+        self.assertEqual(self.trade_index.get_matches("Alice", strict=True)[1],
+                         {"username": "Carol", "they_have": [listed("Black Lotus")], "they_want": []})
+
+    def test_expired_users(self):
+        self.redis.delete(self.trade_index.user_key("Carol", "have"))
+
+        self.assertEqual([match["username"] for match in self.trade_index.get_matches("Alice")], ["Bob"])
+        # Dropped from the inverted sets when found
+        self.assertEqual(self.redis.smembers(self.trade_index.card_key("have", "annul")), {b"bob"})
+
+    def test_indexed_at(self):
+        self.assertEqual(set(self.trade_index.get_indexed_at("alice")), {"tradelist", "wishlist"})
+        self.assertEqual(set(self.trade_index.get_indexed_at("Carol")), {"tradelist"})
+        self.assertEqual(self.trade_index.get_indexed_at("Dave"), {})
+
+    def test_unknown_user(self):
+        self.assertEqual(self.trade_index.get_matches("Dave"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
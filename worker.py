@@ -0,0 +1,113 @@
+"""
+Background worker refreshing the Deckbox pages of watched users and of the most
+requested users and sets before they expire from the page cache, so that web
+dynos mostly serve warm pages. Runs as its own process (see Procfile):
+
+    $ python worker.py
+"""
+import os, time, random
+import redis
+import http_client
+from deckbox_crawler import DeckboxCrawler
+from page_cache import PageCache
+from set_list_cache import SetListCache
+from metrics import metrics
+from refresh_queue import DemandTracker, RefreshQueue, RateBudget, parse_job
+
+# Pages are refreshed once this ratio of their cache TTL elapsed
+REFRESH_AHEAD_RATIO = float(os.environ.get("REFRESH_AHEAD_RATIO", 0.8))
+REFRESH_JITTER = float(os.environ.get("REFRESH_JITTER", 0.2))
+REFRESH_SCHEDULE_INTERVAL = int(os.environ.get("REFRESH_SCHEDULE_INTERVAL", 60))
+REFRESH_MAX_SET_PAGES = int(os.environ.get("REFRESH_MAX_SET_PAGES", 10))
+REFRESH_RETRY_DELAY = int(os.environ.get("REFRESH_RETRY_DELAY", 300))
+
+
+def log(message):
+    print("LOG - " + message)
+
+
+class RefreshWorker:
+
+    def __init__(self, redis_client):
+        self.page_cache = PageCache(redis_client)
+        self.demand = DemandTracker(redis_client)
+        self.queue = RefreshQueue(redis_client)
+        self.budget = RateBudget(redis_client)
+        self._scheduled_at = 0
+
+    def download(self, url, headers=None):
+        self.budget.acquire()
+
+        return http_client.fetch(url, headers=headers)
+
+    def schedule(self):
+        """
+        Keep the schedule in line with the watched users and the current demand
+        """
+        jobs = self.queue.get_watched() + self.demand.get_hot()
+        added, removed = self.queue.sync(jobs, REFRESH_SCHEDULE_INTERVAL)
+        if added or removed:
+            log("refresh schedule: {} jobs added, {} removed".format(added, removed))
+
+    def run(self):
+        while True:
+            try:
+                if time.time() - self._scheduled_at >= REFRESH_SCHEDULE_INTERVAL:
+                    self.schedule()
+                    self._scheduled_at = time.time()
+
+                self.queue.enqueue_due()
+                job = self.queue.pop()
+            except redis.RedisError as e:
+                log("refresh queue unavailable: {!r}".format(e))
+                time.sleep(REFRESH_RETRY_DELAY / 10)
+                continue
+
+            if job:
+                self.run_job(job)
+            metrics.flush_if_due()
+
+    def run_job(self, job):
+        try:
+            delay = self.refresh(*parse_job(job))
+        except Exception as e:
+            log("refresh failed for {}: {!r}".format(job, e))
+            delay = REFRESH_RETRY_DELAY
+
+        try:
+            # Jittered so that jobs scheduled together drift apart
+            self.queue.reschedule(job, delay * random.uniform(1 - REFRESH_JITTER, 1 + REFRESH_JITTER))
+        except redis.RedisError:
+            pass
+
+    def refresh(self, username, set_id=None):
+        """
+        Download the user profile page, or the pages of one of the user sets, into the page cache
+        :return: seconds until the pages should be refreshed again
+        """
+        user_url = DeckboxCrawler.getUserUrl(username)
+        if set_id is None:
+            self.page_cache.refresh(user_url, self.download)
+            return self.page_cache.get_ttl(user_url) * REFRESH_AHEAD_RATIO
+
+        user_page = self.page_cache.get(user_url, self.download)
+        set_object = DeckboxCrawler.fromPage(username, user_url, user_page).getUserSets(set_id)
+        if set_object is None:
+            return REFRESH_RETRY_DELAY
+
+        # Default ordering, as requested by the inventory, tradelist, wishlist and page=all endpoints
+        first_url = DeckboxCrawler.getSetUrl(set_object["id"])
+        first_page = self.page_cache.refresh(first_url, self.download)
+        total_pages = DeckboxCrawler.fromPage(username, first_url, first_page).getCardsFromPage().get("total_pages", 1)
+        for page in range(2, min(total_pages, REFRESH_MAX_SET_PAGES) + 1):
+            self.page_cache.refresh(DeckboxCrawler.getSetUrl(set_object["id"], page), self.download)
+
+        return self.page_cache.get_ttl(first_url) * REFRESH_AHEAD_RATIO
+
+
+if __name__ == '__main__':
+    r = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    metrics.redis_client = r
+    DeckboxCrawler.set_list_cache = SetListCache(r)
+    log("refresh worker started")
+    RefreshWorker(r).run()